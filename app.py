@@ -3,15 +3,22 @@
 print("--- DÉMARRAGE DE L'APPLICATION V4 ---")
 
 import streamlit as st
-import random
-import time
+import os
+import threading
 from config import get_model
+import tracing
 
 # --- Imports depuis les autres fichiers ---
-from gemini_logic import call_gemini_with_tools, get_champion_data, generate_ultimate_bravery_challenge, get_draft_suggestion
-from lol_api import get_all_champions_list
-from rag_handler import create_vector_store, query_rag_system
-from pdf_generator import generate_pdf_from_content
+from gemini_logic import call_gemini_with_tools, get_champion_data, generate_ultimate_bravery_challenge, get_draft_suggestion, StreamedAnswer, dispatch_tool
+from intent_router import route_question, get_router_stats
+from history_manager import HistoryManager, message_to_text
+from lol_api import get_all_champions_list, get_latest_version, prefetch_all_champions
+from name_index import get_champion_index
+from tool_cache import get_tool_cache
+from single_flight import coalescing_stats
+from rag_handler import create_vector_store, index_needs_rebuild, query_rag_system
+from artifact_store import get_artifact_store
+from smite_game import SMITE_DAMAGE, new_game as new_smite_game, smite_component, verdict as smite_verdict
 
 # --- Fonction pour charger notre CSS personnalisé ---
 def local_css(file_name):
@@ -23,29 +30,68 @@ def local_css(file_name):
 
 # --- CONSTANTES ET CONFIGURATION ---
 ASSISTANT_MODES = ["Général", "Lore", "Stratégie", "Création RP"]
+STREAM_RESPONSES = os.getenv("STREAM_RESPONSES", "1") == "1"
 RAG_KEYWORDS = ["patch", "changement", "stratégie", "guide", "équilibrage", "dernier", "lore", "histoire", "relation"]
+# Historique : seuls les derniers messages sont affichés (page par page), et seuls les plus récents en version complète.
+HISTORY_PAGE_SIZE = int(os.getenv("HISTORY_PAGE_SIZE", "20"))
+FULL_RENDER_LAST = int(os.getenv("FULL_RENDER_LAST", "4"))
+SKINS_PER_PAGE = 8
+DDRAGON_IMG_URL = "https://ddragon.leagueoflegends.com/cdn/img/champion"
 st.set_page_config(page_title="Heimerdinger Assistant", page_icon="🧠", layout="wide")
 local_css("style.css")
 
 # --- Initialisation du modèle ---
 model = get_model()
 
+# --- Préchargement optionnel de toutes les fiches de champions (une fois par processus et par version) ---
+@st.cache_resource
+def start_champion_prefetch(version):
+    thread = threading.Thread(target=prefetch_all_champions, args=(version,), daemon=True)
+    thread.start()
+    return thread
+
+if os.getenv("PREFETCH_CHAMPIONS", "0") == "1":
+    start_champion_prefetch(get_latest_version())
+
+# --- Endpoint Prometheus optionnel (une fois par processus) ---
+@st.cache_resource
+def start_metrics_server(port):
+    return tracing.start_metrics_server(port)
+
+if tracing.METRICS_PORT:
+    start_metrics_server(tracing.METRICS_PORT)
+
 # --- Le Mini-Jeu d'Entraînement au Smite ---
+def _start_smite_game():
+    st.session_state.game_state = "running"
+    st.session_state.smite_game = new_smite_game()
+    st.session_state.smite_server_runs = 0
+
+
+def _judge_smite():
+    # Callbacks : exécutés avant le rerun du fragment, qui affiche donc directement le nouvel état.
+    game = st.session_state.smite_game
+    event = st.session_state.get(f"smite_{game['game_id']}")
+    if not event or event.get("game_id") != game["game_id"]:
+        return
+    st.session_state.result_message = smite_verdict(game, event)
+    st.session_state.game_state = "finished"
+    print(f"--- [SMITE] Partie jugée après {event.get('elapsed', 0):.1f}s : {st.session_state.smite_server_runs} exécution(s) serveur. ---")
+
+
 def display_smite_minigame():
-    """Affiche et gère la logique du mini-jeu de timing de Smite."""
+    """
+    Affiche le mini-jeu de timing de Smite. L'animation tourne dans le navigateur : le serveur n'est
+    sollicité que pour lancer la partie et pour juger le Châtiment (reruns limités au fragment du message).
+    """
     st.header("Entraînement au Châtiment", anchor=False)
 
-    TOTAL_HEALTH = 5000
-    SMITE_DAMAGE = 900
-
     if 'game_state' not in st.session_state or st.session_state.get('game_type') != 'smite':
         st.session_state.game_state = "stopped"
         st.session_state.game_type = 'smite'
         st.session_state.result_message = ""
-        st.session_state.game_current_health = TOTAL_HEALTH
-        st.session_state.last_frame_time = 0
-        st.session_state.current_dps = 0
-        st.session_state.time_for_next_dps_change = 0
+        st.session_state.smite_game = None
+        st.session_state.smite_server_runs = 0
 
     baron_svg = """
     <svg width="100" height="100" viewBox="0 0 24 24" fill="none" xmlns="http://www.w3.org/2000/svg">
@@ -63,60 +109,18 @@ def display_smite_minigame():
             if st.session_state.game_state == "stopped":
                 st.session_state.result_message = ""
                 st.info(f"Votre Châtiment inflige **{SMITE_DAMAGE}** points de dégâts. Soyez précis !")
-                if st.button("Lancer le défi !"):
-                    st.session_state.game_state = "running"
-                    st.session_state.game_current_health = TOTAL_HEALTH
-                    st.session_state.last_frame_time = time.time()
-                    st.session_state.current_dps = random.randint(350, 550)
-                    st.session_state.time_for_next_dps_change = time.time() + random.uniform(1.5, 3.0)
-                    st.rerun()
+                st.button("Lancer le défi !", on_click=_start_smite_game)
 
             elif st.session_state.game_state == "running":
-                now = time.time()
-                delta_t = now - st.session_state.last_frame_time
-                if now > st.session_state.time_for_next_dps_change:
-                    st.session_state.current_dps = random.randint(200, 750)
-                    st.session_state.time_for_next_dps_change = now + random.uniform(1.0, 2.5)
-                    st.toast(f"💥 Burst de Dégâts ! DPS: {st.session_state.current_dps}")
-
-                damage_dealt = delta_t * st.session_state.current_dps
-                st.session_state.game_current_health -= damage_dealt
-                st.session_state.last_frame_time = now
-                current_health = st.session_state.game_current_health
-                progress = max(0, current_health / TOTAL_HEALTH)
-                st.progress(progress, text=f"{int(current_health)} / {TOTAL_HEALTH} PV")
-                st.metric(label="Dégâts du Châtiment", value=f"{SMITE_DAMAGE} PV")
-                
-                if st.button("⚡ Châtiment !"):
-                    st.session_state.game_state = "finished"
-                    health_when_smited = current_health
-                    if health_when_smited > SMITE_DAMAGE:
-                        st.session_state.result_message = f"🤔 **Trop tôt !** Vous avez châtié à {int(health_when_smited)} PV. Le Châtiment n'aurait pas tué le Baron !"
-                    else:
-                        diff = SMITE_DAMAGE - health_when_smited
-                        PERFECT_MARGIN = 25
-                        SUCCESS_MARGIN = 120
-                        if diff <= PERFECT_MARGIN:
-                            st.session_state.result_message = f"🎉 **Smite PARFAIT !** Vous avez châtié à {int(health_when_smited)} PV (différence: {int(diff)}). Vous êtes le roi de la jungle !"
-                        elif diff <= SUCCESS_MARGIN:
-                            st.session_state.result_message = f"👍 **Excellent Châtiment !** Vous avez châtié à {int(health_when_smited)} PV. L'objectif est sécurisé !"
-                        else:
-                            st.session_state.result_message = f"😭 **Trop tard !** Vous avez châtié à {int(health_when_smited)} PV. L'ennemi a eu le temps de le voler !"
-                    st.rerun()
-                
-                if current_health > 0:
-                    time.sleep(0.05)
-                    st.rerun()
-                else:
-                    st.session_state.game_state = "finished"
-                    st.session_state.result_message = "Le Baron est mort sans votre aide. Dommage !"
-                    st.rerun()
+                # Exécutions serveur pendant la partie (l'ancienne boucle en faisait ~20 par seconde).
+                st.session_state.smite_server_runs += 1
+                game = st.session_state.smite_game
+                smite_component(game, key=f"smite_{game['game_id']}", on_change=_judge_smite)
 
             elif st.session_state.game_state == "finished":
                 st.info(st.session_state.result_message)
-                if st.button("Réessayer"):
-                    st.session_state.game_state = "stopped"
-                    st.rerun()
+                st.caption(f"Exécutions serveur pendant la partie : {st.session_state.smite_server_runs}")
+                st.button("Réessayer", on_click=lambda: st.session_state.update(game_state="stopped"))
 
 # --- FONCTIONS D'AFFICHAGE ---
 def display_spells_info(data):
@@ -138,7 +142,36 @@ def display_spells_info(data):
                 st.markdown(f"**{spell['name']} ({spell['key']})**")
                 st.caption(spell['description'])
 
-def display_character_sheet(data):
+@st.fragment
+def display_skins_gallery(data, key_prefix):
+    """Galerie chargée à la demande, par pages, en vignettes ; ses boutons ne relancent que ce fragment."""
+    state_key = f"skins_shown_{key_prefix}"
+    shown = st.session_state.get(state_key, 0)
+    if not shown:
+        st.button("🎨 Charger la galerie des skins", key=f"{state_key}_load", on_click=lambda: st.session_state.update({state_key: SKINS_PER_PAGE}))
+        return
+    champion_id, skins = data.get('champion_id'), data.get('skins')
+    if skins is None:
+        # Fiche antérieure à l'ajout des skins dans la fiche : on recharge les données du champion.
+        full_champion_data = get_champion_data(data['name'])
+        if not full_champion_data or 'skins' not in full_champion_data:
+            st.caption("Skins indisponibles.")
+            return
+        champion_id, skins = full_champion_data['id'], full_champion_data['skins']
+    st.markdown("### Galerie des Skins")
+    cols = st.columns(4)
+    for col_index, skin in enumerate(skins[:shown]):
+        with cols[col_index % 4]:
+            with st.container(border=True):
+                skin_name = skin['name'] if skin['name'] != 'default' else 'Classique'
+                # Vignette carrée légère ; le splash en pleine résolution n'est chargé que sur clic.
+                st.image(f"{DDRAGON_IMG_URL}/tiles/{champion_id}_{skin['num']}.jpg")
+                st.markdown(f"[{skin_name}]({DDRAGON_IMG_URL}/splash/{champion_id}_{skin['num']}.jpg)")
+    if shown < len(skins):
+        st.button(f"Afficher plus ({len(skins) - shown} restants)", key=f"{state_key}_more",
+                  on_click=lambda: st.session_state.update({state_key: shown + SKINS_PER_PAGE}))
+
+def display_character_sheet(data, key_prefix=""):
     st.markdown(f"# {data['name']} - *{data['title'].capitalize()}*")
     st.caption(f"ℹ️ Source : {data['source']}")
     st.image(data['splash_url'], use_container_width=True) # <-- CORRIGÉ
@@ -164,22 +197,11 @@ def display_character_sheet(data):
                     preview_text = (description[:150] + '...') if len(description) > 150 else description
                     st.caption(preview_text)
                 st.divider()
-        if st.button(f"⚙️ Afficher les détails des compétences de {data['name']}", key=f"details_{data['name']}"):
+        if st.button(f"⚙️ Afficher les détails des compétences de {data['name']}", key=f"details_{key_prefix}_{data['name']}"):
             st.session_state.messages.append({"role": "user", "content": f"Quelles sont les compétences de {data['name']} ?"})
-            st.rerun()
+            st.rerun(scope="app")
     with tab_skins:
-        full_champion_data = get_champion_data(data['name'])
-        if full_champion_data and 'skins' in full_champion_data:
-            st.markdown("### Galerie des Skins")
-            cols = st.columns(4)
-            col_index = 0
-            for skin in full_champion_data['skins']:
-                skin_url = f"https://ddragon.leagueoflegends.com/cdn/img/champion/splash/{full_champion_data['id']}_{skin['num']}.jpg"
-                with cols[col_index]:
-                    with st.container(border=True):
-                        skin_name = skin['name'] if skin['name'] != 'default' else 'Classique'
-                        st.image(skin_url, caption=skin_name)
-                col_index = (col_index + 1) % 4
+        display_skins_gallery(data, key_prefix)
 
 def display_item_info(data):
     st.subheader(data['name'])
@@ -219,37 +241,116 @@ def display_ultimate_bravery(data):
             with s_col2:
                 st.image(data['summoner_spells'][1]['icon_url'], width=48)
                 st.caption(data['summoner_spells'][1]['name'])
+            if data.get('starting_item'):
+                st.markdown(f"**Objet de départ :** {data['starting_item']['name']}")
             st.markdown("**Build Final :**")
             i_cols = st.columns(6)
             for i, item in enumerate(data['final_build']):
                 with i_cols[i]:
                     st.image(item['icon_url'])
                     st.caption(item['name'])
+            if data.get('seed') is not None:
+                st.caption(f"Graine : {data['seed']} (version {data.get('version', '?')}) — redemandez ce défi avec cette graine pour le rejouer.")
 
 def display_draft_suggestion(data):
     st.header("Analyse de Draft par Homo Draftus", anchor=False)
     with st.container(border=True):
         st.markdown(data['analysis'])
 
+def display_multi_tool(data, key_prefix):
+    for i, result in enumerate(data['results']):
+        status_icon = {"ok": "🔧", "timeout": "⏱️", "error": "⚠️"}.get(result['status'], "🔧")
+        st.caption(f"{status_icon} {result['tool']} — {result['seconds']:.1f}s")
+        display_content(result['content'], f"{key_prefix}_{i}")
+        if i < len(data['results']) - 1:
+            st.divider()
+
+def display_pdf_artifact(data, key_prefix):
+    """Bouton de téléchargement d'un export : le PDF n'est construit (ou relu sur disque) qu'au clic."""
+    store = get_artifact_store()
+    if not store.exists(data['handle']):
+        st.caption(f"📄 L'export « {data.get('file_name')} » a expiré : redemandez-le pour le régénérer.")
+        return
+    def read_pdf():
+        pdf_bytes = store.get_bytes(data['handle'])
+        if pdf_bytes is None:
+            raise FileNotFoundError(f"Export expiré : {data.get('file_name')}")
+        return pdf_bytes
+    st.download_button(label=data.get("label", "Télécharger"), data=read_pdf, file_name=data.get("file_name", "export.pdf"), mime="application/pdf", on_click="ignore", key=f"pdf_{key_prefix}")
+
+def display_content(content, key_prefix):
+    if isinstance(content, dict):
+        type_de_contenu = content.get("type")
+        if type_de_contenu == "smite_game": display_smite_minigame()
+        elif type_de_contenu == "file_download":
+            st.download_button(label=content.get("label", "Télécharger"), data=bytes(content.get("data")), file_name=content.get("file_name", "export.pdf"), mime="application/pdf", key=f"pdf_{key_prefix}")
+        elif type_de_contenu == "pdf_artifact": display_pdf_artifact(content, key_prefix)
+        elif type_de_contenu == "character_sheet": display_character_sheet(content, key_prefix)
+        elif type_de_contenu == "spells_info": display_spells_info(content)
+        elif type_de_contenu == "item_info": display_item_info(content)
+        elif type_de_contenu == "comparison": display_comparison(content)
+        elif type_de_contenu == "ultimate_bravery": display_ultimate_bravery(content)
+        elif type_de_contenu == "draft_suggestion": display_draft_suggestion(content)
+        elif type_de_contenu == "multi_tool": display_multi_tool(content, key_prefix)
+        elif "source" in content:
+            st.caption(f"ℹ️ Source : {content['source']}")
+            st.markdown(content['content'])
+    else:
+        st.markdown(str(content))
+
 def display_message(message, message_index):
     with st.chat_message(message["role"]):
-        content = message["content"]
-        if isinstance(content, dict):
-            type_de_contenu = content.get("type")
-            if type_de_contenu == "smite_game": display_smite_minigame()
-            elif type_de_contenu == "file_download":
-                st.download_button(label=content.get("label", "Télécharger"), data=bytes(content.get("data")), file_name=content.get("file_name", "export.pdf"), mime="application/pdf", key=f"pdf_{message_index}")
-            elif type_de_contenu == "character_sheet": display_character_sheet(content)
-            elif type_de_contenu == "spells_info": display_spells_info(content)
-            elif type_de_contenu == "item_info": display_item_info(content)
-            elif type_de_contenu == "comparison": display_comparison(content)
-            elif type_de_contenu == "ultimate_bravery": display_ultimate_bravery(content)
-            elif type_de_contenu == "draft_suggestion": display_draft_suggestion(content)
-            elif "source" in content:
-                st.caption(f"ℹ️ Source : {content['source']}")
-                st.markdown(content['content'])
+        display_content(message["content"], message_index)
+
+@st.fragment
+def display_history_message(message, message_index, compact):
+    """
+    Message de l'historique dans un fragment : ses propres boutons (Afficher, galerie) ne relancent que lui.
+    Un rerun complet (chaque tour de chat) exécute quand même tous les fragments visibles : c'est la pagination
+    (HISTORY_PAGE_SIZE) et le mode compact (au-delà des FULL_RENDER_LAST derniers messages) qui bornent ce coût.
+    En mode compact, seul un résumé calculé une fois et gardé dans le message est affiché : ni images ni onglets
+    ne sont envoyés au navigateur tant que l'utilisateur ne le déplie pas.
+    """
+    expanded_key = f"expanded_{message_index}"
+    if compact and isinstance(message["content"], dict) and not st.session_state.get(expanded_key):
+        if "compact_text" not in message:
+            message["compact_text"] = message_to_text(message["content"])[:300]
+        with st.chat_message(message["role"]):
+            st.caption(message["compact_text"])
+            st.button("Afficher", key=f"{expanded_key}_button", on_click=lambda: st.session_state.update({expanded_key: True}))
+        return
+    display_message(message, message_index)
+
+def display_history(messages, first_visible, pending_trace):
+    """Affiche les messages visibles ; un tour qui vient de se terminer voit son rendu ajouté à sa trace."""
+    for i, msg in enumerate(messages[first_visible:], start=first_visible):
+        if pending_trace is not None and i == len(messages) - 1:
+            try:
+                with tracing.activate(pending_trace), tracing.span("render", type=msg["content"].get("type") if isinstance(msg["content"], dict) else "text"):
+                    display_history_message(msg, i, compact=False)
+            finally:
+                # Même si le rendu relance le script (mini-jeu), le tour est clôturé et exporté.
+                tracing.finish_trace(pending_trace)
+                st.session_state.last_trace = {"duration_ms": pending_trace.duration * 1000, "spans": pending_trace.breakdown()}
         else:
-            st.markdown(str(content))
+            display_history_message(msg, i, compact=i < len(messages) - FULL_RENDER_LAST)
+
+def display_trace_panel(last_trace):
+    """Détail du dernier tour (spans imbriqués) et percentiles par étape depuis le démarrage du processus."""
+    if not last_trace:
+        st.caption("Aucun tour tracé pour l'instant.")
+        return
+    st.caption(f"Dernier tour : {last_trace['duration_ms']:.0f} ms")
+    st.dataframe([{
+        "étape": "· " * row["depth"] + row["name"],
+        "début (ms)": round(row["start_ms"]),
+        "durée (ms)": round(row["duration_ms"], 1),
+        "étiquettes": ", ".join(f"{key}={value}" for key, value in row["tags"].items()),
+    } for row in last_trace["spans"]], hide_index=True, use_container_width=True)
+    st.caption("Percentiles par étape (processus)")
+    st.dataframe([{
+        "étape": name, "n": stats["count"], "p50 (ms)": round(stats["p50"] * 1000, 1), "p95 (ms)": round(stats["p95"] * 1000, 1),
+    } for name, stats in sorted(tracing.metrics.percentiles().items())], hide_index=True, use_container_width=True)
 
 # --- TITRE (LOGO) ---
 col1, col2, col3 = st.columns([2, 3, 2])
@@ -265,13 +366,14 @@ with st.sidebar:
     st.header("Contrôles")
     if st.button("🔄 Réinitialiser la conversation"):
         st.session_state.messages = []
+        st.session_state.history_visible = HISTORY_PAGE_SIZE
         st.rerun()
     st.divider()
 
     st.header("🧠 Homo Draftus - Aide à la Draft")
-    all_champions = get_all_champions_list()
-    if all_champions:
-        champion_names = sorted([data['name'] for id, data in all_champions.items()])
+    champion_index = get_champion_index()
+    if champion_index:
+        champion_names = champion_index.display_names
         enemy_picks = st.multiselect("Champions ennemis :", options=champion_names, max_selections=5)
         my_role = st.selectbox("Votre rôle :", options=["Top", "Jungle", "Mid", "ADC", "Support"])
         if st.button("Analyser la draft"):
@@ -292,7 +394,7 @@ with st.sidebar:
     st.divider()
 
     st.header("🔎 Explorateur de Champions")
-    if all_champions:
+    if champion_index:
         selected_champion = st.selectbox("Choisir un champion :", options=champion_names, index=None, placeholder="Sélectionnez...")
         if selected_champion and st.button(f"Afficher la fiche de {selected_champion}"):
             st.session_state.messages.append({"role": "user", "content": f"Qui est {selected_champion} ?"})
@@ -300,21 +402,47 @@ with st.sidebar:
     st.divider()
 
     st.header("Base de connaissances (RAG)")
+    if index_needs_rebuild():
+        st.warning("L'index de la base de connaissances est dans un ancien format qui ne peut plus être lu : reconstruisez-le.")
+    full_rebuild = st.checkbox("Reconstruction complète", help="Ignore le manifeste et ré-embedde tous les documents.")
     if st.button("Construire / Mettre à jour"):
-        with st.spinner("Construction de l'index vectoriel en cours..."):
-            create_vector_store()
+        create_vector_store(incremental=not full_rebuild)
     st.caption("Cliquez ici pour indexer les fichiers du dossier 'knowledge_base'.")
     st.divider()
 
     st.header("Mode de l'Assistant")
     st.session_state.mode = st.radio("...", ASSISTANT_MODES, horizontal=True, label_visibility="collapsed")
+    st.session_state.bypass_tool_cache = st.toggle("Ignorer le cache des réponses", help="Force un nouvel appel à Gemini pour les comparaisons, drafts et relations.")
+    tool_cache_stats = get_tool_cache().stats
+    st.caption(f"Cache des réponses : {tool_cache_stats['hits']} hit(s) / {tool_cache_stats['misses']} miss(es)")
+    coalesced = coalescing_stats()
+    if coalesced:
+        st.caption("Requêtes regroupées : " + " · ".join(f"{name} {stats['coalesced']}/{stats['calls']}" for name, stats in sorted(coalesced.items())))
+    history_stats = st.session_state.history_manager.last_stats if "history_manager" in st.session_state else {}
+    if history_stats:
+        st.caption(f"Dernier prompt : {history_stats['prompt_tokens']} tokens (historique complet : {history_stats['unmanaged_tokens']})")
+    router_stats = get_router_stats()
+    st.caption(f"Routeur local : {router_stats.get('routed', 0)}/{router_stats.get('questions', 0)} question(s) sans appel au modèle ({router_stats['hit_rate']:.0%})")
+    # Rempli en fin de script, une fois le rendu du dernier tour mesuré.
+    trace_panel = st.expander("🩺 Débogage : dernier tour")
 
 # --- LOGIQUE PRINCIPALE DU CHAT ---
 if "messages" not in st.session_state:
     st.session_state.messages = []
+if "history_manager" not in st.session_state:
+    st.session_state.history_manager = HistoryManager()
 
-for i, msg in enumerate(st.session_state.messages):
-    display_message(msg, i)
+# Pagination : seuls les derniers messages sont rendus ; les plus anciens restent accessibles à la demande.
+history_visible = st.session_state.setdefault("history_visible", HISTORY_PAGE_SIZE)
+first_visible = max(0, len(st.session_state.messages) - history_visible)
+if first_visible:
+    st.button(f"⬆️ Afficher les messages précédents ({first_visible} masqués)",
+              on_click=lambda: st.session_state.update(history_visible=history_visible + HISTORY_PAGE_SIZE))
+
+# Le temps de rendu de l'historique (par rerun) doit rester stable quand la conversation s'allonge :
+# chaque rerun complet ré-exécute les messages visibles, bornés par la pagination et le mode compact.
+with tracing.span("history_render", messages=len(st.session_state.messages) - first_visible):
+    display_history(st.session_state.messages, first_visible, st.session_state.pop("pending_trace", None))
 
 if question := st.chat_input("Posez votre question sur League of Legends..."):
     st.session_state.messages.append({"role": "user", "content": question})
@@ -323,17 +451,46 @@ if question := st.chat_input("Posez votre question sur League of Legends..."):
     st.rerun()
 
 if st.session_state.messages and st.session_state.messages[-1]["role"] == "user":
-    with st.spinner(f"Heimerdinger ({st.session_state.mode}) réfléchit..."):
-        last_question = st.session_state.messages[-1]["content"]
-        if any(keyword in last_question.lower() for keyword in RAG_KEYWORDS):
-            response_content = {"source": "Base de Connaissances (Fichiers Locaux)", "content": query_rag_system(last_question)}
-        else:
-            history_for_gemini = [(msg["role"], msg["content"]) for msg in st.session_state.messages if isinstance(msg["content"], str)]
-            response_content = call_gemini_with_tools(history_for_gemini, model, mode=st.session_state.mode)
-        
-        if not isinstance(response_content, dict):
-            response_content = {"source": "Connaissances générales de l'IA (Gemini)", "content": response_content}
+    turn_trace = tracing.Trace("chat_turn", mode=st.session_state.mode)
+    with tracing.activate(turn_trace):
+        with st.spinner(f"Heimerdinger ({st.session_state.mode}) réfléchit..."):
+            last_question = st.session_state.messages[-1]["content"]
+            if any(keyword in last_question.lower() for keyword in RAG_KEYWORDS):
+                turn_trace.tags["path"] = "rag"
+                response_content = {"source": "Base de Connaissances (Fichiers Locaux)", "content": query_rag_system(last_question)}
+            elif route := route_question(last_question):
+                # Formulation reconnue localement : l'outil est appelé sans demander au modèle de le choisir.
+                turn_trace.tags["path"] = "router"
+                response_content = dispatch_tool(route.tool, route.args)
+            else:
+                # Tout l'historique (y compris les fiches et analyses) est transmis ; le gestionnaire le borne en tokens.
+                turn_trace.tags["path"] = "model"
+                history_for_gemini = [(msg["role"], msg["content"]) for msg in st.session_state.messages]
+                response_content = call_gemini_with_tools(history_for_gemini, model, mode=st.session_state.mode, stream=STREAM_RESPONSES, history_manager=st.session_state.history_manager)
 
-        assistant_message = {"role": "assistant", "content": response_content}
-        st.session_state.messages.append(assistant_message)
-        st.rerun()
+        # Réponse diffusée : affichée au fil de l'eau, hors du spinner, puis conservée comme du texte.
+        if isinstance(response_content, StreamedAnswer):
+            streamed_answer = response_content
+            with tracing.span("render", type="stream"), st.chat_message("assistant"):
+                st.write_stream(streamed_answer)
+            response_content = streamed_answer.text
+            st.session_state.last_turn_timing = streamed_answer.timing
+            print(f"--- [APP] Premier token : {streamed_answer.timing['time_to_first_token'] or 0:.2f}s | total : {streamed_answer.timing['total']:.2f}s ---")
+            # Outils demandés après le début du texte : le texte est conservé, le résultat des outils le suit.
+            with st.spinner("Heimerdinger consulte ses outils..."):
+                tool_content = streamed_answer.run_function_calls()
+            if tool_content is not None:
+                if response_content.strip():
+                    st.session_state.messages.append({"role": "assistant", "content": {"source": "Connaissances générales de l'IA (Gemini)", "content": response_content}})
+                response_content = tool_content
+
+    if not isinstance(response_content, dict):
+        response_content = {"source": "Connaissances générales de l'IA (Gemini)", "content": response_content}
+
+    assistant_message = {"role": "assistant", "content": response_content}
+    st.session_state.messages.append(assistant_message)
+    st.session_state.pending_trace = turn_trace
+    st.rerun()
+
+with trace_panel:
+    display_trace_panel(st.session_state.get("last_trace"))
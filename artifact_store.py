@@ -0,0 +1,152 @@
+# Fichier : artifact_store.py
+# Description : Stockage côté serveur des PDF générés. Les messages ne gardent qu'un identifiant (l'empreinte
+# du contenu à exporter) ; le PDF est construit à la première demande de téléchargement, puis conservé sur
+# disque, partagé entre sessions (contenus identiques dédupliqués), avec éviction LRU par taille et TTL.
+
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+
+import streamlit as st
+
+from pdf_generator import build_pdf
+from single_flight import get_group
+
+ARTIFACT_STORE_PATH = os.getenv("ARTIFACT_STORE_PATH", os.path.join(".cache", "artifacts"))
+ARTIFACT_STORE_MAX_BYTES = int(os.getenv("ARTIFACT_STORE_MAX_BYTES", str(100 * 1024 * 1024)))
+ARTIFACT_TTL_SECONDS = int(os.getenv("ARTIFACT_TTL_SECONDS", str(24 * 3600)))
+
+
+def content_hash(content):
+    """Empreinte stable d'un contenu exportable (dict, liste ou texte)."""
+    canonical = json.dumps(content, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+class ArtifactStore:
+    def __init__(self, root=ARTIFACT_STORE_PATH, max_bytes=ARTIFACT_STORE_MAX_BYTES, ttl=ARTIFACT_TTL_SECONDS, builder=build_pdf):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.builder = builder
+        os.makedirs(root, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(os.path.join(root, "index.sqlite"), check_same_thread=False, timeout=10)
+        # `spec` : le contenu à exporter (JSON) ; `file` : le PDF, renseigné seulement une fois construit.
+        self._conn.executescript(
+            "CREATE TABLE IF NOT EXISTS artifacts (handle TEXT PRIMARY KEY, spec TEXT NOT NULL, file TEXT, "
+            "size INTEGER NOT NULL, created REAL NOT NULL, last_access REAL NOT NULL);"
+        )
+        self._conn.commit()
+        self.stats = {"registered": 0, "deduplicated": 0, "builds": 0, "hits": 0, "evictions": 0, "expired": 0}
+
+    def put(self, content):
+        """Enregistre un contenu à exporter (sans construire le PDF) ; retourne son identifiant."""
+        handle = content_hash(content)
+        spec = json.dumps(content, ensure_ascii=False, default=str)
+        now = time.time()
+        with self._lock:
+            cursor = self._conn.execute(
+                "INSERT OR IGNORE INTO artifacts (handle, spec, file, size, created, last_access) VALUES (?, ?, NULL, ?, ?, ?)",
+                (handle, spec, len(spec.encode("utf-8")), now, now),
+            )
+            if cursor.rowcount:
+                self.stats["registered"] += 1
+            else:
+                self.stats["deduplicated"] += 1
+                self._conn.execute("UPDATE artifacts SET last_access = ? WHERE handle = ?", (now, handle))
+            self._evict(keep=handle)
+            self._conn.commit()
+        return handle
+
+    def exists(self, handle):
+        with self._lock:
+            row = self._conn.execute("SELECT last_access FROM artifacts WHERE handle = ?", (handle,)).fetchone()
+        return row is not None and time.time() - row[0] <= self.ttl
+
+    def get_bytes(self, handle):
+        """Octets du PDF, construit à la première demande ; None si l'export a expiré ou a été évincé."""
+        # Les téléchargements simultanés d'un export pas encore construit attendent une seule construction.
+        return get_group("artifact").do((self.root, handle), lambda: self._get_bytes(handle))
+
+    def _get_bytes(self, handle):
+        with self._lock:
+            row = self._conn.execute("SELECT spec, file, last_access FROM artifacts WHERE handle = ?", (handle,)).fetchone()
+        if row is None or time.time() - row[2] > self.ttl:
+            return None
+        spec, file_name, _ = row
+        if file_name is not None:
+            try:
+                with open(os.path.join(self.root, file_name), "rb") as f:
+                    data = f.read()
+                self._touch(handle)
+                return data
+            except FileNotFoundError:
+                pass
+        data = bytes(self.builder(json.loads(spec)))
+        self._store(handle, spec, data)
+        return data
+
+    def _touch(self, handle):
+        with self._lock:
+            self.stats["hits"] += 1
+            self._conn.execute("UPDATE artifacts SET last_access = ? WHERE handle = ?", (time.time(), handle))
+            self._conn.commit()
+
+    def _store(self, handle, spec, data):
+        file_name = os.path.join(handle[:2], f"{handle}.pdf")
+        path = os.path.join(self.root, file_name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.tmp.{os.getpid()}.{threading.get_ident()}"
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+        with self._lock:
+            self.stats["builds"] += 1
+            self._conn.execute(
+                "UPDATE artifacts SET file = ?, size = ?, last_access = ? WHERE handle = ?",
+                (file_name, len(spec.encode("utf-8")) + len(data), time.time(), handle),
+            )
+            # Dans le même verrou, et sans l'export qu'on vient d'écrire : l'identifiant retourné reste valide.
+            self._evict(keep=handle)
+            self._conn.commit()
+
+    def _remove(self, handle, file_name):
+        if file_name is not None:
+            try:
+                os.remove(os.path.join(self.root, file_name))
+            except FileNotFoundError:
+                pass
+        self._conn.execute("DELETE FROM artifacts WHERE handle = ?", (handle,))
+
+    def _evict(self, keep):
+        """Supprime les exports expirés puis les moins récemment utilisés (hors `keep`) au-delà de la taille maximale. Appelé sous verrou."""
+        for handle, file_name in self._conn.execute(
+            "SELECT handle, file FROM artifacts WHERE last_access < ? AND handle != ?", (time.time() - self.ttl, keep)
+        ).fetchall():
+            self._remove(handle, file_name)
+            self.stats["expired"] += 1
+        total = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM artifacts").fetchone()[0]
+        if total > self.max_bytes:
+            for handle, file_name, size in self._conn.execute(
+                "SELECT handle, file, size FROM artifacts WHERE handle != ? ORDER BY last_access", (keep,)
+            ).fetchall():
+                if total <= self.max_bytes:
+                    break
+                self._remove(handle, file_name)
+                total -= size
+                self.stats["evictions"] += 1
+
+
+@st.cache_resource
+def get_artifact_store():
+    """Stockage des exports partagé par tout le processus (et, via le disque, entre les processus)."""
+    return ArtifactStore()
+
+
+def make_pdf_artifact(content, file_name, label):
+    """Contenu de message "pdf_artifact" : seulement l'identifiant de l'export, jamais les octets du PDF."""
+    return {"type": "pdf_artifact", "handle": get_artifact_store().put(content), "file_name": file_name, "label": label}
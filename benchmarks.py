@@ -0,0 +1,321 @@
+# Fichier : benchmarks.py
+# Description : Micro-benchmarks hors-ligne des chemins critiques (résolution des noms, données des champions,
+# RAG, génération PDF, Ultimate Bravery, appel Gemini). Data Dragon est servi depuis des fixtures enregistrées,
+# Gemini, les embeddings et le CDN d'images sont remplacés par les doublures déterministes de fakes.py.
+# Mesure la latence et les allocations de chaque fonction, écrit les résultats en JSON et échoue si un
+# résultat régresse au-delà d'un seuil par rapport à une référence enregistrée.
+#
+#   python benchmarks.py run [--out resultats.json] [--baseline bench_fixtures/baseline.json] [--save-baseline]
+#
+# La référence bench_fixtures/baseline.json est versionnée et comparée par défaut. Les temps dépendent de la
+# machine : après un changement de machine (ou une optimisation voulue), la ré-enregistrer avec --save-baseline.
+#   python benchmarks.py record [--version 14.12.1]   (ré-enregistre les fixtures Data Dragon, réseau requis)
+
+import argparse
+import gc
+import json
+import os
+import platform
+import random
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+
+FIXTURES_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "bench_fixtures")
+DDRAGON_FIXTURES_PATH = os.path.join(FIXTURES_PATH, "ddragon")
+CORPUS_FIXTURES_PATH = os.path.join(FIXTURES_PATH, "corpus")
+DEFAULT_BASELINE_PATH = os.path.join(FIXTURES_PATH, "baseline.json")
+FIXTURE_CHAMPIONS = ["Garen", "Darius", "Ahri", "Jinx", "Kaisa", "Heimerdinger"]
+
+DEFAULT_ITERATIONS = 30
+ALLOCATION_ITERATIONS = 5
+# Régression : plus de 25 % au-dessus de la référence (médiane du temps, pic d'allocation)...
+TIME_THRESHOLD = 0.25
+ALLOCATION_THRESHOLD = 0.25
+# ... et au-delà du bruit de mesure des fonctions très rapides.
+MIN_TIME_DELTA_MS = 0.05
+# Une régression de temps n'est retenue que si elle persiste après autant de nouvelles mesures (bruit de la machine).
+CONFIRM_RUNS = 3
+MIN_ALLOCATION_DELTA_KIB = 16
+
+RAG_QUESTION = "Quelles sont les relations de Garen ?"
+FAKE_RAG_ANSWER = "Garen est le frère de Lux et le rival de Darius."
+
+
+def prepare_environment(workdir):
+    """
+    Configure l'application pour un fonctionnement entièrement local, avant tout import de ses modules :
+    miroir Data Dragon en lecture seule sur les fixtures, caches dans un dossier temporaire, clé factice.
+    """
+    os.environ["DDRAGON_MIRROR_PATH"] = DDRAGON_FIXTURES_PATH
+    os.environ["DDRAGON_OFFLINE"] = "1"
+    os.environ["TOOL_CACHE_PATH"] = os.path.join(workdir, "tool_results.sqlite")
+    os.environ["IMAGE_CACHE_PATH"] = os.path.join(workdir, "images")
+    os.environ["ARTIFACT_STORE_PATH"] = os.path.join(workdir, "artifacts")
+    os.environ.setdefault("GEMINI_API_KEY", "benchmark")
+    os.environ.setdefault("RAG_RETRIEVAL_STRATEGY", "multi_query")
+    # Streamlit lit ses secrets dans ./.streamlit : le benchmark s'exécute depuis le dossier temporaire.
+    os.makedirs(os.path.join(workdir, ".streamlit"), exist_ok=True)
+    with open(os.path.join(workdir, ".streamlit", "secrets.toml"), "w", encoding="utf-8") as f:
+        f.write('GEMINI_API_KEY = "benchmark"\n')
+    os.chdir(workdir)
+
+
+def build_fixture_index(embeddings):
+    """Index FAISS (dans ./faiss_index) du petit corpus de fixtures, découpé comme la vraie base."""
+    from langchain.text_splitter import RecursiveCharacterTextSplitter
+    from langchain_community.vectorstores import FAISS
+    from rag_handler import CHUNK_OVERLAP, CHUNK_SIZE, save_index
+
+    splitter = RecursiveCharacterTextSplitter(chunk_size=CHUNK_SIZE, chunk_overlap=CHUNK_OVERLAP)
+    documents = []
+    for file_name in sorted(os.listdir(CORPUS_FIXTURES_PATH)):
+        path = os.path.join(CORPUS_FIXTURES_PATH, file_name)
+        with open(path, encoding="utf-8") as f:
+            documents.extend(splitter.create_documents([f.read()], metadatas=[{"source": path}]))
+    save_index(FAISS.from_documents(documents, embeddings))
+
+
+def make_benchmarks():
+    """Liste de (nom, fonction mesurée, préparation non mesurée exécutée avant chaque itération ou None)."""
+    from langchain_core.language_models import FakeListLLM
+
+    import gemini_logic
+    import lol_api
+    import rag_handler
+    from champion_relations import get_relations_table, precompute_relations
+    from fakes import FakeGenerativeModel, FakeImageSession, HashingEmbeddings
+    from image_cache import get_image_cache
+    from pdf_generator import build_pdf, generate_pdf_from_content
+    from retrieval import STRATEGIES
+    from ultimate_bravery import generate_many, get_pools
+
+    gemini_logic.model = FakeGenerativeModel(reply="Analyse simulée : les deux champions ont des forces complémentaires.")
+    get_image_cache().session = FakeImageSession()
+    embeddings = HashingEmbeddings()
+    build_fixture_index(embeddings)
+    engine = rag_handler.RAGEngine(api_key="", embeddings=embeddings, llm=FakeListLLM(responses=[FAKE_RAG_ANSWER]))
+    rag_handler.get_rag_engine = lambda: engine
+
+    def clear_champion_caches():
+        gemini_logic.get_champion_data.clear()
+        lol_api._champion_details_cache.clear()
+
+    # Relations de la fixture pré-calculées pour l'index du benchmark, comme après une indexation.
+    precompute_relations(engine, {"Garen": "Garen"}, rag_handler.get_index_generation(), get_relations_table(rag_handler.FAISS_INDEX_PATH))
+
+    names = ["Garen", "kaisa", "Heimer", "Jnx", "la main de noxus", "Ahri"]
+    sheet = fixture_character_sheet(gemini_logic)
+    history = [("user", "Bonjour, que peux-tu faire ?")]
+
+    benchmarks = [
+        ("find_champion_id_by_name", lambda: [gemini_logic.find_champion_id_by_name(name) for name in names], None),
+        ("get_champion_data[froid]", lambda: gemini_logic.get_champion_data("Garen"), clear_champion_caches),
+        ("get_champion_data[chaud]", lambda: gemini_logic.get_champion_data("Garen"), None),
+        ("query_rag_system", lambda: rag_handler.query_rag_system(RAG_QUESTION), None),
+        ("get_character_sheet[relations pré-calculées]", lambda: gemini_logic.get_character_sheet("Garen"), None),
+    ]
+    for strategy in STRATEGIES:
+        benchmarks.append((f"RAGEngine.query[{strategy}]", lambda strategy=strategy: engine.query(RAG_QUESTION, strategy=strategy), None))
+    benchmarks += [
+        ("build_pdf[character_sheet]", lambda: build_pdf(sheet), None),
+        ("generate_pdf_from_content[chaud]", lambda: generate_pdf_from_content(sheet), None),
+        ("generate_ultimate_bravery_challenge", gemini_logic.generate_ultimate_bravery_challenge, lambda: random.seed(0)),
+        ("ultimate_bravery.generate_many[1000]", lambda: sum(1 for _ in generate_many(get_pools(), 1000)), None),
+        ("call_gemini_with_tools[texte]", lambda: gemini_logic.call_gemini_with_tools(history, gemini_logic.model, "Général"), None),
+    ]
+    return benchmarks
+
+
+def fixture_character_sheet(gemini_logic):
+    """Fiche personnage des fixtures, sans passer par le RAG (le PDF est mesuré seul)."""
+    from champion_sheets import build_character_sheet
+    version = gemini_logic.get_latest_version()
+    return build_character_sheet(gemini_logic.get_champion_data("Garen"), version, FAKE_RAG_ANSWER)
+
+
+def measure(func, setup=None, iterations=DEFAULT_ITERATIONS, allocation_iterations=ALLOCATION_ITERATIONS):
+    """Latences (ms) sur `iterations` appels, puis pic et solde d'allocations (Kio) mesurés à part avec tracemalloc."""
+    if setup: setup()
+    func()  # Échauffement (imports paresseux, caches de premier niveau)
+    durations = []
+    gc_was_enabled = gc.isenabled()
+    gc.disable()
+    try:
+        for _ in range(iterations):
+            if setup: setup()
+            started = time.perf_counter()
+            func()
+            durations.append((time.perf_counter() - started) * 1000)
+    finally:
+        if gc_was_enabled: gc.enable()
+
+    peaks, nets = [], []
+    tracemalloc.start()
+    try:
+        for _ in range(allocation_iterations):
+            if setup: setup()
+            before, _ = tracemalloc.get_traced_memory()
+            tracemalloc.reset_peak()
+            func()
+            after, peak = tracemalloc.get_traced_memory()
+            peaks.append((peak - before) / 1024)
+            nets.append((after - before) / 1024)
+    finally:
+        tracemalloc.stop()
+
+    durations.sort()
+    return {
+        "iterations": iterations,
+        "median_ms": statistics.median(durations),
+        "mean_ms": statistics.fmean(durations),
+        "min_ms": durations[0],
+        "p95_ms": durations[min(len(durations) - 1, int(round(0.95 * (len(durations) - 1))))],
+        "peak_alloc_kib": statistics.median(peaks),
+        "net_alloc_kib": statistics.median(nets),
+    }
+
+
+def run_benchmarks(iterations=DEFAULT_ITERATIONS, only=None, log=print, suspects=None, keep="best"):
+    """
+    Mesure les benchmarks dans un environnement local temporaire. `suspects(results)` désigne les benchmarks
+    à re-mesurer (jusqu'à CONFIRM_RUNS fois, dans le même environnement) ; leur médiane devient la meilleure
+    des mesures (keep="best", pour confirmer une régression) ou la médiane des mesures (keep="typical", pour une référence).
+    """
+    workdir = tempfile.mkdtemp(prefix="heimer_bench_")
+    cwd = os.getcwd()
+    try:
+        prepare_environment(workdir)
+        results = {}
+        benchmarks = [(name, func, setup) for name, func, setup in make_benchmarks()
+                      if not only or any(pattern in name for pattern in only)]
+        for name, func, setup in benchmarks:
+            results[name] = measure(func, setup, iterations=iterations)
+            row = results[name]
+            log(f"  {name:<40} médiane {row['median_ms']:>9.3f} ms | p95 {row['p95_ms']:>9.3f} ms | pic {row['peak_alloc_kib']:>9.1f} Kio")
+        samples = {name: [row["median_ms"]] for name, row in results.items()}
+        for _ in range(CONFIRM_RUNS if suspects else 0):
+            names = suspects(results)
+            if not names:
+                break
+            log(f"Nouvelle mesure de {len(names)} benchmark(s)...")
+            for name, func, setup in benchmarks:
+                if name in names:
+                    samples[name].append(measure(func, setup, iterations=iterations)["median_ms"])
+                    # Seul un ralentissement qui se reproduit est une régression : la meilleure médiane est comparée.
+                    results[name]["median_ms"] = min(samples[name]) if keep == "best" else statistics.median(samples[name])
+    finally:
+        os.chdir(cwd)
+        shutil.rmtree(workdir, ignore_errors=True)
+    return {
+        "meta": {
+            "created_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "iterations": iterations,
+        },
+        "results": results,
+    }
+
+
+def compare(results, baseline, time_threshold=TIME_THRESHOLD, allocation_threshold=ALLOCATION_THRESHOLD):
+    """Liste des régressions (nom, métrique, référence, valeur) par rapport à la référence."""
+    regressions = []
+    for name, row in results["results"].items():
+        reference = baseline["results"].get(name)
+        if reference is None:
+            continue
+        if (row["median_ms"] > reference["median_ms"] * (1 + time_threshold)
+                and row["median_ms"] - reference["median_ms"] > MIN_TIME_DELTA_MS):
+            regressions.append((name, "median_ms", reference["median_ms"], row["median_ms"]))
+        if (row["peak_alloc_kib"] > reference["peak_alloc_kib"] * (1 + allocation_threshold)
+                and row["peak_alloc_kib"] - reference["peak_alloc_kib"] > MIN_ALLOCATION_DELTA_KIB):
+            regressions.append((name, "peak_alloc_kib", reference["peak_alloc_kib"], row["peak_alloc_kib"]))
+    return regressions
+
+
+def write_json(data, path):
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False, indent=2)
+    os.replace(tmp_path, path)
+
+
+def record_fixtures(version=None, champions=FIXTURE_CHAMPIONS, language="fr_FR"):
+    """Ré-enregistre les fixtures Data Dragon depuis le CDN (listes réduites aux champions des fixtures)."""
+    from ddragon_mirror import DDragonMirror
+    with tempfile.TemporaryDirectory() as mirror_root:
+        mirror = DDragonMirror(root=mirror_root, offline=False)
+        version = version or mirror.latest_version()
+        files = {"api/versions.json": mirror.fetch_json("api/versions.json")[:3]}
+        champion_list = mirror.fetch_json(mirror.data_path(version, "champion.json", language))
+        champion_list["data"] = {cid: data for cid, data in champion_list["data"].items() if cid in champions}
+        files[mirror.data_path(version, "champion.json", language)] = champion_list
+        for file_name in ["item.json", "summoner.json"] + [f"champion/{cid}.json" for cid in champions]:
+            files[mirror.data_path(version, file_name, language)] = mirror.fetch_json(mirror.data_path(version, file_name, language))
+    shutil.rmtree(DDRAGON_FIXTURES_PATH, ignore_errors=True)
+    for relative_path, data in files.items():
+        path = os.path.join(DDRAGON_FIXTURES_PATH, *relative_path.split("/"))
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        write_json(data, path)
+    print(f"Fixtures Data Dragon {version} enregistrées ({len(files)} fichiers) dans {DDRAGON_FIXTURES_PATH}.")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Micro-benchmarks hors-ligne de l'assistant.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    run_parser = subparsers.add_parser("run", help="Exécute les benchmarks.")
+    run_parser.add_argument("--out", help="Fichier JSON des résultats.")
+    run_parser.add_argument("--baseline", default=DEFAULT_BASELINE_PATH, help="Référence à comparer (ignorée si absente).")
+    run_parser.add_argument("--save-baseline", action="store_true", help="Enregistre les résultats comme nouvelle référence.")
+    run_parser.add_argument("--threshold", type=float, default=TIME_THRESHOLD, help="Régression de temps tolérée (0.25 = +25 %%).")
+    run_parser.add_argument("--alloc-threshold", type=float, default=ALLOCATION_THRESHOLD, help="Régression d'allocation tolérée.")
+    run_parser.add_argument("--iterations", type=int, default=DEFAULT_ITERATIONS)
+    run_parser.add_argument("--only", nargs="*", help="Ne lance que les benchmarks dont le nom contient l'un de ces motifs.")
+    record_parser = subparsers.add_parser("record", help="Ré-enregistre les fixtures Data Dragon (réseau requis).")
+    record_parser.add_argument("--version", help="Version de Data Dragon (par défaut : la plus récente).")
+    args = parser.parse_args(argv)
+
+    if args.command == "record":
+        record_fixtures(version=args.version)
+        return 0
+
+    baseline_path = os.path.abspath(args.baseline)
+    out_path = os.path.abspath(args.out) if args.out else None
+    baseline = None
+    if not args.save_baseline and os.path.exists(baseline_path):
+        with open(baseline_path, encoding="utf-8") as f:
+            baseline = json.load(f)
+
+    def slower_than_baseline(current):
+        regressions = compare({"results": current}, baseline, time_threshold=args.threshold, allocation_threshold=args.alloc_threshold)
+        return {name for name, metric, _, _ in regressions if metric == "median_ms"}
+
+    print(f"Benchmarks ({args.iterations} itérations) :")
+    if args.save_baseline:
+        # Référence : médiane de plusieurs mesures de chaque benchmark, pas un passage isolé.
+        results = run_benchmarks(iterations=args.iterations, only=args.only, suspects=lambda current: set(current), keep="typical")
+    else:
+        results = run_benchmarks(iterations=args.iterations, only=args.only, suspects=slower_than_baseline if baseline else None)
+    if out_path:
+        write_json(results, out_path)
+        print(f"Résultats : {out_path}")
+    if args.save_baseline:
+        write_json(results, baseline_path)
+        print(f"Référence enregistrée : {baseline_path}")
+        return 0
+    if baseline is None:
+        print("Aucune référence : comparaison ignorée (utilisez --save-baseline pour en créer une).")
+        return 0
+    regressions = compare(results, baseline, time_threshold=args.threshold, allocation_threshold=args.alloc_threshold)
+    for name, metric, reference, value in regressions:
+        print(f"  ✗ {name} : {metric} {reference:.3f} -> {value:.3f} (+{(value / reference - 1) if reference else float('inf'):.0%})")
+    print(f"{len(regressions)} régression(s) par rapport à {baseline_path}.")
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,154 @@
+# Fichier : champion_relations.py
+# Description : Table des relations des champions, pré-calculée après l'indexation de la base de connaissances.
+# Les résumés (une question RAG par champion, en parallèle) sont stockés à côté de l'index, par identifiant de
+# champion et génération de l'index : une fiche les lit en une requête, et ils deviennent caducs dès que
+# l'index est reconstruit.
+#
+#   python champion_relations.py build [--champions Garen Ahri] [--workers 8]
+#   python champion_relations.py stats
+
+import argparse
+import os
+import sqlite3
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import streamlit as st
+
+RELATIONS_FILE = "relations.sqlite"
+RELATIONS_QUESTION_TEMPLATE = "Fais un résumé des relations de {name}."
+RELATIONS_WORKERS = int(os.getenv("RELATIONS_WORKERS", "8"))
+# Pré-calcul lancé à la fin de chaque construction de l'index depuis l'application.
+RELATIONS_PRECOMPUTE = os.getenv("RELATIONS_PRECOMPUTE", "1") == "1"
+
+
+class RelationsTable:
+    """Résumés des relations par champion, valables pour une génération donnée de l'index."""
+
+    def __init__(self, index_path):
+        self.path = os.path.join(index_path, RELATIONS_FILE)
+        os.makedirs(index_path, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.path, check_same_thread=False, timeout=10)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS relations (champion_id TEXT PRIMARY KEY, generation INTEGER NOT NULL, "
+            "summary TEXT NOT NULL, created_at REAL NOT NULL)"
+        )
+        self._conn.commit()
+        self.stats = {"hits": 0, "misses": 0, "stale": 0}
+
+    def get(self, champion_id, generation):
+        """Résumé du champion pour cette génération de l'index, ou None (absent ou calculé sur un autre index)."""
+        with self._lock:
+            row = self._conn.execute("SELECT summary, generation FROM relations WHERE champion_id = ?", (champion_id,)).fetchone()
+            if row is None or generation is None:
+                self.stats["misses"] += 1
+                return None
+            if row[1] != generation:
+                self.stats["stale"] += 1
+                return None
+            self.stats["hits"] += 1
+            return row[0]
+
+    def put(self, champion_id, generation, summary):
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO relations (champion_id, generation, summary, created_at) VALUES (?, ?, ?, ?)",
+                (champion_id, generation, summary, time.time()),
+            )
+            self._conn.commit()
+
+    def computed(self, generation):
+        """Champions déjà résumés pour cette génération (le pré-calcul reprend là où il s'était arrêté)."""
+        with self._lock:
+            return {row[0] for row in self._conn.execute("SELECT champion_id FROM relations WHERE generation = ?", (generation,))}
+
+    def prune(self, generation):
+        """Supprime les résumés des générations précédentes ; retourne leur nombre."""
+        with self._lock:
+            deleted = self._conn.execute("DELETE FROM relations WHERE generation != ?", (generation,)).rowcount
+            self._conn.commit()
+            return deleted
+
+    def count(self, generation=None):
+        with self._lock:
+            if generation is None:
+                return self._conn.execute("SELECT COUNT(*) FROM relations").fetchone()[0]
+            return self._conn.execute("SELECT COUNT(*) FROM relations WHERE generation = ?", (generation,)).fetchone()[0]
+
+
+@st.cache_resource
+def get_relations_table(index_path):
+    """Table des relations de l'index, partagée par tout le processus."""
+    return RelationsTable(index_path)
+
+
+def precompute_relations(engine, champions, generation, table, workers=RELATIONS_WORKERS, progress=None, log=print):
+    """
+    Résume les relations de chaque champion ({identifiant: nom}) avec le moteur RAG, en parallèle (les appels
+    au LLM dominent). Les champions déjà résumés pour cette génération sont ignorés, les échecs sont comptés
+    et retentés au prochain passage. `progress(fait, total)` suit l'avancement.
+    """
+    report = {"champions": len(champions), "computed": 0, "skipped": 0, "failed": 0, "pruned": table.prune(generation)}
+    done_ids = table.computed(generation)
+    todo = {champion_id: name for champion_id, name in champions.items() if champion_id not in done_ids}
+    report["skipped"] = len(champions) - len(todo)
+    started = time.perf_counter()
+
+    def summarize(name):
+        return engine.query(RELATIONS_QUESTION_TEMPLATE.format(name=name))["result"]
+
+    if todo:
+        with ThreadPoolExecutor(max_workers=max(1, min(workers, len(todo)))) as pool:
+            futures = {pool.submit(summarize, name): champion_id for champion_id, name in todo.items()}
+            for done, future in enumerate(as_completed(futures), start=1):
+                champion_id = futures[future]
+                try:
+                    table.put(champion_id, generation, future.result())
+                    report["computed"] += 1
+                except Exception as e:
+                    report["failed"] += 1
+                    log(f"  ! Relations de {champion_id} non calculées : {e}")
+                if progress is not None:
+                    progress(done, len(todo))
+    report["seconds"] = time.perf_counter() - started
+    log(f"Relations : {report['computed']} calculée(s), {report['skipped']} déjà à jour, {report['failed']} échec(s) "
+        f"en {report['seconds']:.1f}s ({report['pruned']} résumé(s) d'un ancien index supprimé(s)).")
+    return report
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Pré-calcul des relations des champions pour l'index RAG actuel.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    build = subparsers.add_parser("build")
+    build.add_argument("--champions", nargs="*", help="Identifiants des champions (par défaut : tout le roster).")
+    build.add_argument("--workers", type=int, default=RELATIONS_WORKERS)
+    subparsers.add_parser("stats")
+    args = parser.parse_args(argv)
+
+    from ddragon_mirror import get_mirror
+    from rag_handler import FAISS_INDEX_PATH, RAGEngine, get_index_generation
+
+    generation = get_index_generation(FAISS_INDEX_PATH)
+    if generation is None:
+        print(f"Aucun index dans {FAISS_INDEX_PATH} : construisez d'abord la base de connaissances.", file=sys.stderr)
+        return 1
+    table = RelationsTable(FAISS_INDEX_PATH)
+    if args.command == "stats":
+        print(f"Génération {generation} : {table.count(generation)} résumé(s) à jour sur {table.count()}.")
+        return 0
+
+    mirror = get_mirror()
+    all_champions = mirror.get_data(mirror.latest_version(), "champion.json")
+    selected = args.champions or sorted(all_champions)
+    champions = {champion_id: all_champions[champion_id]["name"] for champion_id in selected if champion_id in all_champions}
+    engine = RAGEngine(api_key=os.environ["GEMINI_API_KEY"])
+    report = precompute_relations(engine, champions, generation, table, workers=args.workers,
+                                  progress=lambda done, total: print(f"  [{done}/{total}]", end="\r"))
+    return 1 if report["failed"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,20 @@
+# Fichier : champion_sheets.py
+# Description : Construction du contenu d'une fiche personnage à partir des données Data Dragon,
+# sans dépendance à Streamlit ni à Gemini (réutilisée par l'assistant et par l'export en lot).
+
+import re
+
+def clean_html(raw_html):
+    cleanr = re.compile('<.*?>')
+    return re.sub(cleanr, '', raw_html).replace('&nbsp;', ' ')
+
+def build_character_sheet(api_data, version, relations_info, source="API & RAG"):
+    """Fiche 'character_sheet' (affichage et PDF) d'un champion."""
+    base_img_url = f"https://ddragon.leagueoflegends.com/cdn/{version}/img"
+    character_sheet = { "type": "character_sheet", "source": source, "champion_id": api_data['id'], "name": api_data['name'], "title": api_data['title'], "splash_url": f"https://ddragon.leagueoflegends.com/cdn/img/champion/splash/{api_data['id']}_0.jpg", "lore": api_data['lore'], "relations": relations_info, "spells": [] }
+    # Liste des skins embarquée dans la fiche : la galerie n'a pas besoin de recharger les données du champion.
+    character_sheet['skins'] = [{"num": skin['num'], "name": skin['name']} for skin in api_data.get('skins', [])]
+    character_sheet['spells'].append({ "name": f"Passif - {api_data['passive']['name']}", "icon_url": f"{base_img_url}/passive/{api_data['passive']['image']['full']}", "description": clean_html(api_data['passive']['description']) })
+    for spell in api_data['spells']:
+        character_sheet['spells'].append({ "name": spell['name'], "icon_url": f"{base_img_url}/spell/{spell['image']['full']}", "description": clean_html(spell['description']) })
+    return character_sheet
@@ -0,0 +1,352 @@
+# Fichier : ddragon_mirror.py
+# Description : Miroir local et versionné de Data Dragon. Les fichiers sont servis depuis le disque,
+# rafraîchis par requêtes conditionnelles (ETag / If-Modified-Since) via une session HTTP mutualisée
+# avec timeouts, et la dernière copie valide est servie quand le réseau est lent ou indisponible.
+#
+# Pré-remplissage (démarrage à froid sans aucun appel HTTP) :
+#   python ddragon_mirror.py seed [--version 14.12.1] [--lang fr_FR] [--no-champions]
+#   python ddragon_mirror.py status
+#   python ddragon_mirror.py check   (rafraîchissement conditionnel vérifié contre un serveur HTTP local)
+
+import argparse
+import json
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+import tracing
+from single_flight import get_group
+
+DDRAGON_BASE_URL = os.getenv("DDRAGON_BASE_URL", "https://ddragon.leagueoflegends.com")
+MIRROR_PATH = os.getenv("DDRAGON_MIRROR_PATH", "ddragon_mirror")
+# Mode hors-ligne strict : aucun appel réseau, uniquement le miroir.
+OFFLINE = os.getenv("DDRAGON_OFFLINE", "0") == "1"
+HTTP_TIMEOUT = (3.05, 10)
+# Revalidation d'un fichier déjà en miroir : au-delà, la copie locale est servie (et rafraîchie en arrière-plan).
+STALE_TIMEOUT = (1, 2)
+VERSIONS_MAX_AGE = 6 * 3600
+DEFAULT_LANGUAGE = "fr_FR"
+FALLBACK_VERSION = "14.12.1"
+
+
+def make_session(pool_size=16, retries=2):
+    """Session requests mutualisée (keep-alive) avec quelques reprises sur les erreurs transitoires."""
+    session = requests.Session()
+    retry = Retry(total=retries, backoff_factor=0.3, status_forcelist=(500, 502, 503, 504), allowed_methods=("GET",))
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retry)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+
+class DDragonMirror:
+    """Copie disque de Data Dragon, organisée comme le CDN (api/versions.json, cdn/<version>/data/<langue>/...)."""
+
+    def __init__(self, root=MIRROR_PATH, base_url=DDRAGON_BASE_URL, offline=OFFLINE, session=None, timeout=HTTP_TIMEOUT,
+                 stale_timeout=STALE_TIMEOUT):
+        self.root = root
+        self.base_url = base_url.rstrip("/")
+        self.offline = offline
+        self.session = session or make_session()
+        # Sans reprise : une copie locale disponible n'attend pas plusieurs essais contre un CDN lent.
+        self.quick_session = session or make_session(retries=0)
+        self.timeout = timeout
+        self.stale_timeout = stale_timeout
+        self.stats = {"local": 0, "downloaded": 0, "not_modified": 0, "stale_fallback": 0, "background_refreshes": 0, "http_calls": 0}
+        # Compteurs et rafraîchissements en cours, partagés par les sessions et les threads de pré-chargement.
+        self._stats_lock = threading.Lock()
+        self._refreshing = set()
+
+    def _paths(self, relative_path):
+        local_path = os.path.join(self.root, *relative_path.split("/"))
+        return local_path, f"{local_path}.meta.json"
+
+    def _read(self, relative_path):
+        local_path, meta_path = self._paths(relative_path)
+        try:
+            with open(local_path, encoding="utf-8") as f:
+                data = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return None, {}
+        try:
+            with open(meta_path, encoding="utf-8") as f:
+                meta = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            meta = {}
+        return data, meta
+
+    def _write(self, relative_path, body, meta):
+        local_path, meta_path = self._paths(relative_path)
+        os.makedirs(os.path.dirname(local_path), exist_ok=True)
+        files = [(meta_path, json.dumps(meta).encode("utf-8"))]
+        if body is not None:
+            files.insert(0, (local_path, body))
+        for path, content in files:
+            tmp_path = f"{path}.tmp.{os.getpid()}.{threading.get_ident()}"
+            with open(tmp_path, "wb") as f:
+                f.write(content)
+            os.replace(tmp_path, path)
+
+    def fetch_json(self, relative_path, max_age=None):
+        """
+        Retourne le JSON demandé. `max_age=None` : le fichier est immuable (données d'une version donnée),
+        la copie locale suffit dès qu'elle existe. Sinon, au-delà de `max_age` secondes on revalide
+        auprès du CDN par requête conditionnelle. En cas d'échec réseau ou de CDN lent, la dernière copie valide est servie.
+        """
+        with tracing.span("ddragon", path=relative_path):
+            # Les sessions qui demandent le même fichier en même temps attendent le premier téléchargement.
+            return get_group("ddragon").do((self.root, relative_path, max_age), lambda: self._fetch_json(relative_path, max_age))
+
+    def _fetch_json(self, relative_path, max_age):
+        data, meta = self._read(relative_path)
+        if data is not None:
+            age = time.time() - meta.get("fetched_at", 0)
+            if self.offline or max_age is None or age < max_age:
+                self._count("local")
+                tracing.tag(cache="hit")
+                return data
+        elif self.offline:
+            raise FileNotFoundError(f"'{relative_path}' absent du miroir Data Dragon (mode hors-ligne).")
+
+        if data is None:
+            return self._download(relative_path, None, meta, self.session, self.timeout)
+        # Une copie locale existe : revalidation courte et sans reprise. Si le CDN est lent ou injoignable, la copie
+        # est servie tout de suite et le rafraîchissement continue en arrière-plan avec le délai normal.
+        try:
+            return self._download(relative_path, data, meta, self.quick_session, self.stale_timeout)
+        except (requests.RequestException, ValueError):
+            self._count("stale_fallback")
+            tracing.tag(cache="stale")
+            self._refresh_in_background(relative_path)
+            return data
+
+    def _download(self, relative_path, data, meta, session, timeout):
+        """Requête (conditionnelle si une copie `data` existe) ; écrit et retourne la nouvelle copie, ou `data` sur un 304."""
+        headers = {}
+        if data is not None:
+            if meta.get("etag"): headers["If-None-Match"] = meta["etag"]
+            if meta.get("last_modified"): headers["If-Modified-Since"] = meta["last_modified"]
+        self._count("http_calls")
+        response = session.get(f"{self.base_url}/{relative_path}", headers=headers, timeout=timeout)
+        if response.status_code == 304 and data is not None:
+            meta["fetched_at"] = time.time()
+            self._write(relative_path, None, meta)
+            self._count("not_modified")
+            tracing.tag(cache="revalidated")
+            return data
+        response.raise_for_status()
+        fresh = response.json()
+        self._write(relative_path, response.content, {
+            "etag": response.headers.get("ETag"),
+            "last_modified": response.headers.get("Last-Modified"),
+            "fetched_at": time.time(),
+        })
+        self._count("downloaded")
+        tracing.tag(cache="miss")
+        return fresh
+
+    def _refresh_in_background(self, relative_path):
+        """Revalide une copie périmée hors du chemin de la requête (un seul rafraîchissement par fichier à la fois)."""
+        with self._stats_lock:
+            if relative_path in self._refreshing:
+                return
+            self._refreshing.add(relative_path)
+
+        def refresh():
+            try:
+                data, meta = self._read(relative_path)
+                self._download(relative_path, data, meta, self.session, self.timeout)
+                self._count("background_refreshes")
+            except (requests.RequestException, ValueError) as e:
+                print(f"--- [DDRAGON] Rafraîchissement en arrière-plan de '{relative_path}' en échec : {e} ---")
+            finally:
+                with self._stats_lock:
+                    self._refreshing.discard(relative_path)
+
+        threading.Thread(target=refresh, daemon=True).start()
+
+    def _count(self, name):
+        with self._stats_lock:
+            self.stats[name] += 1
+
+    def local_versions(self):
+        """Versions présentes dans le miroir, de la plus récente à la plus ancienne."""
+        cdn_path = os.path.join(self.root, "cdn")
+        if not os.path.isdir(cdn_path):
+            return []
+        def version_key(version):
+            return [int(part) if part.isdigit() else 0 for part in version.split(".")]
+        return sorted(os.listdir(cdn_path), key=version_key, reverse=True)
+
+    def latest_version(self):
+        try:
+            return self.fetch_json("api/versions.json", max_age=VERSIONS_MAX_AGE)[0]
+        except (requests.RequestException, ValueError, FileNotFoundError, IndexError):
+            local = self.local_versions()
+            return local[0] if local else FALLBACK_VERSION
+
+    def data_path(self, version, file_name, language=DEFAULT_LANGUAGE):
+        return f"cdn/{version}/data/{language}/{file_name}"
+
+    def get_data(self, version, file_name, language=DEFAULT_LANGUAGE):
+        """Bloc 'data' d'un fichier de données versionné (champion.json, item.json, champion/Garen.json...)."""
+        return self.fetch_json(self.data_path(version, file_name, language))["data"]
+
+    def seed(self, version=None, language=DEFAULT_LANGUAGE, include_champions=True, max_workers=8, log=print):
+        """Télécharge tout ce dont l'application a besoin au démarrage pour une version."""
+        version = version or self.latest_version()
+        started = time.perf_counter()
+        champions = self.get_data(version, "champion.json", language)
+        self.get_data(version, "item.json", language)
+        self.get_data(version, "summoner.json", language)
+        log(f"Version {version} : listes des champions, objets et sorts d'invocateur en miroir.")
+        if include_champions:
+            with ThreadPoolExecutor(max_workers=max_workers) as pool:
+                list(pool.map(lambda champion_id: self.get_data(version, f"champion/{champion_id}.json", language), champions))
+            log(f"{len(champions)} fiches de champions en miroir.")
+        log(f"Terminé en {time.perf_counter() - started:.1f}s ({self.stats['http_calls']} appel(s) HTTP).")
+        return version
+
+
+_mirror = None
+_mirror_lock = threading.Lock()
+
+
+def get_mirror():
+    """Miroir partagé par tout le processus."""
+    global _mirror
+    if _mirror is None:
+        with _mirror_lock:
+            if _mirror is None:
+                _mirror = DDragonMirror()
+    return _mirror
+
+
+# ───── VÉRIFICATION ─────
+def check():
+    """
+    Vérifie le rafraîchissement conditionnel contre un serveur HTTP local qui imite le CDN (ETag, Last-Modified,
+    304) : revalidation sans retéléchargement, fichiers versionnés jamais redemandés, copie périmée servie quand
+    le serveur est lent (puis revalidée en arrière-plan) ou arrêté. Retourne la liste des échecs.
+    """
+    import tempfile
+    from email.utils import formatdate
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    version = "0.0.1"
+    etag = '"versions-1"'
+    last_modified = formatdate(time.time() - 3600, usegmt=True)
+    bodies = {
+        "/api/versions.json": json.dumps([version]).encode("utf-8"),
+        f"/cdn/{version}/data/{DEFAULT_LANGUAGE}/champion.json": json.dumps({"data": {"Garen": {"name": "Garen"}}}).encode("utf-8"),
+    }
+    requests_seen = []
+    # Latence simulée du serveur (CDN lent).
+    slow = {"seconds": 0}
+
+    class CDNHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            time.sleep(slow["seconds"])
+            requests_seen.append((self.path, self.headers.get("If-None-Match"), self.headers.get("If-Modified-Since")))
+            body = bodies.get(self.path)
+            if body is None:
+                self.send_response(404)
+                self.end_headers()
+                return
+            if self.headers.get("If-None-Match") == etag:
+                self.send_response(304)
+                self.end_headers()
+                return
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.send_header("ETag", etag)
+            self.send_header("Last-Modified", last_modified)
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    def count(path):
+        return sum(1 for seen_path, _, _ in requests_seen if seen_path == path)
+
+    failures = []
+
+    def expect(name, ok):
+        print(f"  {'✓' if ok else '✗'} {name}")
+        if not ok:
+            failures.append(name)
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), CDNHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    with tempfile.TemporaryDirectory() as root:
+        mirror = DDragonMirror(root=root, base_url=f"http://127.0.0.1:{server.server_address[1]}", offline=False, timeout=(1, 2),
+                               stale_timeout=(1, 0.3))
+        # max_age=0 : chaque lecture de versions.json revalide auprès du serveur.
+        first = mirror.fetch_json("api/versions.json", max_age=0)
+        second = mirror.fetch_json("api/versions.json", max_age=0)
+        revalidation = requests_seen[-1] if requests_seen else (None, None, None)
+        expect("304 : la copie locale est réutilisée",
+               first == second == [version] and mirror.stats["downloaded"] == 1 and mirror.stats["not_modified"] == 1)
+        expect("revalidation avec If-None-Match et If-Modified-Since", revalidation[1:] == (etag, last_modified))
+
+        for _ in range(3):
+            mirror.get_data(version, "champion.json")
+        expect("fichier versionné téléchargé une seule fois (immuable)", count(f"/cdn/{version}/data/{DEFAULT_LANGUAGE}/champion.json") == 1)
+
+        slow["seconds"] = 1
+        started = time.perf_counter()
+        slow_answer = mirror.fetch_json("api/versions.json", max_age=0)
+        elapsed = time.perf_counter() - started
+        expect(f"serveur lent : la copie locale est servie sans attendre ({elapsed:.2f}s)",
+               slow_answer == [version] and elapsed < 0.9 and mirror.stats["stale_fallback"] == 1)
+        deadline = time.time() + 5
+        while mirror.stats["background_refreshes"] == 0 and time.time() < deadline:
+            time.sleep(0.05)
+        expect("serveur lent : la copie est revalidée en arrière-plan",
+               mirror.stats["background_refreshes"] == 1 and mirror.stats["not_modified"] == 2)
+        slow["seconds"] = 0
+
+        server.shutdown()
+        server.server_close()
+        before = len(requests_seen)
+        stale = mirror.fetch_json("api/versions.json", max_age=0)
+        expect("serveur arrêté : la dernière copie est servie", stale == [version] and mirror.stats["stale_fallback"] == 2)
+        expect("serveur arrêté : les fichiers versionnés restent servis sans appel",
+               mirror.get_data(version, "champion.json") == {"Garen": {"name": "Garen"}} and len(requests_seen) == before)
+    print(f"  requêtes reçues par le serveur : {len(requests_seen)} | statistiques du miroir : {mirror.stats}")
+    return failures
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Miroir local de Data Dragon.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    seed_parser = subparsers.add_parser("seed", help="Pré-remplit le miroir pour une version.")
+    seed_parser.add_argument("--version", help="Version à télécharger (par défaut : la plus récente).")
+    seed_parser.add_argument("--lang", default=DEFAULT_LANGUAGE)
+    seed_parser.add_argument("--no-champions", action="store_true", help="Ne pas télécharger les fiches détaillées des champions.")
+    subparsers.add_parser("status", help="Affiche les versions présentes dans le miroir.")
+    subparsers.add_parser("check", help="Vérifie le rafraîchissement conditionnel contre un serveur HTTP local.")
+    args = parser.parse_args(argv)
+    if args.command == "check":
+        return 1 if check() else 0
+
+    mirror = get_mirror()
+    if args.command == "seed":
+        mirror.seed(version=args.version, language=args.lang, include_champions=not args.no_champions)
+    else:
+        versions = mirror.local_versions()
+        print(f"Miroir : {os.path.abspath(mirror.root)}")
+        print(f"Versions : {', '.join(versions) if versions else 'aucune'}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
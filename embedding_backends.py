@@ -0,0 +1,135 @@
+# Fichier : embedding_backends.py
+# Description : Backends d'embedding interchangeables pour le RAG (Gemini, modèle local sur CPU, hachage
+# déterministe), choisis à la construction de l'index. L'identifiant du backend est enregistré dans le
+# manifeste de l'index : les questions sont toujours embeddées avec le même modèle que les documents.
+# Un cache LRU en mémoire évite de ré-embedder les questions répétées (et les reformulations identiques).
+#
+#   EMBEDDING_BACKEND=gemini|local|hashing  LOCAL_EMBEDDING_MODEL=...  QUERY_EMBEDDING_CACHE_SIZE=1024
+
+import hashlib
+import math
+import os
+import re
+import threading
+from collections import OrderedDict
+
+from langchain_core.embeddings import Embeddings
+
+import tracing
+
+EMBEDDING_BACKENDS = ("gemini", "local", "hashing")
+EMBEDDING_BACKEND = os.getenv("EMBEDDING_BACKEND", "gemini")
+GEMINI_EMBEDDING_MODEL = "models/embedding-001"
+# Petit modèle multilingue (la base de connaissances est en français), ~120 Mo, rapide sur CPU.
+LOCAL_EMBEDDING_MODEL = os.getenv("LOCAL_EMBEDDING_MODEL", "sentence-transformers/paraphrase-multilingual-MiniLM-L12-v2")
+HASHING_DIMENSIONS = 256
+QUERY_EMBEDDING_CACHE_SIZE = int(os.getenv("QUERY_EMBEDDING_CACHE_SIZE", "1024"))
+
+
+class HashingEmbeddings(Embeddings):
+    """
+    Embeddings locaux et déterministes : sac de mots haché dans un vecteur de taille fixe, normalisé.
+    Les textes qui partagent des mots sont proches, ce qui suffit pour évaluer la recherche hors-ligne.
+    """
+
+    def __init__(self, dimensions=HASHING_DIMENSIONS):
+        self.dimensions = dimensions
+        self.calls = {"documents": 0, "queries": 0}
+
+    def _embed(self, text):
+        vector = [0.0] * self.dimensions
+        for token in re.findall(r"\w+", text.lower()):
+            digest = int(hashlib.md5(token.encode("utf-8")).hexdigest(), 16)
+            vector[digest % self.dimensions] += 1.0 if (digest >> 8) & 1 else -1.0
+        norm = math.sqrt(sum(value * value for value in vector)) or 1.0
+        return [value / norm for value in vector]
+
+    def embed_documents(self, texts):
+        self.calls["documents"] += len(texts)
+        return [self._embed(text) for text in texts]
+
+    def embed_query(self, text):
+        self.calls["queries"] += 1
+        return self._embed(text)
+
+
+class LocalEmbeddings(Embeddings):
+    """Modèle sentence-transformers exécuté sur CPU (dépendance optionnelle, chargée au premier usage)."""
+
+    def __init__(self, model_name=LOCAL_EMBEDDING_MODEL):
+        try:
+            from sentence_transformers import SentenceTransformer
+        except ImportError as e:
+            raise ImportError("Le backend d'embedding 'local' nécessite le paquet sentence-transformers (pip install sentence-transformers).") from e
+        self.model_name = model_name
+        self.model = SentenceTransformer(model_name, device="cpu")
+
+    def embed_documents(self, texts):
+        return self.model.encode(list(texts), normalize_embeddings=True, convert_to_numpy=True).tolist()
+
+    def embed_query(self, text):
+        return self.model.encode([text], normalize_embeddings=True, convert_to_numpy=True)[0].tolist()
+
+
+def embedding_model_id(backend=EMBEDDING_BACKEND):
+    """Identifiant enregistré dans le manifeste de l'index (celui de Gemini reste celui des index existants)."""
+    if backend == "gemini":
+        return GEMINI_EMBEDDING_MODEL
+    if backend == "local":
+        return f"local:{LOCAL_EMBEDDING_MODEL}"
+    if backend == "hashing":
+        return f"hashing:{HASHING_DIMENSIONS}"
+    raise ValueError(f"Backend d'embedding inconnu : {backend} (attendu : {', '.join(EMBEDDING_BACKENDS)}).")
+
+
+def make_embeddings(model_id, api_key=None):
+    """Embeddings correspondant à un identifiant de manifeste."""
+    backend, _, parameter = model_id.partition(":")
+    if backend == "local":
+        return LocalEmbeddings(parameter)
+    if backend == "hashing":
+        return HashingEmbeddings(int(parameter or HASHING_DIMENSIONS))
+    from langchain_google_genai import GoogleGenerativeAIEmbeddings
+    return GoogleGenerativeAIEmbeddings(model=model_id, google_api_key=api_key)
+
+
+class CachedQueryEmbeddings(Embeddings):
+    """
+    Enveloppe des embeddings utilisés à la recherche : les vecteurs des questions sont gardés dans un LRU
+    en mémoire (par processus), les documents passent directement au modèle.
+    """
+
+    def __init__(self, embeddings, model_id=None, max_size=QUERY_EMBEDDING_CACHE_SIZE):
+        self.embeddings = embeddings
+        self.model_id = model_id
+        self.max_size = max_size
+        self._vectors = OrderedDict()
+        self._lock = threading.Lock()
+        self.stats = {"hits": 0, "misses": 0}
+
+    def embed_documents(self, texts):
+        return self.embeddings.embed_documents(texts)
+
+    def embed_query(self, text):
+        with tracing.span("query_embedding"):
+            with self._lock:
+                vector = self._vectors.get(text)
+                if vector is not None:
+                    self._vectors.move_to_end(text)
+                    self.stats["hits"] += 1
+            if vector is not None:
+                tracing.tag(cache="hit")
+                return list(vector)
+            tracing.tag(cache="miss")
+            vector = self.embeddings.embed_query(text)
+            with self._lock:
+                self.stats["misses"] += 1
+                self._vectors[text] = tuple(vector)
+                self._vectors.move_to_end(text)
+                while len(self._vectors) > self.max_size:
+                    self._vectors.popitem(last=False)
+            return vector
+
+    def hit_rate(self):
+        total = self.stats["hits"] + self.stats["misses"]
+        return self.stats["hits"] / total if total else 0.0
@@ -0,0 +1,227 @@
+# Fichier : embedding_pipeline.py
+# Description : Étape d'embedding par lots, concurrente, avec reprise sur erreur et cache persistant
+# des vecteurs sur disque (clé : nom du modèle + empreinte du texte).
+#
+#   python embedding_pipeline.py check [-n 250] [--batch-size 32]
+
+import argparse
+import hashlib
+import math
+import os
+import random
+import sqlite3
+import sys
+import threading
+import time
+from array import array
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from langchain_core.embeddings import Embeddings
+
+EMBEDDING_CACHE_PATH = os.getenv("EMBEDDING_CACHE_PATH", os.path.join(".cache", "embeddings.sqlite"))
+DEFAULT_BATCH_SIZE = 100
+DEFAULT_MAX_WORKERS = 4
+DEFAULT_MAX_RETRIES = 5
+DEFAULT_BACKOFF_SECONDS = 1.0
+
+
+def text_hash(text):
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+class EmbeddingCache:
+    """Cache SQLite des vecteurs, partagé entre reconstructions, expériences d'index et fichiers."""
+
+    def __init__(self, path=EMBEDDING_CACHE_PATH):
+        self.path = path
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings (model TEXT NOT NULL, hash TEXT NOT NULL, vector BLOB NOT NULL, "
+            "PRIMARY KEY (model, hash))"
+        )
+        self._conn.commit()
+
+    def get_many(self, model, hashes):
+        """Retourne {hash: vecteur} pour les empreintes déjà en cache."""
+        found = {}
+        unique = list(dict.fromkeys(hashes))
+        with self._lock:
+            # On reste sous la limite de paramètres de SQLite.
+            for start in range(0, len(unique), 500):
+                chunk = unique[start:start + 500]
+                placeholders = ",".join("?" * len(chunk))
+                rows = self._conn.execute(
+                    f"SELECT hash, vector FROM embeddings WHERE model = ? AND hash IN ({placeholders})", [model, *chunk]
+                ).fetchall()
+                for key, blob in rows:
+                    found[key] = array("f", blob).tolist()
+        return found
+
+    def put_many(self, model, items):
+        """Enregistre une liste de (hash, vecteur)."""
+        rows = [(model, key, array("f", vector).tobytes()) for key, vector in items]
+        with self._lock:
+            self._conn.executemany("INSERT OR REPLACE INTO embeddings (model, hash, vector) VALUES (?, ?, ?)", rows)
+            self._conn.commit()
+
+    def __len__(self):
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+
+
+class CachedBatchEmbeddings(Embeddings):
+    """
+    Enveloppe n'importe quel objet d'embeddings (GoogleGenerativeAIEmbeddings, ou un faux local comme
+    langchain_core.embeddings.DeterministicFakeEmbedding pour les tests). Les textes absents du cache
+    sont dédupliqués, découpés en lots et envoyés sur un pool de threads borné ; chaque lot est retenté
+    avec un backoff exponentiel. Les lots réussis sont mis en cache immédiatement, si bien qu'une
+    construction interrompue reprend sans ré-embedder ce qui a déjà été calculé.
+    """
+
+    def __init__(self, embeddings, model_name, cache=None, batch_size=DEFAULT_BATCH_SIZE,
+                 max_workers=DEFAULT_MAX_WORKERS, max_retries=DEFAULT_MAX_RETRIES, backoff_seconds=DEFAULT_BACKOFF_SECONDS):
+        self.embeddings = embeddings
+        self.model_name = model_name
+        self.cache = cache if cache is not None else EmbeddingCache()
+        self.batch_size = batch_size
+        self.max_workers = max_workers
+        self.max_retries = max_retries
+        self.backoff_seconds = backoff_seconds
+        self.stats = {"hits": 0, "misses": 0, "batches": 0, "retries": 0}
+        # Les compteurs sont mis à jour par les threads du pool et par des appels simultanés.
+        self._stats_lock = threading.Lock()
+
+    def _count(self, **increments):
+        with self._stats_lock:
+            for name, value in increments.items():
+                self.stats[name] += value
+
+    def _embed_batch(self, texts):
+        for attempt in range(self.max_retries + 1):
+            try:
+                return self.embeddings.embed_documents(texts)
+            except Exception as e:
+                if attempt == self.max_retries:
+                    raise
+                self._count(retries=1)
+                delay = self.backoff_seconds * (2 ** attempt) * (1 + random.random())
+                print(f"--- [EMBEDDINGS] Lot de {len(texts)} en échec ({e}), nouvel essai dans {delay:.1f}s. ---")
+                time.sleep(delay)
+
+    def embed_documents(self, texts):
+        hashes = [text_hash(text) for text in texts]
+        vectors = self.cache.get_many(self.model_name, hashes)
+        missing = {}
+        for key, text in zip(hashes, texts):
+            if key not in vectors:
+                missing.setdefault(key, text)
+        self._count(hits=sum(1 for key in hashes if key in vectors), misses=len(missing))
+
+        if missing:
+            keys = list(missing)
+            batches = [keys[i:i + self.batch_size] for i in range(0, len(keys), self.batch_size)]
+            first_error = None
+            with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+                futures = {pool.submit(self._embed_batch, [missing[key] for key in batch]): batch for batch in batches}
+                for future in as_completed(futures):
+                    batch = futures[future]
+                    try:
+                        batch_vectors = future.result()
+                    except Exception as e:
+                        first_error = first_error or e
+                        continue
+                    self.cache.put_many(self.model_name, list(zip(batch, batch_vectors)))
+                    vectors.update(zip(batch, batch_vectors))
+                    self._count(batches=1)
+            if first_error is not None:
+                raise first_error
+        return [vectors[key] for key in hashes]
+
+    def embed_query(self, text):
+        return self.embeddings.embed_query(text)
+
+
+# ───── VÉRIFICATION ─────
+def check(count=250, batch_size=32):
+    """
+    Vérifie le pipeline avec des embeddings locaux (fakes.HashingEmbeddings) : découpage en lots, cache
+    à la seconde passe, clé de cache par modèle et reprise après une erreur transitoire. Retourne la liste des échecs.
+    """
+    import tempfile
+
+    from fakes import HashingEmbeddings
+
+    class CountingEmbeddings(HashingEmbeddings):
+        """Compte les appels par lot ; les `failures` premiers appels échouent (erreur transitoire simulée)."""
+
+        def __init__(self, failures=0):
+            super().__init__()
+            self.batch_calls = 0
+            self.failures = failures
+            self._lock = threading.Lock()
+
+        def embed_documents(self, texts):
+            with self._lock:
+                self.batch_calls += 1
+                if self.failures:
+                    self.failures -= 1
+                    raise ConnectionError("erreur transitoire simulée")
+            return super().embed_documents(texts)
+
+    texts = [f"Chunk de test numéro {i} : Garen, Darius et la Demacia." for i in range(count)]
+    expected_batches = math.ceil(count / batch_size)
+    failures = []
+
+    def expect(name, ok, detail):
+        print(f"  {'✓' if ok else '✗'} {name} : {detail}")
+        if not ok:
+            failures.append(name)
+
+    with tempfile.TemporaryDirectory() as workdir:
+        cache = EmbeddingCache(os.path.join(workdir, "embeddings.sqlite"))
+
+        def pipeline(backend, model_name):
+            return CachedBatchEmbeddings(backend, model_name, cache=cache, batch_size=batch_size, max_workers=4, backoff_seconds=0.01)
+
+        backend = CountingEmbeddings()
+        first = pipeline(backend, "hashing-a").embed_documents(texts)
+        expect("lots", backend.batch_calls == expected_batches and len(first) == count,
+               f"{count} texte(s) -> {backend.batch_calls} appel(s) (attendu {expected_batches})")
+
+        backend = CountingEmbeddings()
+        again = pipeline(backend, "hashing-a")
+        second = again.embed_documents(texts)
+        # Le cache stocke des float32 : on compare à la précision près.
+        same = all(math.isclose(x, y, abs_tol=1e-6) for u, v in zip(first, second) for x, y in zip(u, v))
+        expect("cache", backend.batch_calls == 0 and again.stats["hits"] == count and same,
+               f"seconde passe -> {backend.batch_calls} appel(s), {again.stats['hits']} hit(s)")
+
+        backend = CountingEmbeddings()
+        other = pipeline(backend, "hashing-b")
+        other.embed_documents(texts)
+        expect("clé par modèle", backend.batch_calls == expected_batches and other.stats["hits"] == 0,
+               f"autre modèle -> {backend.batch_calls} appel(s), {other.stats['hits']} hit(s)")
+
+        backend = CountingEmbeddings(failures=1)
+        retried = pipeline(backend, "hashing-c")
+        vectors = retried.embed_documents(texts[:batch_size])
+        expect("reprise", retried.stats["retries"] == 1 and len(vectors) == batch_size and backend.batch_calls == 2,
+               f"erreur transitoire -> {retried.stats['retries']} nouvel essai, {backend.batch_calls} appel(s)")
+    return failures
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Vérification du pipeline d'embeddings par lots avec un backend local.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    check_parser = subparsers.add_parser("check")
+    check_parser.add_argument("-n", "--count", type=int, default=250, help="Nombre de textes à embedder.")
+    check_parser.add_argument("--batch-size", type=int, default=32)
+    args = parser.parse_args(argv)
+    return 1 if check(args.count, args.batch_size) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
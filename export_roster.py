@@ -0,0 +1,158 @@
+# Fichier : export_roster.py
+# Description : Export en lot, hors de Streamlit, des fiches personnage en PDF pour tout le roster
+# (ou une sélection), réparti sur les cœurs du processeur. Reprend là où il s'était arrêté.
+#
+#   python export_roster.py --out exports/14.12.1 [--champions Garen Ahri] [--zip] [--relations] [--workers 8]
+#
+# Sans --relations, les données des fiches viennent du miroir Data Dragon (python ddragon_mirror.py seed).
+# Les illustrations n'en font pas partie : elles sont téléchargées une fois puis servies par le cache d'images.
+# Avec DDRAGON_OFFLINE=1, aucun appel réseau n'est fait et les illustrations absentes du cache sont omises.
+
+import argparse
+import os
+import sys
+import time
+import zipfile
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from champion_relations import RELATIONS_QUESTION_TEMPLATE, RelationsTable
+from champion_sheets import build_character_sheet
+from ddragon_mirror import get_mirror
+from lol_api import get_champions_details
+from name_index import NameIndex, CHAMPION_ALIASES
+from pdf_generator import build_pdf
+
+OFFLINE_RELATIONS = "Non disponible (export hors-ligne)."
+
+# État propre à chaque processus de travail.
+_worker = {}
+
+
+def _init_worker(version, with_relations):
+    _worker["version"] = version
+    _worker["rag_engine"] = None
+    if with_relations:
+        from rag_handler import FAISS_INDEX_PATH, RAGEngine, get_index_generation
+        _worker["rag_engine"] = RAGEngine(api_key=os.environ["GEMINI_API_KEY"])
+        # Relations pré-calculées pour l'index actuel (python champion_relations.py build) : pas d'appel au LLM.
+        _worker["relations"] = RelationsTable(FAISS_INDEX_PATH)
+        _worker["generation"] = get_index_generation(FAISS_INDEX_PATH)
+
+
+def sheet_file_name(name):
+    return f"fiche_{name.replace(' ', '_')}.pdf"
+
+
+def export_one(champion_id, out_dir):
+    """Construit et écrit le PDF d'un champion ; retourne (identifiant, chemin, durées par étape)."""
+    version = _worker["version"]
+    timings = {}
+    started = time.perf_counter()
+    api_data = get_champions_details([champion_id], version=version)[champion_id]
+    timings["data"] = time.perf_counter() - started
+    if api_data is None:
+        raise LookupError(f"Données introuvables pour {champion_id} (version {version}).")
+
+    started = time.perf_counter()
+    relations = OFFLINE_RELATIONS
+    if _worker["rag_engine"] is not None:
+        relations = _worker["relations"].get(champion_id, _worker["generation"])
+        if relations is None:
+            relations = _worker["rag_engine"].query(RELATIONS_QUESTION_TEMPLATE.format(name=api_data['name']))["result"]
+    timings["relations"] = time.perf_counter() - started
+
+    started = time.perf_counter()
+    sheet = build_character_sheet(api_data, version, relations)
+    pdf_bytes = bytes(build_pdf(sheet))
+    timings["build"] = time.perf_counter() - started
+
+    started = time.perf_counter()
+    path = os.path.join(out_dir, sheet_file_name(api_data['name']))
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(pdf_bytes)
+    # Écriture atomique : un fichier présent est toujours complet, ce qui rend la reprise sûre.
+    os.replace(tmp_path, path)
+    timings["write"] = time.perf_counter() - started
+    return champion_id, path, timings
+
+
+def select_champions(all_champions, names):
+    if not names:
+        return sorted(all_champions)
+    index = NameIndex(((champion_id, data['name']) for champion_id, data in all_champions.items()), CHAMPION_ALIASES)
+    selected = []
+    for name in names:
+        champion_id = index.resolve(name)
+        if champion_id is None:
+            print(f"  ! Champion inconnu ignoré : {name}")
+        elif champion_id not in selected:
+            selected.append(champion_id)
+    return selected
+
+
+def export_roster(out_dir, names=None, version=None, workers=None, with_relations=False, make_zip=False):
+    mirror = get_mirror()
+    version = version or mirror.latest_version()
+    all_champions = mirror.get_data(version, "champion.json")
+    champion_ids = select_champions(all_champions, names)
+    os.makedirs(out_dir, exist_ok=True)
+
+    todo = [cid for cid in champion_ids if not os.path.exists(os.path.join(out_dir, sheet_file_name(all_champions[cid]['name'])))]
+    print(f"Version {version} : {len(champion_ids)} champion(s), {len(champion_ids) - len(todo)} déjà exporté(s), {len(todo)} à faire.")
+
+    started = time.perf_counter()
+    # Les fiches détaillées sont chargées en parallèle (E/S) dans le miroir partagé avant le travail CPU.
+    get_champions_details(todo, version=version)
+    prefetch_seconds = time.perf_counter() - started
+
+    stage_totals = defaultdict(float)
+    done, failures = 0, []
+    with ProcessPoolExecutor(max_workers=workers or os.cpu_count(), initializer=_init_worker, initargs=(version, with_relations)) as pool:
+        futures = {pool.submit(export_one, cid, out_dir): cid for cid in todo}
+        for future in as_completed(futures):
+            try:
+                _, path, timings = future.result()
+            except Exception as e:
+                failures.append((futures[future], e))
+                print(f"  ✗ {futures[future]} : {e}")
+                continue
+            done += 1
+            for stage, seconds in timings.items():
+                stage_totals[stage] += seconds
+            print(f"  ✓ [{done}/{len(todo)}] {os.path.basename(path)}")
+    elapsed = time.perf_counter() - started
+
+    print(f"{done} fiche(s) en {elapsed:.1f}s : {done / elapsed if elapsed else 0:.2f} fiches/s ({len(failures)} échec(s)).")
+    print(f"  préchargement des données : {prefetch_seconds:.2f}s")
+    for stage, seconds in stage_totals.items():
+        print(f"  {stage} : {seconds / done if done else 0:.3f}s en moyenne par fiche (cumul {seconds:.1f}s)")
+
+    if make_zip:
+        zip_path = f"{out_dir.rstrip(os.sep)}.zip"
+        with zipfile.ZipFile(zip_path, "w", compression=zipfile.ZIP_DEFLATED) as archive:
+            for cid in champion_ids:
+                file_name = sheet_file_name(all_champions[cid]['name'])
+                if os.path.exists(os.path.join(out_dir, file_name)):
+                    archive.write(os.path.join(out_dir, file_name), arcname=file_name)
+        print(f"Archive : {zip_path}")
+    return done, failures
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Export en lot des fiches personnage en PDF.")
+    parser.add_argument("--out", required=True, help="Dossier de sortie (les PDF déjà présents sont conservés).")
+    parser.add_argument("--champions", nargs="*", help="Noms des champions à exporter (par défaut : tous).")
+    parser.add_argument("--version", help="Version de Data Dragon (par défaut : la plus récente).")
+    parser.add_argument("--workers", type=int, help="Nombre de processus (par défaut : nombre de cœurs).")
+    parser.add_argument("--relations", action="store_true", help="Remplit la section Relations via le RAG (nécessite GEMINI_API_KEY).")
+    parser.add_argument("--zip", action="store_true", help="Produit aussi une archive .zip du dossier.")
+    args = parser.parse_args(argv)
+    _, failures = export_roster(args.out, names=args.champions, version=args.version, workers=args.workers,
+                                with_relations=args.relations, make_zip=args.zip)
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,98 @@
+# Fichier : fakes.py
+# Description : Doublures locales et déterministes des services distants (Gemini, embeddings, CDN d'images),
+# pour tester et mesurer la logique de l'assistant hors-ligne.
+
+import hashlib
+import time
+from io import BytesIO
+from types import SimpleNamespace
+
+from PIL import Image
+
+# Les embeddings par hachage sont aussi un vrai backend (EMBEDDING_BACKEND=hashing) : réexportés ici pour les tests.
+from embedding_backends import HashingEmbeddings  # noqa: F401
+
+
+def _response(parts):
+    response = SimpleNamespace(candidates=[SimpleNamespace(content=SimpleNamespace(parts=parts))])
+    response.text = "".join(getattr(part, "text", "") for part in parts)
+    return response
+
+
+def text_part(text):
+    return SimpleNamespace(text=text, function_call=None)
+
+
+def function_call_part(name, args=None):
+    return SimpleNamespace(text="", function_call=SimpleNamespace(name=name, args=dict(args or {})))
+
+
+class FakeGenerativeModel:
+    """
+    Imite google.generativeai.GenerativeModel.generate_content, y compris stream=True.
+    `reply` est un texte fixe ou une fonction (contents) -> texte ; `function_call` (nom, args) simule un choix d'outil.
+    `chunk_words` règle la taille des morceaux diffusés et `delay` la latence par morceau.
+    """
+
+    def __init__(self, reply="Réponse simulée.", function_call=None, chunk_words=3, delay=0.0, model_name="models/fake-gemini"):
+        self.reply = reply
+        self.function_call = function_call
+        self.chunk_words = chunk_words
+        self.delay = delay
+        self.model_name = model_name
+        self.calls = []
+
+    def _reply_text(self, contents):
+        return self.reply(contents) if callable(self.reply) else self.reply
+
+    def _stream(self, parts_list):
+        for parts in parts_list:
+            if self.delay:
+                time.sleep(self.delay)
+            yield _response(parts)
+
+    def generate_content(self, contents, stream=False, **kwargs):
+        self.calls.append({"contents": contents, "stream": stream, **kwargs})
+        if self.function_call and "tools" in kwargs:
+            name, args = self.function_call
+            parts_list = [[function_call_part(name, args)]]
+        else:
+            words = self._reply_text(contents).split(" ")
+            chunks = [" ".join(words[i:i + self.chunk_words]) for i in range(0, len(words), self.chunk_words)]
+            parts_list = [[text_part(chunk if i == 0 else " " + chunk)] for i, chunk in enumerate(chunks)]
+        if stream:
+            return self._stream(parts_list)
+        if self.delay:
+            time.sleep(self.delay * len(parts_list))
+        if self.function_call and "tools" in kwargs:
+            return _response(parts_list[0])
+        return _response([text_part("".join(parts[0].text for parts in parts_list))])
+
+
+class FakeImageSession:
+    """
+    Remplace la session HTTP du cache d'images : chaque URL donne une image générée, toujours la même.
+    Les splash arts ont la taille de ceux du CDN (1215x717, JPEG), les icônes sont de petits PNG.
+    """
+
+    SPLASH_SIZE = (1215, 717)
+    ICON_SIZE = (64, 64)
+
+    def __init__(self):
+        self.calls = []
+
+    def _image(self, url):
+        digest = hashlib.md5(url.encode("utf-8")).digest()
+        out = BytesIO()
+        if "/splash/" in url or "/loading/" in url:
+            image = Image.new("RGB", self.SPLASH_SIZE, tuple(digest[:3]))
+            # Un dégradé, pour que la compression JPEG ait un vrai travail à faire.
+            image.paste(Image.linear_gradient("L").resize(self.SPLASH_SIZE).convert("RGB"), mask=Image.new("L", self.SPLASH_SIZE, 96))
+            image.save(out, format="JPEG", quality=90)
+        else:
+            Image.new("RGBA", self.ICON_SIZE, tuple(digest[:4])).save(out, format="PNG")
+        return out.getvalue()
+
+    def get(self, url, timeout=None, **kwargs):
+        self.calls.append(url)
+        return SimpleNamespace(status_code=200, content=self._image(url), headers={}, raise_for_status=lambda: None)
@@ -2,17 +2,24 @@
 # Description : Version complète incluant tous les outils et logiques de l'assistant.
 
 import streamlit as st
-import requests
-import re
-import unidecode
 import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FuturesTimeoutError
 from google.generativeai import types
+from streamlit.runtime.scriptrunner import add_script_run_ctx, get_script_run_ctx
 
 # --- Imports depuis vos autres fichiers ---
+import tracing
 from config import get_model
-from lol_api import get_latest_version, get_all_champions_list, get_all_items_data, get_all_summoner_spells_data
-from rag_handler import query_rag_system
-from pdf_generator import generate_pdf_from_content
+from lol_api import get_latest_version, get_all_items_data, get_champion_details, get_champions_details
+from rag_handler import query_rag_system, get_index_generation, FAISS_INDEX_PATH, PROMPT_TEMPLATE as RAG_PROMPT_TEMPLATE, RAG_LLM_MODEL
+from champion_relations import RELATIONS_QUESTION_TEMPLATE, get_relations_table
+from artifact_store import make_pdf_artifact
+from name_index import normalize_text, get_champion_index, get_item_index
+from tool_cache import get_tool_cache
+from champion_sheets import clean_html, build_character_sheet
+from ultimate_bravery import generate as generate_bravery, get_pools as get_bravery_pools
 
 # --- On initialise le modèle ---
 model = get_model()
@@ -66,8 +73,14 @@ function_declarations = [
     },
     {
         "name": "generate_ultimate_bravery_challenge",
-        "description": "Génère un défi 'Ultimate Bravery' complètement aléatoire.",
-        "parameters": {"type": "object", "properties": {}},
+        "description": "Génère un défi 'Ultimate Bravery' aléatoire, reproductible à partir de sa graine.",
+        "parameters": {
+            "type": "object", "properties": {
+                "seed": {"type": "integer", "description": "Graine pour rejouer un défi précis (optionnelle)."},
+                "role": {"type": "string", "description": "Rôle imposé : Top, Jungle, Mid, ADC ou Support, ou une forme courante (jungler, bot, supp…) (optionnel)."},
+                "exclude_champions": {"type": "array", "description": "Champions à exclure du tirage.", "items": {"type": "string"}}
+            }
+        },
     },
     {
         "name": "answer_from_knowledge_base",
@@ -76,35 +89,96 @@ function_declarations = [
     }
 ]
 
+# ───── PROMPTS DES OUTILS (leur empreinte fait partie de la clé du cache des résultats) ─────
+COMPARE_PROMPT_TEMPLATE = "Compare brièvement {name1} et {name2} pour un combat. Analyse leurs forces et faiblesses principales en te basant sur ces tags: {name1} ({tags1}) vs {name2} ({tags2})."
+DRAFT_PROMPT_TEMPLATE = "Tu es 'Homo Draftus', un coach stratégique de niveau Challenger pour League of Legends. Analyse la situation suivante :\n- Mon rôle : **{my_role}**\n- Composition ennemie : **{enemy_composition}**\n\n**Instructions :**\n1. **Analyse de la composition ennemie (2-3 lignes) :** Décris leurs forces et faiblesses.\n2. **Recommandations de picks (3 choix) :** Propose trois champions pour le rôle de **{my_role}**. Pour chaque champion, donne un **Nom de Stratégie** et explique en 2-3 lignes *pourquoi* c'est un bon choix contre *cette composition*."
+
 # ─── FONCTIONS UTILITAIRES ───
-def normalize_text(text): return unidecode.unidecode(text).lower().replace("'", "").replace(".", "").replace(" ", "")
+def tool_cache_bypassed():
+    return st.session_state.get("bypass_tool_cache", False)
 
 def find_champion_id_by_name(champion_name):
-    all_champions = get_all_champions_list()
-    if not all_champions: return None
-    normalized_input = normalize_text(champion_name)
-    for champion_id, champion_data in all_champions.items():
-        if normalize_text(champion_data['name']) == normalized_input: return champion_id
-    return None
-
-def clean_html(raw_html):
-    cleanr = re.compile('<.*?>')
-    return re.sub(cleanr, '', raw_html).replace('&nbsp;', ' ')
+    champion_index = get_champion_index()
+    if not champion_index: return None
+    return champion_index.resolve(champion_name)
 
 @st.cache_data
 def get_champion_data(champion_name):
     champion_id = find_champion_id_by_name(champion_name)
     if not champion_id: return None
-    version = get_latest_version()
-    url = f"https://ddragon.leagueoflegends.com/cdn/{version}/data/fr_FR/champion/{champion_id}.json"
-    try:
-        r = requests.get(url)
-        r.raise_for_status()
-        return r.json()["data"][champion_id]
-    except (requests.RequestException, KeyError): return None
+    return get_champion_details(champion_id)
+
+def get_champions_data(champion_names):
+    """Charge plusieurs champions en un seul appel (dédupliqués, téléchargés en parallèle). Retourne {nom: données ou None}."""
+    champion_ids = {name: find_champion_id_by_name(name) for name in champion_names}
+    details = get_champions_details([champion_id for champion_id in champion_ids.values() if champion_id])
+    return {name: details.get(champion_id) if champion_id else None for name, champion_id in champion_ids.items()}
+
+def _function_call_of(part):
+    """Retourne l'appel de fonction porté par une part, ou None (une part protobuf a toujours un champ function_call, parfois vide)."""
+    call = getattr(part, "function_call", None)
+    return call if call is not None and getattr(call, "name", "") else None
 
-def get_generative_response(history, model_instance):
-    response = model_instance.generate_content(history)
+def _parts_of(response):
+    candidates = getattr(response, "candidates", None)
+    return list(candidates[0].content.parts) if candidates else []
+
+def _text_of(parts):
+    return "".join(getattr(part, "text", "") or "" for part in parts if not _function_call_of(part))
+
+class StreamedAnswer:
+    """
+    Réponse de Gemini diffusée morceau par morceau (compatible avec st.write_stream).
+    Mesure le temps jusqu'au premier token et le temps total du tour ; le texte complet est
+    disponible dans `text` une fois l'itération terminée. Les appels de fonction qui arrivent après
+    le début du texte sont collectés dans `function_calls` et exécutés par `run_function_calls()`.
+    """
+    def __init__(self, chunks, started, first_text="", time_to_first_token=None, function_calls=None):
+        self._chunks = chunks
+        self._first_text = first_text
+        self.started = started
+        self.timing = {"time_to_first_token": time_to_first_token, "total": None}
+        self.text = ""
+        self.function_calls = list(function_calls or [])
+
+    def _record(self, text):
+        if self.timing["time_to_first_token"] is None:
+            self.timing["time_to_first_token"] = time.perf_counter() - self.started
+        self.text += text
+        return text
+
+    def __iter__(self):
+        try:
+            if self._first_text:
+                yield self._record(self._first_text)
+            for chunk in self._chunks:
+                parts = _parts_of(chunk)
+                self.function_calls.extend(_function_call_of(part) for part in parts if _function_call_of(part))
+                text = _text_of(parts)
+                if text:
+                    yield self._record(text)
+        except Exception as e:
+            yield self._record(f"\n\nDésolé, la réponse a été interrompue : {e}")
+        finally:
+            self.timing["total"] = time.perf_counter() - self.started
+            tracing.record("model_stream", self.timing["total"], time_to_first_token=self.timing["time_to_first_token"],
+                           function_calls=len(self.function_calls))
+
+    def run_function_calls(self):
+        """Exécute les outils demandés dans le flux (à appeler une fois le texte affiché) ; None s'il n'y en a pas."""
+        known_calls = _known_calls(self.function_calls, AVAILABLE_FUNCTIONS)
+        if not known_calls:
+            return None
+        return _run_known_calls(known_calls, AVAILABLE_FUNCTIONS)
+
+def get_generative_response(history, model_instance, stream=False):
+    if stream:
+        started = time.perf_counter()
+        with tracing.span("model_call", stream=True):
+            chunks = iter(model_instance.generate_content(history, stream=True))
+        return StreamedAnswer(chunks, started)
+    with tracing.span("model_call", stream=False):
+        response = model_instance.generate_content(history)
     return response.text.strip()
 
 # ───── FONCTIONS RÉELLES (OUTILS) ─────
@@ -112,15 +186,18 @@ def get_character_sheet(champion: str):
     st.caption(f"--- Fiche Personnage pour {champion} ---")
     api_data = get_champion_data(champion)
     if not api_data: return f"Impossible de trouver les données pour '{champion}'."
-    relations_question = f"Fais un résumé des relations de {api_data['name']}."
-    relations_info = query_rag_system(relations_question)
-    version = get_latest_version()
-    base_img_url = f"https://ddragon.leagueoflegends.com/cdn/{version}/img"
-    character_sheet = { "type": "character_sheet", "source": "API & RAG", "name": api_data['name'], "title": api_data['title'], "splash_url": f"https://ddragon.leagueoflegends.com/cdn/img/champion/splash/{api_data['id']}_0.jpg", "lore": api_data['lore'], "relations": relations_info, "spells": [] }
-    character_sheet['spells'].append({ "name": f"Passif - {api_data['passive']['name']}", "icon_url": f"{base_img_url}/passive/{api_data['passive']['image']['full']}", "description": clean_html(api_data['passive']['description']) })
-    for spell in api_data['spells']:
-        character_sheet['spells'].append({ "name": spell['name'], "icon_url": f"{base_img_url}/spell/{spell['image']['full']}", "description": clean_html(spell['description']) })
-    return character_sheet
+    generation = get_index_generation()
+    # Relations pré-calculées avec l'index ; sinon (index plus récent que la table, champion nouveau) une question RAG.
+    relations_info = None if tool_cache_bypassed() or generation is None else get_relations_table(FAISS_INDEX_PATH).get(api_data['id'], generation)
+    if relations_info is None:
+        relations_question = RELATIONS_QUESTION_TEMPLATE.format(name=api_data['name'])
+        relations_info = get_tool_cache().get_or_compute(
+            "relations", {"champion": api_data['id']}, lambda: query_rag_system(relations_question),
+            model_name=RAG_LLM_MODEL, prompt_template=RELATIONS_QUESTION_TEMPLATE + RAG_PROMPT_TEMPLATE,
+            version=generation, bypass=tool_cache_bypassed(),
+            cacheable=lambda answer: not answer.startswith("Erreur"),
+        )
+    return build_character_sheet(api_data, get_latest_version(), relations_info)
 
 def generate_champion_sheet_pdf(champion: str):
     st.caption(f"--- Génération du PDF pour {champion} ---")
@@ -128,9 +205,8 @@ def generate_champion_sheet_pdf(champion: str):
     if not isinstance(sheet_data, dict):
         return {"type": "simple_text", "content": f"Impossible de générer la fiche pour {champion}."}
     try:
-        pdf_data = generate_pdf_from_content(sheet_data)
         file_name = f"fiche_{sheet_data.get('name', 'champion').replace(' ', '_')}.pdf"
-        return {"type": "file_download", "data": pdf_data, "file_name": file_name, "label": f"Télécharger la fiche de {champion}"}
+        return make_pdf_artifact(sheet_data, file_name, f"Télécharger la fiche de {champion}")
     except Exception as e:
         return {"type": "simple_text", "content": f"Désolé, une erreur est survenue lors de la création du PDF : {e}"}
 
@@ -139,21 +215,20 @@ def export_to_pdf():
     last_assistant_message = None
     for message in reversed(st.session_state.messages):
         if message["role"] == "assistant":
-            if isinstance(message["content"], dict) and message["content"].get("type") == "file_download": continue
+            if isinstance(message["content"], dict) and message["content"].get("type") in ("file_download", "pdf_artifact"): continue
             last_assistant_message = message
             break
     if not last_assistant_message:
         return {"type": "simple_text", "content": "Je n'ai pas trouvé de réponse précédente à exporter."}
     content_to_export = last_assistant_message["content"]
     try:
-        pdf_data = generate_pdf_from_content(content_to_export)
         file_name = "export_heimerdinger.pdf"
         if isinstance(content_to_export, dict):
              if content_to_export.get("type") == "character_sheet":
                 file_name = f"fiche_{content_to_export.get('name', 'champion').replace(' ', '_')}.pdf"
              elif content_to_export.get("type"):
                 file_name = f"{content_to_export.get('type')}_export.pdf"
-        return { "type": "file_download", "data": pdf_data, "file_name": file_name, "label": "Télécharger le PDF" }
+        return make_pdf_artifact(content_to_export, file_name, "Télécharger le PDF")
     except Exception as e:
         return {"type": "simple_text", "content": f"Désolé, une erreur est survenue lors de la création du PDF : {e}"}
 
@@ -169,8 +244,10 @@ def get_champion_spells(champion):
 
 def get_item_info(item: str):
     all_items = get_all_items_data()
-    if not all_items: return "Désolé, impossible de charger les données des objets."
-    found_item_data = next((d for _, d in all_items.items() if normalize_text(d['name']) == normalize_text(item)), None)
+    item_index = get_item_index()
+    if not all_items or not item_index: return "Désolé, impossible de charger les données des objets."
+    item_id = item_index.resolve(item)
+    found_item_data = all_items.get(item_id) if item_id else None
     if not found_item_data: return f"Désolé, je n'ai pas trouvé l'objet '{item}'."
     version = get_latest_version()
     icon_url = f"https://ddragon.leagueoflegends.com/cdn/{version}/img/item/{found_item_data['image']['full']}"
@@ -180,73 +257,188 @@ def answer_from_knowledge_base(question: str):
     return {"source": "Base de Connaissances", "content": query_rag_system(question)}
 
 def compare_champions(champion1: str, champion2: str):
-    data1 = get_champion_data(champion1)
-    data2 = get_champion_data(champion2)
+    champions_data = get_champions_data([champion1, champion2])
+    data1, data2 = champions_data[champion1], champions_data[champion2]
     if not data1 or not data2: return "Impossible de trouver les données pour l'un des champions."
-    analysis_prompt = f"Compare brièvement {data1['name']} et {data2['name']} pour un combat. Analyse leurs forces et faiblesses principales en te basant sur ces tags: {data1['name']} ({', '.join(data1['tags'])}) vs {data2['name']} ({', '.join(data2['tags'])})."
-    response_text = get_generative_response([{'role': 'user', 'parts': [analysis_prompt]}], model)
+    analysis_prompt = COMPARE_PROMPT_TEMPLATE.format(name1=data1['name'], tags1=', '.join(data1['tags']), name2=data2['name'], tags2=', '.join(data2['tags']))
+    response_text = get_tool_cache().get_or_compute(
+        "compare_champions", {"champions": [data1['id'], data2['id']]},
+        lambda: get_generative_response([{'role': 'user', 'parts': [analysis_prompt]}], model),
+        model_name=model.model_name, prompt_template=COMPARE_PROMPT_TEMPLATE, version=get_latest_version(), bypass=tool_cache_bypassed(),
+    )
     return { "type": "comparison", "champion1": {"name": data1['name'], "splash_url": f"https://ddragon.leagueoflegends.com/cdn/img/champion/loading/{data1['id']}_0.jpg"}, "champion2": {"name": data2['name'], "splash_url": f"https://ddragon.leagueoflegends.com/cdn/img/champion/loading/{data2['id']}_0.jpg"}, "analysis": response_text }
 
-def generate_ultimate_bravery_challenge():
+def generate_ultimate_bravery_challenge(seed: int = None, role: str = None, exclude_champions: list = None):
     st.caption("--- Génération d'un défi Ultimate Bravery ---")
-    all_champions = get_all_champions_list()
-    if not all_champions: return "Erreur: impossible de charger les champions."
-    champion = random.choice(list(all_champions.values()))
-    role = random.choice(['Top', 'Jungle', 'Mid', 'ADC', 'Support'])
-    all_spells = get_all_summoner_spells_data()
-    valid_spells = [s for s in all_spells.values() if 'CLASSIC' in s['modes']]
-    summoner_spells = random.sample(valid_spells, 2)
-    skill_order = random.sample(['A', 'Z', 'E'], 3)
-    all_items = get_all_items_data()
-    purchasable_items = [item for item in all_items.values() if item['gold']['purchasable'] and 'into' not in item and item['gold']['total'] > 1500 and 'Boots' not in item.get('tags', [])]
-    boots = [item for item in all_items.values() if 'Boots' in item.get('tags', []) and item['gold']['total'] > 300]
-    chosen_boots = random.choice(boots)
-    chosen_items = random.sample(purchasable_items, 5)
-    final_build = [chosen_boots] + chosen_items
-    version = get_latest_version()
-    base_img_url = f"https://ddragon.leagueoflegends.com/cdn/{version}/img"
-    return { "type": "ultimate_bravery", "champion": {"name": champion['name'], "title": champion['title'], "splash_url": f"https://ddragon.leagueoflegends.com/cdn/img/champion/splash/{champion['id']}_0.jpg"}, "role": role, "skill_order": skill_order, "summoner_spells": [{"name": s['name'], "icon_url": f"{base_img_url}/spell/{s['image']['full']}"} for s in summoner_spells], "final_build": [{"name": i['name'], "icon_url": f"{base_img_url}/item/{i['image']['full']}"} for i in final_build] }
-    
+    # Graine tirée au hasard si absente : elle est affichée avec le défi pour pouvoir le rejouer.
+    seed = random.randrange(2**31) if seed is None else int(seed)
+    try:
+        return generate_bravery(get_bravery_pools(get_latest_version()), seed, role=role, exclude_champions=exclude_champions or ())
+    except (ValueError, KeyError, OSError) as e:
+        return {"type": "simple_text", "content": f"Impossible de générer le défi Ultimate Bravery : {e}"}
+
 def get_draft_suggestion(enemy_champions: list, my_role: str):
     st.caption(f"--- Analyse de Draft : Homo Draftus ---")
-    enemy_data = [get_champion_data(name) for name in enemy_champions if get_champion_data(name)]
+    # Triée par identifiant : la même draft donne le même prompt, donc la même entrée de cache.
+    enemy_data = sorted((data for data in get_champions_data(enemy_champions).values() if data), key=lambda e: e['id'])
     if not enemy_data: return "Impossible d'analyser : aucun champion ennemi valide fourni."
     enemy_composition_str = ", ".join([f"{e['name']} ({', '.join(e['tags'])})" for e in enemy_data])
-    prompt = f"Tu es 'Homo Draftus', un coach stratégique de niveau Challenger pour League of Legends. Analyse la situation suivante :\n- Mon rôle : **{my_role}**\n- Composition ennemie : **{enemy_composition_str}**\n\n**Instructions :**\n1. **Analyse de la composition ennemie (2-3 lignes) :** Décris leurs forces et faiblesses.\n2. **Recommandations de picks (3 choix) :** Propose trois champions pour le rôle de **{my_role}**. Pour chaque champion, donne un **Nom de Stratégie** et explique en 2-3 lignes *pourquoi* c'est un bon choix contre *cette composition*."
-    analysis = get_generative_response([{'role': 'user', 'parts': [prompt]}], model)
+    prompt = DRAFT_PROMPT_TEMPLATE.format(my_role=my_role, enemy_composition=enemy_composition_str)
+    analysis = get_tool_cache().get_or_compute(
+        "get_draft_suggestion", {"enemies": [e['id'] for e in enemy_data], "role": normalize_text(my_role)},
+        lambda: get_generative_response([{'role': 'user', 'parts': [prompt]}], model),
+        model_name=model.model_name, prompt_template=DRAFT_PROMPT_TEMPLATE, version=get_latest_version(), bypass=tool_cache_bypassed(),
+    )
     return {"type": "draft_suggestion", "analysis": analysis}
 
 # ───── APPEL INTELLIGENT DE GEMINI ─────
-def call_gemini_with_tools(messages_history, model_instance, mode):
-    available_functions = {
-        "get_character_sheet": get_character_sheet,
-        "export_to_pdf": export_to_pdf,
-        "generate_champion_sheet_pdf": generate_champion_sheet_pdf,
-        "get_champion_spells": get_champion_spells,
-        "compare_champions": compare_champions,
-        "get_item_info": get_item_info,
-        "get_draft_suggestion": get_draft_suggestion,
-        "generate_ultimate_bravery_challenge": generate_ultimate_bravery_challenge,
-        "answer_from_knowledge_base": answer_from_knowledge_base,
-    }
+# Délais maximaux par outil quand plusieurs outils sont exécutés en parallèle.
+TOOL_TIMEOUT_SECONDS = 45
+TOOL_TIMEOUTS = {"get_character_sheet": 90, "generate_champion_sheet_pdf": 90, "answer_from_knowledge_base": 90}
+
+def run_tools_concurrently(calls):
+    """
+    Exécute plusieurs appels d'outils (nom, arguments) en parallèle : ils attendent surtout le réseau
+    (Data Dragon, RAG, Gemini). Retourne un contenu composite 'multi_tool' avec le résultat, le statut
+    et la durée de chaque outil (mesurée depuis son propre démarrage), dans l'ordre demandé par le modèle.
+
+    Un outil en dépassement de délai n'est pas interrompu (un thread ne peut pas l'être) : son thread
+    continue en arrière-plan, avec le contexte de la session, jusqu'à la fin de l'appel réseau en cours,
+    et son résultat est ignoré. Chaque lot a son propre pool, libéré sans attendre ces threads.
+    """
+    ctx = get_script_run_ctx()
+    starts = {}
+    def run(index, name, args):
+        # Les outils utilisent st.caption / st.session_state : on leur donne le contexte de la session.
+        if ctx is not None: add_script_run_ctx(threading.current_thread(), ctx)
+        starts[index] = time.perf_counter()
+        try:
+            with tracing.span("tool", tool=name, parallel=True):
+                content = AVAILABLE_FUNCTIONS[name](**args)
+        except Exception as e:
+            return f"Erreur de l'outil {name} : {e}", time.perf_counter() - starts[index], "error"
+        return content, time.perf_counter() - starts[index], "ok"
+
+    started = time.perf_counter()
+    pool = ThreadPoolExecutor(max_workers=len(calls))
+    futures = [pool.submit(tracing.propagate(run), index, name, args) for index, (name, args) in enumerate(calls)]
+    results = []
+    for index, ((name, args), future) in enumerate(zip(calls, futures)):
+        timeout = TOOL_TIMEOUTS.get(name, TOOL_TIMEOUT_SECONDS)
+        try:
+            content, seconds, status = future.result(timeout=max(0, started + timeout - time.perf_counter()))
+        except FuturesTimeoutError:
+            seconds = time.perf_counter() - starts.get(index, started)
+            content, status = f"L'outil {name} n'a pas répondu en moins de {timeout}s.", "timeout"
+        results.append({"tool": name, "args": args, "content": content, "status": status, "seconds": seconds})
+    # On n'attend pas un outil en dépassement de délai.
+    pool.shutdown(wait=False)
+    return {"type": "multi_tool", "results": results, "total_seconds": time.perf_counter() - started}
+
+def _known_calls(calls, available_functions):
+    return [(call.name, {k: v for k, v in call.args.items()}) for call in calls if call.name in available_functions]
+
+def _run_known_calls(known_calls, available_functions):
+    if len(known_calls) == 1:
+        name, args = known_calls[0]
+        with tracing.span("tool", tool=name):
+            return available_functions[name](**args)
+    return run_tools_concurrently(known_calls)
+
+def _dispatch_function_calls(calls, available_functions, gemini_history, model_instance, stream):
+    known_calls = _known_calls(calls, available_functions)
+    if not known_calls:
+        return get_generative_response(gemini_history, model_instance, stream=stream)
+    return _run_known_calls(known_calls, available_functions)
+
+def _resolved_text(response):
+    """Texte d'une réponse diffusée entièrement consommée (vide si le modèle n'a rien produit, ex. réponse bloquée)."""
+    try:
+        return (response.text or "").strip()
+    except (ValueError, AttributeError):
+        return ""
+
+def _handle_stream(request, available_functions, gemini_history, model_instance, started):
+    """
+    Lance la requête diffusée `request()` et lit le flux jusqu'au premier texte : la suite est diffusée par
+    StreamedAnswer, qui continue de collecter les appels de fonction. Un flux qui commence par des appels
+    est lu jusqu'au bout et les outils sont exécutés directement.
+    """
+    calls = []
+    with tracing.span("model_call", stream=True, tools=True):
+        response = request()
+        chunks = iter(response)
+        for chunk in chunks:
+            parts = _parts_of(chunk)
+            calls.extend(_function_call_of(part) for part in parts if _function_call_of(part))
+            if calls:
+                # Le modèle peut demander plusieurs outils : on les collecte jusqu'à la fin du flux.
+                continue
+            text = _text_of(parts)
+            if text:
+                return StreamedAnswer(chunks, started, first_text=text, time_to_first_token=time.perf_counter() - started)
+        tracing.tag(function_calls=len(calls))
+    if calls:
+        return _dispatch_function_calls(calls, available_functions, gemini_history, model_instance, stream=True)
+    # Flux terminé sans texte ni appel : on réutilise la réponse résolue plutôt que de relancer une génération.
+    return _resolved_text(response) or "Désolé, je n'ai pas obtenu de réponse du modèle."
+
+AVAILABLE_FUNCTIONS = {
+    "get_character_sheet": get_character_sheet,
+    "export_to_pdf": export_to_pdf,
+    "generate_champion_sheet_pdf": generate_champion_sheet_pdf,
+    "get_champion_spells": get_champion_spells,
+    "compare_champions": compare_champions,
+    "get_item_info": get_item_info,
+    "get_draft_suggestion": get_draft_suggestion,
+    "generate_ultimate_bravery_challenge": generate_ultimate_bravery_challenge,
+    "answer_from_knowledge_base": answer_from_knowledge_base,
+}
+
+def dispatch_tool(name, args):
+    """
+    Appelle directement un outil (utilisé par le routeur local, sans passer par le modèle). Une erreur de l'outil
+    est affichée et remplacée par un message, comme dans call_gemini_with_tools : le tour se termine quand même.
+    """
+    try:
+        with tracing.span("tool", tool=name, routed=True):
+            return AVAILABLE_FUNCTIONS[name](**args)
+    except Exception as e:
+        st.error(f"Une erreur est survenue avec l'outil {name} : {e}")
+        return "Désolé, une erreur est survenue."
+
+def call_gemini_with_tools(messages_history, model_instance, mode, stream=False, history_manager=None):
+    """
+    Envoie l'historique à Gemini avec les outils déclarés. Si le modèle choisit un outil, son résultat est retourné.
+    Avec `stream=True`, une réponse textuelle est retournée sous forme de StreamedAnswer à afficher progressivement.
+    Avec un `history_manager`, l'historique est borné par un budget de tokens (résumé glissant des anciens tours).
+    """
+    available_functions = AVAILABLE_FUNCTIONS
     persona_prompts = { "Général": "Tu es un assistant serviable.", "Lore": "Tu es un conteur passionné.", "Stratégie": "Tu es un coach expert.", "Création RP": "Tu es un maître de jeu." }
     system_instruction = persona_prompts.get(mode, persona_prompts["Général"])
-    gemini_history = [{'role': 'user', 'parts': [system_instruction]}, {'role': 'model', 'parts': ["Entendu."]}]
-    for role, text in messages_history:
-        gemini_role = "model" if role == "assistant" else "user"
-        gemini_history.append({'role': gemini_role, 'parts': [text]})
     tools = types.Tool(function_declarations=function_declarations)
     config = types.GenerationConfig(temperature=0.7)
     try:
-        response = model_instance.generate_content(gemini_history, tools=[tools], generation_config=config)
-        part = response.candidates[0].content.parts[0]
-        if hasattr(part, "function_call"):
-            call = part.function_call
-            function_to_call = available_functions.get(call.name)
-            if function_to_call:
-                return function_to_call(**{k: v for k, v in call.args.items()})
-            else:
-                return get_generative_response(gemini_history, model_instance)
+        if history_manager is not None:
+            summarize = lambda prompt: get_generative_response([{'role': 'user', 'parts': [prompt]}], model_instance)
+            with tracing.span("history"):
+                gemini_history = history_manager.build(messages_history, system_instruction, summarize)
+        else:
+            gemini_history = [{'role': 'user', 'parts': [system_instruction]}, {'role': 'model', 'parts': ["Entendu."]}]
+            for role, text in messages_history:
+                gemini_role = "model" if role == "assistant" else "user"
+                gemini_history.append({'role': gemini_role, 'parts': [text]})
+        started = time.perf_counter()
+        if stream:
+            request = lambda: model_instance.generate_content(gemini_history, tools=[tools], generation_config=config, stream=True)
+            return _handle_stream(request, available_functions, gemini_history, model_instance, started)
+        with tracing.span("model_call", stream=False, tools=True):
+            response = model_instance.generate_content(gemini_history, tools=[tools], generation_config=config)
+        parts = _parts_of(response)
+        calls = [_function_call_of(part) for part in parts if _function_call_of(part)]
+        part = parts[0]
+        if calls:
+            return _dispatch_function_calls(calls, available_functions, gemini_history, model_instance, stream=False)
         else:
             return part.text if hasattr(part, 'text') and part.text else get_generative_response(gemini_history, model_instance)
     except Exception as e:
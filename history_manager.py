@@ -0,0 +1,139 @@
+# Fichier : history_manager.py
+# Description : Gestion de l'historique envoyé à Gemini avec un budget de tokens : les derniers tours
+# sont gardés tels quels, les plus anciens sont condensés dans un résumé glissant, recalculé uniquement
+# quand de nouveaux tours sortent de la fenêtre.
+
+import hashlib
+import math
+
+# Un tour = une question et sa réponse.
+KEEP_LAST_TURNS = 3
+PROMPT_TOKEN_BUDGET = 4000
+SUMMARY_MAX_WORDS = 150
+# Estimation locale (≈ 4 caractères par token) : évite un appel count_tokens à chaque tour.
+CHARS_PER_TOKEN = 4
+
+SUMMARY_PROMPT = (
+    "Voici le résumé d'une conversation entre un joueur de League of Legends et son assistant, suivi de nouveaux échanges.\n"
+    "Mets à jour le résumé en {max_words} mots maximum, en français, en gardant les champions, objets, rôles "
+    "et demandes importantes.\n\nRésumé actuel :\n{summary}\n\nNouveaux échanges :\n{transcript}\n\nNouveau résumé :"
+)
+
+
+def estimate_tokens(text):
+    return math.ceil(len(text) / CHARS_PER_TOKEN)
+
+
+def message_to_text(content):
+    """Représentation textuelle d'un message, y compris les réponses structurées (fiches, comparaisons...)."""
+    if isinstance(content, str):
+        return content
+    if not isinstance(content, dict):
+        return str(content)
+    content_type = content.get("type")
+    if content_type == "character_sheet":
+        return f"[Fiche personnage affichée : {content.get('name')}, {content.get('title')}]"
+    if content_type == "spells_info":
+        spells = ", ".join(spell.get("name", "") for spell in content.get("spells", []))
+        return f"[Compétences affichées de {content.get('champion_name')} : {spells}]"
+    if content_type == "item_info":
+        return f"[Objet affiché : {content.get('name')}, {content.get('cost')} or]"
+    if content_type == "comparison":
+        return f"[Comparaison {content['champion1']['name']} vs {content['champion2']['name']}]\n{content.get('analysis', '')}"
+    if content_type == "draft_suggestion":
+        return f"[Analyse de draft]\n{content.get('analysis', '')}"
+    if content_type == "ultimate_bravery":
+        return f"[Défi Ultimate Bravery : {content.get('champion', {}).get('name')} {content.get('role')}]"
+    if content_type in ("file_download", "pdf_artifact"):
+        return f"[Fichier PDF proposé : {content.get('file_name')}]"
+    if content_type == "multi_tool":
+        return "\n".join(message_to_text(result["content"]) for result in content.get("results", []))
+    if content_type == "smite_game":
+        return "[Mini-jeu de Châtiment]"
+    if "content" in content:
+        return str(content["content"])
+    return f"[{content_type or 'contenu'}]"
+
+
+def _fingerprint(messages):
+    digest = hashlib.sha256()
+    for role, text in messages:
+        digest.update(f"{role}\0{text}\0".encode("utf-8"))
+    return digest.hexdigest()
+
+
+class HistoryManager:
+    """État du résumé glissant d'une conversation (un par session)."""
+
+    def __init__(self, keep_last_turns=KEEP_LAST_TURNS, budget_tokens=PROMPT_TOKEN_BUDGET, count_tokens=estimate_tokens):
+        self.keep_last_turns = keep_last_turns
+        self.budget_tokens = budget_tokens
+        self.count_tokens = count_tokens
+        self.summary = ""
+        self.summarized_count = 0
+        self.summarized_fingerprint = _fingerprint([])
+        self.summary_calls = 0
+        self.summary_failures = 0
+        self.last_stats = {}
+
+    def _update_summary(self, aged_out, summarize):
+        """Ne résume que les messages sortis de la fenêtre depuis le dernier appel."""
+        new_messages = aged_out[self.summarized_count:]
+        if not new_messages:
+            return
+        transcript = "\n".join(f"{'Assistant' if role == 'assistant' else 'Joueur'} : {text}" for role, text in new_messages)
+        prompt = SUMMARY_PROMPT.format(max_words=SUMMARY_MAX_WORDS, summary=self.summary or "(vide)", transcript=transcript)
+        try:
+            summary = summarize(prompt).strip()
+        except Exception as e:
+            # Échec du modèle (quota, réseau) : on garde le résumé précédent, ces messages seront résumés au prochain tour.
+            self.summary_failures += 1
+            print(f"--- [HISTORY] Résumé non mis à jour ({len(new_messages)} message(s) en attente) : {e} ---")
+            return
+        self.summary = summary
+        self.summary_calls += 1
+        self.summarized_count = len(aged_out)
+        self.summarized_fingerprint = _fingerprint(aged_out)
+
+    def build(self, messages_history, system_instruction, summarize):
+        """
+        Construit l'historique Gemini : consigne de persona (+ résumé), puis les derniers tours verbatim,
+        en réduisant la fenêtre tant que le budget de tokens est dépassé.
+        `messages_history` : liste de (rôle, contenu) ; `summarize(prompt) -> str` produit le résumé.
+        """
+        messages = [(role, message_to_text(content)) for role, content in messages_history]
+        full_tokens = self.count_tokens(system_instruction) + sum(self.count_tokens(text) for _, text in messages)
+
+        if self.summarized_count > len(messages) or _fingerprint(messages[:self.summarized_count]) != self.summarized_fingerprint:
+            # La conversation a été réinitialisée ou modifiée : on repart de zéro.
+            self.summary, self.summarized_count, self.summarized_fingerprint = "", 0, _fingerprint([])
+
+        # Place réservée au résumé, pour fixer la fenêtre avant de (re)calculer ce dernier une seule fois.
+        summary_allowance = self.count_tokens(self.summary) if self.summary else SUMMARY_MAX_WORDS * 2
+        # Un message déjà résumé n'est jamais réintégré dans la fenêtre (le résumé reste valide).
+        window = min(self.keep_last_turns * 2, len(messages) - self.summarized_count)
+        fixed_tokens = self.count_tokens(system_instruction) + summary_allowance
+        while window > 1 and fixed_tokens + sum(self.count_tokens(text) for _, text in messages[len(messages) - window:]) > self.budget_tokens:
+            window -= 1
+        aged_out = messages[:len(messages) - window]
+        recent = messages[len(messages) - window:]
+        self._update_summary(aged_out, summarize)
+
+        preamble = system_instruction
+        if self.summary:
+            preamble += f"\n\nRésumé de la conversation jusqu'ici : {self.summary}"
+        prompt_tokens = self.count_tokens(preamble) + sum(self.count_tokens(text) for _, text in recent)
+
+        gemini_history = [{'role': 'user', 'parts': [preamble]}, {'role': 'model', 'parts': ["Entendu."]}]
+        for role, text in recent:
+            gemini_history.append({'role': "model" if role == "assistant" else "user", 'parts': [text]})
+        self.last_stats = {
+            "prompt_tokens": prompt_tokens,
+            "unmanaged_tokens": full_tokens,
+            "verbatim_messages": len(recent),
+            "summarized_messages": len(aged_out),
+            "summary_tokens": self.count_tokens(self.summary) if self.summary else 0,
+            "summary_calls": self.summary_calls,
+            "summary_failures": self.summary_failures,
+        }
+        return gemini_history
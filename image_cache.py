@@ -0,0 +1,159 @@
+# Fichier : image_cache.py
+# Description : Cache local des images utilisées dans les PDF. Les images sont téléchargées une fois,
+# redimensionnées à la largeur d'affichage dans la page et recompressées ; les variantes sont stockées
+# par empreinte de contenu, partagées entre sessions et processus, avec éviction LRU par taille totale.
+
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from io import BytesIO
+
+import streamlit as st
+from PIL import Image
+
+import tracing
+from ddragon_mirror import OFFLINE, make_session
+
+IMAGE_CACHE_PATH = os.getenv("IMAGE_CACHE_PATH", os.path.join(".cache", "images"))
+IMAGE_CACHE_MAX_BYTES = int(os.getenv("IMAGE_CACHE_MAX_BYTES", str(200 * 1024 * 1024)))
+# Résolution d'impression visée : largement suffisante pour un PDF lu à l'écran.
+PDF_IMAGE_DPI = 110
+JPEG_QUALITY = 75
+DOWNLOAD_TIMEOUT = 5
+
+
+class ImageUnavailable(Exception):
+    """Image absente du cache et non téléchargeable (mode hors-ligne)."""
+
+
+def target_pixel_width(width_mm, dpi=PDF_IMAGE_DPI):
+    return max(1, int(round(width_mm / 25.4 * dpi)))
+
+
+def downscale(raw, max_width, quality=JPEG_QUALITY):
+    """Redimensionne (sans jamais agrandir) et recompresse en JPEG ; conserve le PNG pour les images transparentes."""
+    image = Image.open(BytesIO(raw))
+    if image.width > max_width:
+        image = image.resize((max_width, max(1, round(image.height * max_width / image.width))), Image.LANCZOS)
+    out = BytesIO()
+    if image.mode in ("RGBA", "LA", "P"):
+        image.save(out, format="PNG", optimize=True)
+        return out.getvalue(), "png"
+    image.convert("RGB").save(out, format="JPEG", quality=quality, optimize=True)
+    return out.getvalue(), "jpg"
+
+
+class ImageCache:
+    def __init__(self, root=IMAGE_CACHE_PATH, max_bytes=IMAGE_CACHE_MAX_BYTES, session=None, offline=OFFLINE):
+        self.root = root
+        self.max_bytes = max_bytes
+        # Même réglage que le miroir Data Dragon (DDRAGON_OFFLINE) : seules les images déjà en cache sont servies.
+        self.offline = offline
+        self.session = session or make_session()
+        os.makedirs(root, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(os.path.join(root, "index.sqlite"), check_same_thread=False, timeout=10)
+        self._conn.executescript(
+            "CREATE TABLE IF NOT EXISTS variants (url TEXT NOT NULL, width INTEGER NOT NULL, hash TEXT NOT NULL, "
+            "PRIMARY KEY (url, width));"
+            "CREATE TABLE IF NOT EXISTS blobs (hash TEXT PRIMARY KEY, file TEXT NOT NULL, size INTEGER NOT NULL, "
+            "original_size INTEGER NOT NULL, last_access REAL NOT NULL);"
+        )
+        self._conn.commit()
+        self.stats = {"hits": 0, "misses": 0, "bytes_downloaded": 0, "bytes_served": 0, "bytes_saved": 0, "evictions": 0}
+
+    def _lookup(self, url, width):
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT b.hash, b.file, b.size, b.original_size FROM variants v JOIN blobs b ON b.hash = v.hash "
+                "WHERE v.url = ? AND v.width = ?", (url, width)
+            ).fetchone()
+            if row is None:
+                return None
+            path = os.path.join(self.root, row[1])
+            if not os.path.exists(path):
+                self._conn.execute("DELETE FROM blobs WHERE hash = ?", (row[0],))
+                self._conn.commit()
+                return None
+            self._conn.execute("UPDATE blobs SET last_access = ? WHERE hash = ?", (time.time(), row[0]))
+            self._conn.commit()
+            return path, row[2], row[3]
+
+    def _store(self, url, width, data, extension, original_size):
+        content_hash = hashlib.sha256(data).hexdigest()
+        file_name = os.path.join(content_hash[:2], f"{content_hash}.{extension}")
+        path = os.path.join(self.root, file_name)
+        if not os.path.exists(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp_path = f"{path}.tmp.{os.getpid()}.{threading.get_ident()}"
+            with open(tmp_path, "wb") as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO blobs (hash, file, size, original_size, last_access) VALUES (?, ?, ?, ?, ?)",
+                (content_hash, file_name, len(data), original_size, time.time()),
+            )
+            self._conn.execute("INSERT OR REPLACE INTO variants (url, width, hash) VALUES (?, ?, ?)", (url, width, content_hash))
+            # Dans le même verrou, et sans l'image qu'on vient d'écrire : le chemin retourné reste valide.
+            self._evict(keep=content_hash)
+            self._conn.commit()
+        return path
+
+    def _evict(self, keep):
+        """Supprime les images les moins récemment utilisées (hors `keep`) jusqu'à repasser sous la taille maximale. Appelé sous verrou."""
+        total = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM blobs").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        for content_hash, file_name, size in self._conn.execute(
+            "SELECT hash, file, size FROM blobs WHERE hash != ? ORDER BY last_access", (keep,)
+        ).fetchall():
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(os.path.join(self.root, file_name))
+            except FileNotFoundError:
+                pass
+            self._conn.execute("DELETE FROM variants WHERE hash = ?", (content_hash,))
+            self._conn.execute("DELETE FROM blobs WHERE hash = ?", (content_hash,))
+            total -= size
+            self.stats["evictions"] += 1
+
+    def get(self, url, width_mm):
+        """Chemin local de l'image redimensionnée pour une largeur d'affichage donnée (en mm)."""
+        with tracing.span("image_cache"):
+            return self._get(url, width_mm)
+
+    def _get(self, url, width_mm):
+        width = target_pixel_width(width_mm)
+        cached = self._lookup(url, width)
+        if cached is not None:
+            path, size, original_size = cached
+            self.stats["hits"] += 1
+            self.stats["bytes_served"] += size
+            self.stats["bytes_saved"] += original_size - size
+            tracing.tag(cache="hit")
+            return path
+        self.stats["misses"] += 1
+        tracing.tag(cache="miss")
+        if self.offline:
+            raise ImageUnavailable(f"'{url}' absente du cache d'images (mode hors-ligne).")
+        response = self.session.get(url, timeout=DOWNLOAD_TIMEOUT)
+        response.raise_for_status()
+        data, extension = downscale(response.content, width)
+        self.stats["bytes_downloaded"] += len(response.content)
+        self.stats["bytes_served"] += len(data)
+        self.stats["bytes_saved"] += len(response.content) - len(data)
+        return self._store(url, width, data, extension, len(response.content))
+
+    def hit_rate(self):
+        total = self.stats["hits"] + self.stats["misses"]
+        return self.stats["hits"] / total if total else 0.0
+
+
+@st.cache_resource
+def get_image_cache():
+    """Cache d'images partagé par tout le processus (et, via le disque, entre les processus)."""
+    return ImageCache()
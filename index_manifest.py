@@ -0,0 +1,82 @@
+# Fichier : index_manifest.py
+# Description : Manifeste de hachage (par fichier et par chunk) stocké à côté de l'index FAISS,
+# utilisé pour la réindexation incrémentale de la base de connaissances.
+
+import hashlib
+import json
+import os
+
+MANIFEST_FILE = "manifest.json"
+MANIFEST_VERSION = 1
+
+
+def hash_file(path):
+    """Empreinte SHA-256 du contenu brut d'un fichier."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def hash_chunk(doc):
+    """Empreinte d'un chunk : son texte et sa page (la page est affichée avec les sources)."""
+    page = doc.metadata.get("page", "")
+    return hashlib.sha256(f"{page}\0{doc.page_content}".encode("utf-8")).hexdigest()
+
+
+def chunk_ids(source, docs):
+    """
+    Identifiants stables des chunks d'un fichier. Un chunk inchangé garde le même identifiant
+    même si le reste du fichier bouge ; les doublons dans un même fichier sont numérotés.
+    """
+    ids = []
+    seen = {}
+    for doc in docs:
+        chunk_hash = hash_chunk(doc)
+        occurrence = seen.get(chunk_hash, 0)
+        seen[chunk_hash] = occurrence + 1
+        ids.append(hashlib.sha256(f"{source}\0{chunk_hash}\0{occurrence}".encode("utf-8")).hexdigest()[:32])
+    return ids
+
+
+def new_manifest(settings):
+    return {"version": MANIFEST_VERSION, "settings": dict(settings), "files": {}}
+
+
+def is_compatible(manifest, settings):
+    """Un manifeste n'est réutilisable que si le modèle d'embedding et le découpage n'ont pas changé."""
+    return manifest.get("version") == MANIFEST_VERSION and manifest.get("settings") == dict(settings)
+
+
+def load_manifest(index_path):
+    path = os.path.join(index_path, MANIFEST_FILE)
+    try:
+        with open(path, encoding="utf-8") as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return None
+
+
+def save_manifest(manifest, index_path):
+    os.makedirs(index_path, exist_ok=True)
+    path = os.path.join(index_path, MANIFEST_FILE)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=1, sort_keys=True)
+    os.replace(tmp_path, path)
+
+
+def plan_update(manifest, file_hashes):
+    """Classe les fichiers actuels par rapport au manifeste : ajoutés, modifiés, inchangés, supprimés."""
+    known = manifest["files"]
+    plan = {"added": [], "changed": [], "unchanged": [], "removed": []}
+    for path, file_hash in sorted(file_hashes.items()):
+        if path not in known:
+            plan["added"].append(path)
+        elif known[path]["hash"] != file_hash:
+            plan["changed"].append(path)
+        else:
+            plan["unchanged"].append(path)
+    plan["removed"] = sorted(set(known) - set(file_hashes))
+    return plan
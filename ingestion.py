@@ -0,0 +1,99 @@
+# Fichier : ingestion.py
+# Description : Ingestion de la base de connaissances en flux. Les fichiers .txt/.pdf/.md sont lus et découpés
+# dans un pool de processus ; les chunks arrivent fichier par fichier (jamais tous en mémoire) et sont
+# regroupés en lots pour l'étape d'embedding, avec suivi de la progression (fichiers/s, chunks/s).
+
+import os
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from pathlib import Path
+
+KNOWLEDGE_BASE_EXTENSIONS = (".txt", ".pdf", ".md")
+INGEST_WORKERS = int(os.getenv("INGEST_WORKERS", str(min(4, os.cpu_count() or 1))))
+# Chunks embeddés (et ajoutés à l'index) par lot : borne la mémoire entre le découpage et l'embedding.
+EMBED_BATCH_CHUNKS = int(os.getenv("EMBED_BATCH_CHUNKS", "256"))
+
+
+def discover_files(base_path, extensions=KNOWLEDGE_BASE_EXTENSIONS):
+    """Fichiers de la base de connaissances (récursivement), par extension, dans un ordre stable."""
+    return sorted(str(path) for path in Path(base_path).rglob("*") if path.is_file() and path.suffix.lower() in extensions)
+
+
+def split_file(path, chunk_size, chunk_overlap):
+    """Charge un fichier et le découpe en chunks (exécuté dans un processus de travail)."""
+    from langchain.text_splitter import RecursiveCharacterTextSplitter
+    from langchain_community.document_loaders import UnstructuredFileLoader
+
+    # Un meilleur découpage pour garder plus de contexte entre les morceaux
+    text_splitter = RecursiveCharacterTextSplitter(chunk_size=chunk_size, chunk_overlap=chunk_overlap)
+    return text_splitter.split_documents(UnstructuredFileLoader(path).load())
+
+
+def iter_file_chunks(paths, chunk_size, chunk_overlap, workers=INGEST_WORKERS):
+    """
+    Génère (chemin, chunks) fichier par fichier, dans l'ordre d'achèvement. Au plus `2 * workers` fichiers
+    sont en cours à la fois : le découpage continue pendant que l'appelant embedde le lot précédent.
+    """
+    paths = list(paths)
+    if workers <= 1 or len(paths) <= 1:
+        for path in paths:
+            yield path, split_file(path, chunk_size, chunk_overlap)
+        return
+    pending_paths = iter(paths)
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        in_flight = {}
+
+        def submit_next():
+            path = next(pending_paths, None)
+            if path is not None:
+                in_flight[pool.submit(split_file, path, chunk_size, chunk_overlap)] = path
+
+        for _ in range(2 * workers):
+            submit_next()
+        while in_flight:
+            done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+            for future in done:
+                path = in_flight.pop(future)
+                submit_next()
+                yield path, future.result()
+
+
+class IngestionProgress:
+    """Compteurs d'une indexation, avec débits ; `callback(progress)` est appelé à chaque avancée."""
+
+    def __init__(self, files_total, callback=None):
+        self.files_total = files_total
+        self.files_done = 0
+        self.chunks_parsed = 0
+        self.chunks_embedded = 0
+        self.current = None
+        self.started = time.perf_counter()
+        self.callback = callback
+
+    def file_done(self, path, chunks):
+        self.files_done += 1
+        self.chunks_parsed += chunks
+        self.current = path
+        self._notify()
+
+    def batch_embedded(self, chunks):
+        self.chunks_embedded += chunks
+        self._notify()
+
+    def _notify(self):
+        if self.callback is not None:
+            self.callback(self)
+
+    @property
+    def elapsed(self):
+        return time.perf_counter() - self.started
+
+    @property
+    def fraction(self):
+        return self.files_done / self.files_total if self.files_total else 1.0
+
+    def summary(self):
+        elapsed = self.elapsed or 1e-9
+        return (f"{self.files_done}/{self.files_total} fichier(s) ({self.files_done / elapsed:.1f}/s) · "
+                f"{self.chunks_parsed} chunk(s) découpé(s) ({self.chunks_parsed / elapsed:.0f}/s) · "
+                f"{self.chunks_embedded} embeddé(s) ({self.chunks_embedded / elapsed:.0f}/s)")
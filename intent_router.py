@@ -0,0 +1,218 @@
+# Fichier : intent_router.py
+# Description : Routeur local et déterministe. Les formulations courantes (« qui est X », « sorts de X »,
+# « X vs Y », « objet X », « ultimate bravery »...) sont reconnues par motifs, les noms résolus via l'index
+# des champions/objets, et l'outil est appelé directement, sans aller-retour vers Gemini pour le choisir.
+# Le modèle n'est sollicité que si la confiance est trop faible.
+#
+# Évaluation hors-ligne sur le jeu de questions annoté :
+#   python intent_router.py eval
+
+import re
+import sys
+import threading
+import time
+from collections import Counter, namedtuple
+
+import unidecode
+
+import tracing
+
+MIN_CONFIDENCE = 0.8
+# Latence typique d'un appel Gemini de sélection d'outil, pour estimer le temps gagné.
+ASSUMED_MODEL_ROUNDTRIP_SECONDS = 1.5
+
+Route = namedtuple("Route", ["tool", "args", "confidence", "pattern"])
+
+_DE = r"(?:de |d'|du |des )"
+
+# (outil, motif, type de chaque groupe nommé, confiance minimale exigée pour ce motif)
+PATTERNS = [
+    ("generate_ultimate_bravery_challenge", r"\bultimate bravery\b|\bdefi (?:ub|aleatoire)\b", {}, MIN_CONFIDENCE),
+    ("generate_champion_sheet_pdf", rf"^(?:exporte|exporter|genere|generer|telecharge|telecharger)(?: moi)? (?:la )?fiche {_DE}(?P<champion>.+?) (?:en )?pdf$", {"champion": "champion"}, MIN_CONFIDENCE),
+    ("generate_champion_sheet_pdf", rf"^(?:le )?pdf {_DE}(?:la fiche {_DE})?(?P<champion>.+)$", {"champion": "champion"}, MIN_CONFIDENCE),
+    ("export_to_pdf", r"^(?:exporte|exporter|sauvegarde|sauvegarder|telecharge|telecharger)\b.*\bpdf$", {}, MIN_CONFIDENCE),
+    ("get_champion_spells", rf"(?:sorts|competences|capacites|spells|kit) {_DE}(?P<champion>.+)$", {"champion": "champion"}, MIN_CONFIDENCE),
+    ("compare_champions", r"^(?:compare|comparer|comparaison)(?: entre)? (?P<champion1>.+?) (?:et|avec|vs|contre) (?P<champion2>.+)$", {"champion1": "champion", "champion2": "champion"}, MIN_CONFIDENCE),
+    ("compare_champions", r"^qui gagne entre (?P<champion1>.+?) et (?P<champion2>.+)$", {"champion1": "champion", "champion2": "champion"}, MIN_CONFIDENCE),
+    ("compare_champions", r"^(?P<champion1>.+?) (?:vs\.?|versus|contre) (?P<champion2>.+)$", {"champion1": "champion", "champion2": "champion"}, MIN_CONFIDENCE),
+    ("get_item_info", r"^(?:objet|item|l'objet|l'item) (?P<item>.+)$", {"item": "item"}, MIN_CONFIDENCE),
+    ("get_item_info", r"^(?:que fait|a quoi sert|stats de|infos sur) (?:l'objet |l'item |le |la |les )?(?P<item>.+)$", {"item": "item"}, 0.9),
+    ("get_character_sheet", rf"^(?:qui est|c'est qui|qui c'est|presente moi|presente|parle moi {_DE}?|fiche {_DE})\s*(?P<champion>.+)$", {"champion": "champion"}, MIN_CONFIDENCE),
+    # Un nom de champion seul : uniquement sur correspondance exacte ou alias.
+    ("get_character_sheet", r"^(?P<champion>[a-z0-9' .&]{2,30})$", {"champion": "champion"}, 1.0),
+]
+_COMPILED_PATTERNS = [(tool, re.compile(pattern), slots, min_confidence) for tool, pattern, slots, min_confidence in PATTERNS]
+
+
+def normalize_question(question):
+    """Minuscules, sans accents, sans ponctuation finale ni tirets : « Présente-moi Kai'Sa ? » -> « presente moi kai'sa »."""
+    text = unidecode.unidecode(question).lower().replace("-", " ").replace("’", "'")
+    return re.sub(r"\s+", " ", text).strip(" ?!.")
+
+
+class IntentRouter:
+    """Associe une question à un outil et à ses arguments, avec un score de confiance."""
+
+    def __init__(self, champion_index, item_index=None, min_confidence=MIN_CONFIDENCE):
+        self.indexes = {"champion": champion_index, "item": item_index}
+        self.min_confidence = min_confidence
+
+    def _resolve(self, kind, value):
+        index = self.indexes.get(kind)
+        if index is None:
+            return None, 0.0
+        value = re.sub(r"^(?:le |la |les |l')", "", value.strip())
+        entry_id, score, _ = index.match(value)
+        if entry_id is None:
+            return None, 0.0
+        # Les outils attendent le nom affiché (ils refont la résolution de leur côté).
+        return index.names_by_id[entry_id], score
+
+    def route(self, question):
+        """Retourne une Route, ou None si aucune règle n'est assez sûre (il faut alors demander au modèle)."""
+        text = normalize_question(question)
+        for tool, pattern, slots, min_confidence in _COMPILED_PATTERNS:
+            match = pattern.search(text)
+            if not match:
+                continue
+            args, confidence = {}, 1.0
+            for slot, kind in slots.items():
+                value, score = self._resolve(kind, match.group(slot))
+                args[slot] = value
+                confidence = min(confidence, score)
+            if confidence >= max(min_confidence, self.min_confidence):
+                return Route(tool, args, confidence, pattern.pattern)
+        return None
+
+
+_stats = Counter()
+_stats_lock = threading.Lock()
+
+
+def record_decision(question, route, elapsed):
+    """Journalise la décision de routage et met à jour les compteurs du processus."""
+    with _stats_lock:
+        _stats["questions"] += 1
+        _stats["routed" if route else "fallback"] += 1
+        if route:
+            _stats[f"tool:{route.tool}"] += 1
+    decision = f"{route.tool} {route.args} (confiance {route.confidence:.2f})" if route else "modèle (confiance insuffisante)"
+    print(f"--- [ROUTEUR] « {question[:80]} » -> {decision} en {elapsed * 1000:.2f} ms ---")
+
+
+def get_router_stats():
+    """Compteurs de routage et taux de questions traitées localement."""
+    with _stats_lock:
+        stats = dict(_stats)
+    stats["hit_rate"] = stats.get("routed", 0) / stats["questions"] if stats.get("questions") else 0.0
+    return stats
+
+
+def route_question(question):
+    """Point d'entrée de l'application : route la question avec les index de la version courante de Data Dragon."""
+    from name_index import get_champion_index, get_item_index
+    champion_index = get_champion_index()
+    if champion_index is None:
+        return None
+    with tracing.span("routing"):
+        started = time.perf_counter()
+        route = IntentRouter(champion_index, get_item_index()).route(question)
+        record_decision(question, route, time.perf_counter() - started)
+        tracing.tag(routed=route is not None, tool=route.tool if route else None)
+    return route
+
+
+# ───── JEU DE QUESTIONS ANNOTÉ (outil attendu, ou None si la question doit aller au modèle) ─────
+EVAL_CHAMPIONS = [
+    ("Garen", "Garen"), ("Darius", "Darius"), ("Kaisa", "Kai'Sa"), ("JarvanIV", "Jarvan IV"),
+    ("Heimerdinger", "Heimerdinger"), ("Ahri", "Ahri"), ("LeeSin", "Lee Sin"), ("MonkeyKing", "Wukong"),
+    ("Yasuo", "Yasuo"), ("Jinx", "Jinx"), ("Thresh", "Thresh"), ("Nunu", "Nunu & Willump"),
+]
+EVAL_ITEMS = [
+    ("3153", "Lame du roi déchu"), ("3031", "Lame d'infini"), ("3089", "Coiffe de Rabadon"),
+    ("3157", "Sablier de Zhonya"), ("3078", "Force de la Trinité"),
+]
+LABELLED_QUESTIONS = [
+    ("Qui est Garen ?", "get_character_sheet"),
+    ("qui est kaisa", "get_character_sheet"),
+    ("C'est qui Jarvan 4 ?", "get_character_sheet"),
+    ("Présente-moi Heimer", "get_character_sheet"),
+    ("Parle-moi de Wukong", "get_character_sheet"),
+    ("Fiche de Lee Sin", "get_character_sheet"),
+    ("Yasuo", "get_character_sheet"),
+    ("Qui est Yasou ?", "get_character_sheet"),
+    ("Quelles sont les compétences de Ahri ?", "get_champion_spells"),
+    ("sorts de jinx", "get_champion_spells"),
+    ("Donne-moi les capacités d'Ahri", "get_champion_spells"),
+    ("Le kit de Thresh", "get_champion_spells"),
+    ("Garen vs Darius", "compare_champions"),
+    ("garen contre darius ?", "compare_champions"),
+    ("Compare Jinx et Kai'Sa", "compare_champions"),
+    ("Qui gagne entre Yasuo et Ahri ?", "compare_champions"),
+    ("objet Lame d'infini", "get_item_info"),
+    ("Que fait la Coiffe de Rabadon ?", "get_item_info"),
+    ("item zhonya", "get_item_info"),
+    ("À quoi sert la Lame du roi déchu ?", "get_item_info"),
+    ("Lance un ultimate bravery", "generate_ultimate_bravery_challenge"),
+    ("Je veux un défi aléatoire", "generate_ultimate_bravery_challenge"),
+    ("Exporte la fiche de Garen en PDF", "generate_champion_sheet_pdf"),
+    ("PDF de Nunu & Willump", "generate_champion_sheet_pdf"),
+    ("Exporte ça en PDF", "export_to_pdf"),
+    ("Télécharger la réponse en pdf", "export_to_pdf"),
+    ("Quelle est la meilleure compo pour le mid ?", None),
+    ("Comment jouer contre un tank ?", None),
+    ("Quel champion choisir pour débuter ?", None),
+    ("Qui est le meilleur joueur du monde ?", None),
+    ("Explique-moi le wave management", None),
+    ("Bonjour !", None),
+    ("Merci beaucoup", None),
+    ("Que fait un support ?", None),
+    ("Compare les rôles top et mid", None),
+]
+
+
+def evaluate(questions=LABELLED_QUESTIONS, champions=EVAL_CHAMPIONS, items=EVAL_ITEMS):
+    """Mesure la précision du routeur, son taux de couverture et le temps de modèle économisé (estimé)."""
+    from name_index import NameIndex, CHAMPION_ALIASES, ITEM_ALIASES
+    router = IntentRouter(NameIndex(champions, CHAMPION_ALIASES), NameIndex(items, ITEM_ALIASES))
+    correct = routed = routed_correct = 0
+    errors = []
+    started = time.perf_counter()
+    for question, expected in questions:
+        route = router.route(question)
+        predicted = route.tool if route else None
+        if route:
+            routed += 1
+            routed_correct += predicted == expected
+        if predicted == expected:
+            correct += 1
+        else:
+            errors.append((question, expected, predicted))
+    elapsed = time.perf_counter() - started
+    return {
+        "questions": len(questions),
+        "accuracy": correct / len(questions),
+        "hit_rate": routed / len(questions),
+        "routed_precision": routed_correct / routed if routed else 0.0,
+        "avg_routing_ms": elapsed * 1000 / len(questions),
+        "estimated_model_seconds_saved": routed_correct * ASSUMED_MODEL_ROUNDTRIP_SECONDS,
+        "errors": errors,
+    }
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    if argv[:1] != ["eval"]:
+        print("Usage : python intent_router.py eval")
+        return 2
+    report = evaluate()
+    print(f"Questions : {report['questions']}")
+    print(f"Précision globale : {report['accuracy']:.0%} | couverture locale : {report['hit_rate']:.0%} | précision des routages : {report['routed_precision']:.0%}")
+    print(f"Routage moyen : {report['avg_routing_ms']:.3f} ms | temps de modèle économisé (estimé) : {report['estimated_model_seconds_saved']:.1f}s")
+    for question, expected, predicted in report["errors"]:
+        print(f"  ✗ « {question} » : attendu {expected}, obtenu {predicted}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
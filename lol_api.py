@@ -1,38 +1,39 @@
 # Fichier : lol_api.py
 # Description : Ajout de la récupération des sorts d'invocateur.
+# Les données passent par le miroir local de Data Dragon (voir ddragon_mirror.py).
 
 import streamlit as st
 import requests
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import tracing
+from ddragon_mirror import get_mirror
+
+DETAILS_MAX_WORKERS = 8
+
+# Fiches détaillées déjà chargées, par (version, identifiant) ; seuls les succès sont conservés.
+_champion_details_cache = {}
+_champion_details_lock = threading.Lock()
 
 @st.cache_data(ttl=86400)
 def get_latest_version():
-    try:
-        response = requests.get("https://ddragon.leagueoflegends.com/api/versions.json")
-        response.raise_for_status()
-        return response.json()[0]
-    except requests.RequestException:
-        return "14.12.1" 
+    return get_mirror().latest_version()
 
 @st.cache_data(ttl=86400)
 def get_all_champions_list():
     version = get_latest_version()
-    url = f"https://ddragon.leagueoflegends.com/cdn/{version}/data/fr_FR/champion.json"
     try:
-        response = requests.get(url)
-        response.raise_for_status()
-        return response.json()['data']
-    except requests.RequestException:
+        return get_mirror().get_data(version, "champion.json")
+    except (requests.RequestException, FileNotFoundError, KeyError, ValueError):
         return None
 
 @st.cache_data(ttl=86400)
 def get_all_items_data():
     version = get_latest_version()
-    url = f"https://ddragon.leagueoflegends.com/cdn/{version}/data/fr_FR/item.json"
     try:
-        response = requests.get(url)
-        response.raise_for_status()
-        return response.json()['data']
-    except requests.RequestException:
+        return get_mirror().get_data(version, "item.json")
+    except (requests.RequestException, FileNotFoundError, KeyError, ValueError):
         st.error("Impossible de charger les données des objets depuis l'API de Riot.")
         return None
 
@@ -41,11 +42,48 @@ def get_all_items_data():
 def get_all_summoner_spells_data():
     """Récupère les données de tous les sorts d'invocateur."""
     version = get_latest_version()
-    url = f"https://ddragon.leagueoflegends.com/cdn/{version}/data/fr_FR/summoner.json"
     try:
-        response = requests.get(url)
-        response.raise_for_status()
-        return response.json()['data']
-    except requests.RequestException:
+        return get_mirror().get_data(version, "summoner.json")
+    except (requests.RequestException, FileNotFoundError, KeyError, ValueError):
         st.error("Impossible de charger les données des sorts d'invocateur.")
-        return None
\ No newline at end of file
+        return None
+
+def _load_champion_details(version, champion_id):
+    key = (version, champion_id)
+    if key in _champion_details_cache:
+        return _champion_details_cache[key]
+    try:
+        details = get_mirror().get_data(version, f"champion/{champion_id}.json")[champion_id]
+    except (requests.RequestException, FileNotFoundError, KeyError, ValueError):
+        return None
+    with _champion_details_lock:
+        _champion_details_cache[key] = details
+    return details
+
+def get_champion_details(champion_id, version=None):
+    """Fiche détaillée d'un champion (sorts, skins, lore) pour une version donnée."""
+    return _load_champion_details(version or get_latest_version(), champion_id)
+
+def get_champions_details(champion_ids, version=None, max_workers=DETAILS_MAX_WORKERS):
+    """
+    Charge plusieurs fiches détaillées en un seul appel : les identifiants sont dédupliqués et les
+    fiches manquantes téléchargées en parallèle. Retourne {identifiant: fiche ou None}.
+    """
+    version = version or get_latest_version()
+    unique_ids = list(dict.fromkeys(champion_ids))
+    missing = [champion_id for champion_id in unique_ids if (version, champion_id) not in _champion_details_cache]
+    if len(missing) > 1:
+        with ThreadPoolExecutor(max_workers=min(max_workers, len(missing))) as pool:
+            list(pool.map(tracing.propagate(lambda champion_id: _load_champion_details(version, champion_id)), missing))
+    return {champion_id: _load_champion_details(version, champion_id) for champion_id in unique_ids}
+
+def prefetch_all_champions(version, max_workers=DETAILS_MAX_WORKERS):
+    """Tâche de préchauffage : charge les fiches de tous les champions de la version."""
+    try:
+        champion_ids = list(get_mirror().get_data(version, "champion.json"))
+    except (requests.RequestException, FileNotFoundError, KeyError, ValueError):
+        return 0
+    details = get_champions_details(champion_ids, version=version, max_workers=max_workers)
+    loaded = sum(1 for data in details.values() if data)
+    print(f"--- [LOL_API] Préchargement : {loaded}/{len(champion_ids)} fiches de champions. ---")
+    return loaded
@@ -0,0 +1,124 @@
+# Fichier : name_index.py
+# Description : Index de résolution des noms de champions et d'objets, construit une fois par version
+# de Data Dragon : table de hachage des noms normalisés, alias et recherche approximative par trigrammes.
+
+import re
+import difflib
+import unidecode
+import streamlit as st
+
+from lol_api import get_latest_version, get_all_champions_list, get_all_items_data
+
+FUZZY_THRESHOLD = 0.75
+PREFIX_MIN_LENGTH = 3
+
+# Surnoms courants -> identifiant Data Dragon du champion.
+CHAMPION_ALIASES = {
+    "heimer": "Heimerdinger", "donger": "Heimerdinger",
+    "j4": "JarvanIV", "jarvan4": "JarvanIV",
+    "wukong": "MonkeyKing", "mf": "MissFortune", "tf": "TwistedFate", "gp": "Gangplank",
+    "asol": "AurelionSol", "lb": "Leblanc", "kha": "Khazix", "kog": "KogMaw", "tk": "TahmKench",
+    "yi": "MasterYi", "xin": "XinZhao", "ww": "Warwick", "cait": "Caitlyn", "ez": "Ezreal",
+    "blitz": "Blitzcrank", "morde": "Mordekaiser", "voli": "Volibear", "naut": "Nautilus",
+    "cho": "Chogath", "vel": "Velkoz", "kass": "Kassadin",
+    "malph": "Malphite", "fiddle": "FiddleSticks", "trist": "Tristana", "lee": "LeeSin",
+}
+
+# Abréviations courantes -> identifiant Data Dragon de l'objet.
+ITEM_ALIASES = {
+    "botrk": "3153", "bork": "3153", "ie": "3031", "rabadon": "3089", "deathcap": "3089",
+    "zhonya": "3157", "zhonyas": "3157", "tf": "3078", "trinity": "3078", "ga": "3026",
+    "bt": "3072", "qss": "3140", "lw": "3036",
+}
+
+
+def normalize_text(text):
+    """Minuscules, sans accents ni ponctuation : « Kai'Sa » -> « kaisa », « Nunu & Willump » -> « nunuwillump »."""
+    return re.sub(r"[^a-z0-9]", "", unidecode.unidecode(text).lower())
+
+
+def _trigrams(key):
+    padded = f"  {key} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+class NameIndex:
+    """Résout un nom saisi librement vers un identifiant : exact (O(1)), alias, préfixe unique, puis approximatif."""
+
+    def __init__(self, entries, aliases=None):
+        # entries : itérable de (identifiant, nom affiché)
+        self.exact = {}
+        self.display_names = []
+        self.names_by_id = {}
+        for entry_id, name in entries:
+            # En cas de doublon (variantes d'objets selon la carte), le premier gagne, comme l'ancien parcours linéaire.
+            self.exact.setdefault(normalize_text(name), entry_id)
+            self.names_by_id.setdefault(entry_id, name)
+        for entry_id, name in self.names_by_id.items():
+            self.display_names.append(name)
+            self.exact.setdefault(normalize_text(entry_id), entry_id)
+        self.display_names.sort()
+        self.aliases = {normalize_text(alias): target for alias, target in (aliases or {}).items() if target in self.names_by_id}
+        self.keys = sorted(self.exact)
+        self.trigram_index = {}
+        for key in self.keys:
+            for gram in _trigrams(key):
+                self.trigram_index.setdefault(gram, set()).add(key)
+
+    def match(self, query):
+        """Retourne (identifiant, score, méthode) ou (None, 0.0, None)."""
+        key = normalize_text(query or "")
+        if not key:
+            return None, 0.0, None
+        if key in self.exact:
+            return self.exact[key], 1.0, "exact"
+        if key in self.aliases:
+            return self.aliases[key], 1.0, "alias"
+        if len(key) >= PREFIX_MIN_LENGTH:
+            prefixed = [k for k in self.keys if k.startswith(key)]
+            if len({self.exact[k] for k in prefixed}) == 1:
+                return self.exact[prefixed[0]], len(key) / len(min(prefixed, key=len)), "prefix"
+        return self._fuzzy(key)
+
+    def _fuzzy(self, key):
+        query_grams = _trigrams(key)
+        overlap = {}
+        for gram in query_grams:
+            for candidate in self.trigram_index.get(gram, ()):
+                overlap[candidate] = overlap.get(candidate, 0) + 1
+        candidates = sorted(overlap, key=lambda k: 2 * overlap[k] / (len(query_grams) + len(_trigrams(k))), reverse=True)[:10]
+        best_key, best_score = None, 0.0
+        for candidate in candidates:
+            score = difflib.SequenceMatcher(None, key, candidate).ratio()
+            if score > best_score:
+                best_key, best_score = candidate, score
+        if best_key is not None and best_score >= FUZZY_THRESHOLD:
+            return self.exact[best_key], best_score, "fuzzy"
+        return None, best_score, None
+
+    def resolve(self, query):
+        return self.match(query)[0]
+
+
+@st.cache_resource
+def _champion_index_for_version(version):
+    all_champions = get_all_champions_list()
+    return NameIndex(((champion_id, data['name']) for champion_id, data in all_champions.items()), CHAMPION_ALIASES)
+
+
+@st.cache_resource
+def _item_index_for_version(version):
+    all_items = get_all_items_data()
+    return NameIndex(((item_id, data['name']) for item_id, data in all_items.items()), ITEM_ALIASES)
+
+
+def get_champion_index():
+    """Index des champions pour la version courante de Data Dragon (construit une seule fois par version), ou None si indisponible."""
+    if not get_all_champions_list(): return None
+    return _champion_index_for_version(get_latest_version())
+
+
+def get_item_index():
+    """Index des objets pour la version courante de Data Dragon (construit une seule fois par version), ou None si indisponible."""
+    if not get_all_items_data(): return None
+    return _item_index_for_version(get_latest_version())
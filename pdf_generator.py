@@ -2,10 +2,11 @@
 # Description : Correction du bug de génération PDF.
 
 from fpdf import FPDF
-import requests
-from io import BytesIO
 import streamlit as st
 
+import tracing
+from image_cache import ImageUnavailable, get_image_cache
+
 # --- Paramètres globaux pour le style des PDF ---
 PDF_FONT_FAMILY = "Arial"
 PDF_TITLE_FONT_SIZE = 16
@@ -40,14 +41,18 @@ class PDF(FPDF):
         
     def add_image_from_url(self, url, w=0):
         try:
-            response = requests.get(url, timeout=5)
-            response.raise_for_status()
-            img = BytesIO(response.content)
+            # Image servie par le cache local, déjà réduite à la largeur de la page.
+            img = get_image_cache().get(url, w if w > 0 else self.epw)
             x_pos = (self.w - w) / 2 if w > 0 else None
             self.image(img, x=x_pos, w=w)
+        except ImageUnavailable:
+            # Hors-ligne sans l'image en cache : la fiche est produite sans illustration.
+            return
         except Exception as e:
+            # Le détail de l'erreur va dans les logs, pas dans le document.
+            print(f"--- [PDF] Image indisponible ({url}) : {e} ---")
             self.set_font(PDF_FONT_FAMILY, 'I', 8)
-            self.cell(0, 10, f"[Image indisponible : {e}]")
+            self.cell(0, 10, "[Image indisponible]")
             self.ln()
 
 # --- Fonctions de construction pour chaque type de contenu ---
@@ -83,29 +88,55 @@ def build_ultimate_bravery_pdf(pdf, content):
     pdf.cell(0, 10, "Sorts d'Invocateur", 0, 1)
     for spell in content.get('summoner_spells', []):
          pdf.cell(0, 10, f"- {spell.get('name', '?')}", 0, 1)
+    if content.get('starting_item'):
+        pdf.cell(0, 10, f"Objet de départ: {content['starting_item'].get('name', '?')}", 0, 1)
     pdf.cell(0, 10, "Build Final", 0, 1)
     for item in content.get('final_build', []):
          pdf.cell(0, 10, f"- {item.get('name', '?')}", 0, 1)
+    if content.get('seed') is not None:
+        pdf.set_font(PDF_FONT_FAMILY, 'I', 8)
+        pdf.cell(0, 10, f"Graine: {content['seed']} (version {content.get('version', '?')})", 0, 1)
 
 def build_simple_text_pdf(pdf, content):
     pdf.chapter_title("Réponse de l'Assistant")
     text_content = content.get('content', str(content))
     pdf.chapter_body(text_content)
 
+def build_multi_tool_pdf(pdf, content):
+    """Réponse composée de plusieurs outils : une section (et une page) par résultat."""
+    for i, result in enumerate(content.get('results', [])):
+        if i > 0:
+            pdf.add_page()
+        inner = result.get('content')
+        if not isinstance(inner, dict):
+            inner = {"content": str(inner)}
+        PDF_BUILDERS.get(inner.get("type"), build_simple_text_pdf)(pdf, inner)
+
+PDF_BUILDERS = {
+    "character_sheet": build_character_sheet_pdf,
+    "draft_suggestion": build_draft_suggestion_pdf,
+    "ultimate_bravery": build_ultimate_bravery_pdf,
+    "multi_tool": build_multi_tool_pdf,
+    "simple_text": build_simple_text_pdf,
+}
+
 # --- Fonction principale du générateur ---
-@st.cache_data(show_spinner=False)
-def generate_pdf_from_content(content):
-    pdf = PDF()
-    pdf.add_page()
+def build_pdf(content):
+    """Construit le PDF d'un contenu (sans cache Streamlit : utilisable hors de l'application)."""
     content_type = content.get("type") if isinstance(content, dict) else "simple_text"
-    builders = {
-        "character_sheet": build_character_sheet_pdf,
-        "draft_suggestion": build_draft_suggestion_pdf,
-        "ultimate_bravery": build_ultimate_bravery_pdf,
-        "simple_text": build_simple_text_pdf,
-    }
-    builder_func = builders.get(content_type, build_simple_text_pdf)
-    builder_func(pdf, content)
-    # --- CORRECTION : On retourne directement le résultat de pdf.output() ---
-    return pdf.output()
+    with tracing.span("pdf_build", type=content_type):
+        pdf = PDF()
+        pdf.add_page()
+        builder_func = PDF_BUILDERS.get(content_type, build_simple_text_pdf)
+        builder_func(pdf, content)
+        # --- CORRECTION : On retourne directement le résultat de pdf.output() ---
+        return pdf.output()
 
+def generate_pdf_from_content(content):
+    """PDF d'un contenu, via le stockage des exports (construit une seule fois par contenu identique)."""
+    from artifact_store import get_artifact_store
+    store = get_artifact_store()
+    pdf_bytes = store.get_bytes(store.put(content))
+    image_cache = get_image_cache()
+    print(f"--- [PDF] Cache d'images : {image_cache.hit_rate():.0%} de hits, {image_cache.stats['bytes_saved'] / 1024:.0f} Ko économisés. ---")
+    return pdf_bytes
@@ -1,46 +1,359 @@
 # Fichier : rag_handler.py
-# Description : Version avancée avec un meilleur découpage et le MultiQueryRetriever.
+# Description : Version avancée avec un meilleur découpage et des stratégies de recherche configurables (voir retrieval.py).
+# Le moteur RAG est chargé une seule fois par processus et rechargé à chaud quand l'index change.
 
 import streamlit as st
-from langchain_community.document_loaders import DirectoryLoader
-from langchain.text_splitter import RecursiveCharacterTextSplitter
-from langchain_google_genai import GoogleGenerativeAIEmbeddings
-from langchain_community.vectorstores import FAISS
 from langchain.chains import RetrievalQA
 from langchain_google_genai import GoogleGenerativeAI
 from langchain.prompts import PromptTemplate
-from langchain.retrievers.multi_query import MultiQueryRetriever
 import os
+import shutil
+import threading
+import time
+
+import tracing
+from single_flight import get_group, normalize_question
+from embedding_backends import GEMINI_EMBEDDING_MODEL, CachedQueryEmbeddings, embedding_model_id, make_embeddings
+from embedding_pipeline import CachedBatchEmbeddings
+from retrieval import STRATEGIES, BM25Index, LatencyModel, RetrievalTimer, documents_of, make_retriever
+from vector_store import DOCSTORE_FILE, INDEX_FILE, current_files_path, legacy_index_state, load_vector_store, load_working_copy, migrate_legacy_index, new_working_copy, save_vector_store
+from champion_relations import RELATIONS_PRECOMPUTE, get_relations_table, precompute_relations
+from lol_api import get_all_champions_list
+from ingestion import EMBED_BATCH_CHUNKS, INGEST_WORKERS, IngestionProgress, discover_files, iter_file_chunks
+from index_manifest import chunk_ids, hash_file, is_compatible, load_manifest, new_manifest, plan_update, save_manifest
 
 FAISS_INDEX_PATH = "faiss_index"
+KNOWLEDGE_BASE_PATH = "knowledge_base"
+CHUNK_SIZE = 800
+CHUNK_OVERLAP = 150
+INDEX_FILES = (INDEX_FILE, DOCSTORE_FILE)
+# Backend d'embedding des nouveaux index (EMBEDDING_BACKEND) ; un index existant garde celui de son manifeste.
+EMBEDDING_MODEL = embedding_model_id()
+RAG_LLM_MODEL = "gemini-1.5-flash"
+# Stratégie de recherche : "similarity", "mmr", "hybrid", "multi_query", ou "auto" (choix selon le budget de latence).
+RAG_RETRIEVAL_STRATEGY = os.getenv("RAG_RETRIEVAL_STRATEGY", "multi_query")
+RAG_LATENCY_BUDGET = float(os.getenv("RAG_LATENCY_BUDGET", "1.0"))
+
+# Notre Prompt Template en français pour guider l'IA
+PROMPT_TEMPLATE = """
+    Contexte:
+    {context}
+    Basé **uniquement** sur le contexte ci-dessus, réponds de manière détaillée et en français à la question suivante.
+    Si le contexte ne contient pas la réponse, dis simplement "D'après mes documents, je n'ai pas d'information à ce sujet.".
+
+    Question: {question}
+
+    Réponse en français:"""
+
+
+def index_needs_rebuild(index_path=FAISS_INDEX_PATH):
+    """Vrai si seul un ancien index sans vecteurs (index.pkl) est présent : il faut reconstruire la base."""
+    return get_index_generation(index_path) is None and legacy_index_state(index_path) == "rebuild"
+
+
+def get_index_generation(index_path=FAISS_INDEX_PATH):
+    """Retourne la génération de l'index (mtime le plus récent des fichiers de sa version courante), ou None s'il est absent."""
+    files_path = current_files_path(index_path)
+    mtimes = []
+    for file_name in INDEX_FILES:
+        file_path = os.path.join(files_path, file_name)
+        if not os.path.exists(file_path):
+            return None
+        mtimes.append(os.stat(file_path).st_mtime_ns)
+    return max(mtimes)
+
+
+def index_embedding_model(index_path=FAISS_INDEX_PATH):
+    """Modèle d'embedding avec lequel l'index a été construit (Gemini pour les index antérieurs au manifeste)."""
+    manifest = load_manifest(index_path)
+    return (manifest or {}).get("settings", {}).get("embedding_model", GEMINI_EMBEDDING_MODEL)
+
+
+def save_index(db, index_path=FAISS_INDEX_PATH):
+    """Sauvegarde l'index (type FAISS choisi selon la taille, docstore SQLite) ; retourne le type d'index utilisé."""
+    return save_vector_store(db, index_path, work_path=f"{index_path}.tmp")
+
+
+class RAGEngine:
+    """
+    Moteur RAG longue durée : embeddings, index FAISS, LLM et chaîne QA sont construits une fois
+    et partagés entre sessions et threads. L'index est rechargé dès que sa génération change.
+    """
+
+    def __init__(self, api_key, index_path=FAISS_INDEX_PATH, embeddings=None, llm=None):
+        self.api_key = api_key
+        self.index_path = index_path
+        # Embeddings et LLM peuvent être fournis (doublures locales des benchmarks) ; sinon ceux de Gemini.
+        self.embeddings = embeddings
+        self.llm_override = llm
+        self.query_embeddings = None
+        self.generation = None
+        self.db = None
+        self.llm = None
+        self._bm25 = None
+        self._chains = {}
+        self._lock = threading.Lock()
+        # Les compteurs sont mis à jour par les sessions Streamlit et les threads de pré-calcul en même temps.
+        self._stats_lock = threading.Lock()
+        self.latency = LatencyModel()
+        self.stats = {
+            "loads": 0,
+            "queries": 0,
+            "last_load_seconds": None,
+            "last_query_seconds": None,
+            "total_load_seconds": 0.0,
+            "total_query_seconds": 0.0,
+            "last_strategy": None,
+            "last_retrieval_seconds": None,
+            "strategies": {},
+        }
+
+    def _load(self, generation):
+        start = time.perf_counter()
+        model_id = index_embedding_model(self.index_path)
+        # Le cache des vecteurs de questions survit aux rechargements tant que le modèle ne change pas.
+        if self.query_embeddings is None or self.query_embeddings.model_id != model_id:
+            embeddings = self.embeddings or make_embeddings(model_id, api_key=self.api_key)
+            self.query_embeddings = CachedQueryEmbeddings(embeddings, model_id=model_id)
+        # Index en mémoire mappée (pages partagées entre processus), texte des chunks lu dans SQLite à la demande.
+        db = load_vector_store(self.index_path, self.query_embeddings)
+        llm = self.llm_override or GoogleGenerativeAI(model=RAG_LLM_MODEL, google_api_key=self.api_key, temperature=0.3)
+        # Les chaînes (et l'index BM25) de chaque stratégie sont construites à la première utilisation.
+        self.db, self.llm, self._bm25, self._chains, self.generation = db, llm, None, {}, generation
+        elapsed = time.perf_counter() - start
+        with self._stats_lock:
+            self.stats["loads"] += 1
+            self.stats["last_load_seconds"] = elapsed
+            self.stats["total_load_seconds"] += elapsed
+        print(f"--- [RAG] Index chargé (génération {generation}) en {elapsed:.2f}s. ---")
+
+    def _build_chain(self, strategy):
+        if strategy == "hybrid" and self._bm25 is None:
+            self._bm25 = BM25Index(documents_of(self.db))
+        retriever = make_retriever(strategy, self.db, llm=self.llm, bm25=self._bm25)
+
+        # Création de la chaîne de Question/Réponse
+        return RetrievalQA.from_chain_type(
+            llm=self.llm,
+            chain_type="stuff",
+            retriever=retriever,
+            return_source_documents=True,
+            chain_type_kwargs={"prompt": PromptTemplate.from_template(PROMPT_TEMPLATE)}
+        )
+
+    def get_chain(self, strategy=None):
+        """Retourne la chaîne QA de la stratégie demandée, en (re)chargeant l'index si besoin."""
+        strategy = self.choose_strategy(strategy)
+        if strategy not in STRATEGIES:
+            raise ValueError(f"Stratégie de recherche inconnue : {strategy}")
+        generation = get_index_generation(self.index_path)
+        if generation is None:
+            raise FileNotFoundError(self.index_path)
+        qa_chain = self._chains.get(strategy)
+        if qa_chain is not None and generation == self.generation:
+            return qa_chain
+        with self._lock:
+            # Un autre thread a peut-être déjà rechargé pendant qu'on attendait le verrou.
+            if self.db is None or generation != self.generation:
+                with tracing.span("rag_load", generation=generation):
+                    self._load(generation)
+            if strategy not in self._chains:
+                self._chains[strategy] = self._build_chain(strategy)
+            return self._chains[strategy]
+
+    def choose_strategy(self, strategy=None, latency_budget=None):
+        """Stratégie explicite, sinon celle de la configuration ; "auto" ou un budget (en secondes) laisse choisir le modèle de latence."""
+        strategy = strategy or RAG_RETRIEVAL_STRATEGY
+        if latency_budget is None and strategy == "auto":
+            latency_budget = RAG_LATENCY_BUDGET
+        if latency_budget is not None:
+            return self.latency.choose(latency_budget)
+        return strategy
+
+    def query(self, question: str, strategy=None, latency_budget=None):
+        """Exécute la chaîne QA et retourne le résultat brut (réponse + documents sources)."""
+        strategy = self.choose_strategy(strategy, latency_budget)
+        with tracing.span("rag_query", strategy=strategy):
+            # La même question posée en même temps par plusieurs sessions n'interroge la chaîne qu'une fois.
+            key = (self.index_path, strategy, normalize_question(question))
+            return get_group("rag").do(key, lambda: self._query(question, strategy))
+
+    def _query(self, question, strategy):
+        qa_chain = self.get_chain(strategy)
+        timer = RetrievalTimer(strategy=strategy)
+        start = time.perf_counter()
+        result = qa_chain.invoke({"query": question}, config={"callbacks": [timer]})
+        elapsed = time.perf_counter() - start
+        self.latency.observe(strategy, timer.elapsed)
+        with self._stats_lock:
+            self.stats["queries"] += 1
+            self.stats["last_query_seconds"] = elapsed
+            self.stats["total_query_seconds"] += elapsed
+            self.stats["last_strategy"] = strategy
+            self.stats["last_retrieval_seconds"] = timer.elapsed
+            self.stats["strategies"][strategy] = self.stats["strategies"].get(strategy, 0) + 1
+        return result
+
+
+@st.cache_resource
+def get_rag_engine():
+    """Moteur RAG unique pour tout le processus (partagé entre les sessions Streamlit)."""
+    # Un index encore au format save_local (index.faiss + index.pkl) est converti une fois, sans ré-embedding.
+    migrate_legacy_index(FAISS_INDEX_PATH)
+    return RAGEngine(api_key=st.secrets["GEMINI_API_KEY"])
+
+
+def make_index_embeddings(api_key, model_id=EMBEDDING_MODEL):
+    """Embeddings utilisés à la construction : lots concurrents, reprises et cache disque des vecteurs."""
+    return CachedBatchEmbeddings(make_embeddings(model_id, api_key=api_key), model_name=model_id)
+
+
+def build_index(embeddings, incremental=True, index_path=FAISS_INDEX_PATH, base_path=KNOWLEDGE_BASE_PATH, log=print,
+                embedding_model=EMBEDDING_MODEL, progress=None, workers=INGEST_WORKERS):
+    """
+    Construit ou met à jour l'index FAISS. En mode incrémental, seuls les fichiers nouveaux ou
+    modifiés sont relus, seuls les chunks absents de l'index sont embeddés, et les vecteurs des
+    chunks disparus sont supprimés. Les fichiers sont découpés en parallèle et leurs chunks embeddés
+    par lots au fil de l'eau ; `progress(IngestionProgress)` suit l'avancement.
+    Retourne un rapport des fichiers et chunks ajoutés/ignorés/supprimés.
+    """
+    # Le modèle d'embedding fait partie du manifeste : en changer force une reconstruction complète.
+    settings = {"embedding_model": embedding_model, "chunk_size": CHUNK_SIZE, "chunk_overlap": CHUNK_OVERLAP, "index_format": "faiss+sqlite"}
+    work_path = f"{index_path}.tmp"
+    manifest = load_manifest(index_path) if incremental else None
+    db = None
+    if manifest is not None and is_compatible(manifest, settings) and get_index_generation(index_path) is not None:
+        db = load_working_copy(index_path, embeddings, work_path)
+    else:
+        # Pas de manifeste exploitable : on repart de zéro.
+        manifest = new_manifest(settings)
+
+    file_hashes = {path: hash_file(path) for path in discover_files(base_path)}
+    plan = plan_update(manifest, file_hashes)
+    log(f"{len(file_hashes)} fichier(s) : {len(plan['added'])} nouveau(x), {len(plan['changed'])} modifié(s), "
+        f"{len(plan['unchanged'])} inchangé(s), {len(plan['removed'])} supprimé(s).")
+
+    known_ids = set(db.index_to_docstore_id.values()) if db is not None else set()
+    report = {
+        "files_added": len(plan["added"]), "files_changed": len(plan["changed"]),
+        "files_unchanged": len(plan["unchanged"]), "files_removed": len(plan["removed"]),
+        "chunks_added": 0, "chunks_skipped": 0, "chunks_removed": 0,
+    }
+
+    stale_ids = []
+    for path in plan["removed"]:
+        stale_ids.extend(manifest["files"].pop(path)["chunks"])
+    for path in plan["unchanged"]:
+        report["chunks_skipped"] += len(manifest["files"][path]["chunks"])
+
+    to_parse = plan["added"] + plan["changed"]
+    tracker = IngestionProgress(len(to_parse), callback=progress)
+    batch_docs, batch_ids = [], []
+
+    def embed_batch():
+        # Les chunks d'un lot sont embeddés puis écrits dans le docstore SQLite de travail : seul le lot reste en mémoire.
+        nonlocal db
+        vectors = embeddings.embed_documents([doc.page_content for doc in batch_docs])
+        if db is None:
+            db = new_working_copy(embeddings, len(vectors[0]), work_path)
+        db.add_embeddings(
+            [(doc.page_content, vector) for doc, vector in zip(batch_docs, vectors)],
+            metadatas=[doc.metadata for doc in batch_docs], ids=list(batch_ids),
+        )
+        report["chunks_added"] += len(batch_docs)
+        tracker.batch_embedded(len(batch_docs))
+        batch_docs.clear()
+        batch_ids.clear()
+
+    for path, chunks in iter_file_chunks(to_parse, CHUNK_SIZE, CHUNK_OVERLAP, workers=workers):
+        ids = chunk_ids(path, chunks)
+        for chunk_id, doc in zip(ids, chunks):
+            if chunk_id in known_ids:
+                report["chunks_skipped"] += 1
+            else:
+                batch_docs.append(doc)
+                batch_ids.append(chunk_id)
+        old_ids = manifest["files"].get(path, {}).get("chunks", [])
+        stale_ids.extend(set(old_ids) - set(ids))
+        manifest["files"][path] = {"hash": file_hashes[path], "chunks": ids}
+        tracker.file_done(path, len(chunks))
+        if len(batch_docs) >= EMBED_BATCH_CHUNKS:
+            embed_batch()
+    if batch_docs:
+        embed_batch()
+
+    # On ne supprime que ce qui est réellement dans l'index (le manifeste peut être en retard sur l'index).
+    stale_ids = [chunk_id for chunk_id in stale_ids if chunk_id in known_ids]
+    if stale_ids:
+        db.delete(stale_ids)
+    if isinstance(embeddings, CachedBatchEmbeddings):
+        report["embedding_cache"] = dict(embeddings.stats)
+    report["chunks_removed"] = len(stale_ids)
+    report["ingestion_seconds"] = tracker.elapsed
+
+    if db is None:
+        log("Aucun chunk à indexer.")
+        return report
+    if report["chunks_added"] or stale_ids:
+        # Le moteur partagé détecte la nouvelle génération et recharge l'index à la prochaine question.
+        report["index_type"] = save_index(db, index_path)
+        log(f"Index FAISS : {report['index_type']} ({len(db.index_to_docstore_id)} chunks).")
+    else:
+        shutil.rmtree(work_path, ignore_errors=True)
+    save_manifest(manifest, index_path)
+    if to_parse:
+        log(f"Ingestion : {tracker.summary()}.")
+    log(f"Chunks : {report['chunks_added']} ajouté(s), {report['chunks_skipped']} ignoré(s), {report['chunks_removed']} supprimé(s).")
+    if "embedding_cache" in report:
+        cache_stats = report["embedding_cache"]
+        log(f"Embeddings : {cache_stats['hits']} depuis le cache, {cache_stats['misses']} calculé(s) en {cache_stats['batches']} lot(s).")
+    return report
+
+
+def create_vector_store(incremental=True):
+    """Découpe les documents en parallèle, crée les embeddings par lots et sauvegarde l'index FAISS, avec une barre de progression."""
 
-def create_vector_store():
-    """Charge les documents, les divise, crée les embeddings et sauvegarde l'index FAISS."""
-    
     if "GEMINI_API_KEY" not in st.secrets:
         st.error("Clé API Gemini non trouvée. Veuillez la configurer.")
         st.stop()
-    
-    st.write("Démarrage de l'indexation de la base de connaissances...")
-    
-    # Charge les .txt ET les .pdf
-    loader = DirectoryLoader('./knowledge_base/', glob="**/*[.txt,.pdf]")
-    documents = loader.load()
-    st.write(f"{len(documents)} document(s) chargé(s).")
-
-    # Un meilleur découpage pour garder plus de contexte entre les morceaux
-    text_splitter = RecursiveCharacterTextSplitter(chunk_size=800, chunk_overlap=150)
-    texts = text_splitter.split_documents(documents)
-    st.write(f"Les documents ont été divisés en {len(texts)} morceaux (chunks).")
-
-    embeddings = GoogleGenerativeAIEmbeddings(model="models/embedding-001", google_api_key=st.secrets["GEMINI_API_KEY"])
-    
+
+    embeddings = make_index_embeddings(st.secrets["GEMINI_API_KEY"])
+    bar = st.progress(0.0, text="Démarrage de l'indexation de la base de connaissances...")
+
+    def show_progress(tracker):
+        current = os.path.basename(tracker.current or "")
+        bar.progress(tracker.fraction, text=f"{tracker.summary()} — {current}")
+
     try:
-        db = FAISS.from_documents(texts, embeddings)
-        db.save_local(FAISS_INDEX_PATH)
-        st.success("La base de connaissances a été créée et sauvegardée avec succès !")
+        report = build_index(embeddings, incremental=incremental, progress=show_progress)
+        bar.empty()
+        st.success(f"La base de connaissances a été créée et sauvegardée avec succès ! "
+                   f"({report['chunks_added']} chunk(s) ajouté(s), {report['chunks_skipped']} ignoré(s), "
+                   f"{report['chunks_removed']} supprimé(s) en {report['ingestion_seconds']:.1f}s)")
     except Exception as e:
+        bar.empty()
         st.error(f"Une erreur est survenue lors de la création de la base de données vectorielle : {e}")
+        return None
+    if RELATIONS_PRECOMPUTE:
+        report["relations"] = precompute_champion_relations()
+    return report
+
+
+def precompute_champion_relations():
+    """Pré-calcule les relations de tout le roster pour l'index actuel (les fiches les lisent ensuite directement)."""
+    generation = get_index_generation()
+    champions = get_all_champions_list()
+    if generation is None or not champions:
+        return None
+    bar = st.progress(0.0, text="Pré-calcul des relations des champions...")
+    relations = precompute_relations(
+        get_rag_engine(), {champion_id: data["name"] for champion_id, data in champions.items()}, generation,
+        get_relations_table(FAISS_INDEX_PATH),
+        progress=lambda done, total: bar.progress(done / total, text=f"Relations des champions : {done}/{total}"),
+    )
+    bar.empty()
+    st.info(f"Relations des champions : {relations['computed']} calculée(s), {relations['skipped']} déjà à jour, {relations['failed']} échec(s).")
+    return relations
 
 
 def query_rag_system(question: str) -> str:
@@ -48,43 +361,15 @@ def query_rag_system(question: str) -> str:
 
     if "GEMINI_API_KEY" not in st.secrets:
         return "Erreur : Clé API non configurée."
-    
-    if not os.path.exists(FAISS_INDEX_PATH):
-        return "Erreur : La base de connaissances (index FAISS) n'a pas encore été créée. Veuillez l'indexer d'abord."
-
-    embeddings = GoogleGenerativeAIEmbeddings(model="models/embedding-001", google_api_key=st.secrets["GEMINI_API_KEY"])
-    db = FAISS.load_local(FAISS_INDEX_PATH, embeddings, allow_dangerous_deserialization=True)
-    llm = GoogleGenerativeAI(model="gemini-1.5-flash", google_api_key=st.secrets["GEMINI_API_KEY"], temperature=0.3)
 
-    # On utilise le MultiQueryRetriever pour une recherche plus intelligente
-    retriever_from_llm = MultiQueryRetriever.from_llm(
-        retriever=db.as_retriever(search_kwargs={"k": 5}), llm=llm
-    )
-    
-    # Notre Prompt Template en français pour guider l'IA
-    prompt_template = """
-    Contexte:
-    {context}
-    Basé **uniquement** sur le contexte ci-dessus, réponds de manière détaillée et en français à la question suivante.
-    Si le contexte ne contient pas la réponse, dis simplement "D'après mes documents, je n'ai pas d'information à ce sujet.".
-    
-    Question: {question}
-    
-    Réponse en français:"""
-    
-    QA_CHAIN_PROMPT = PromptTemplate.from_template(prompt_template)
-
-    # Création de la chaîne de Question/Réponse
-    qa_chain = RetrievalQA.from_chain_type(
-        llm=llm,
-        chain_type="stuff",
-        retriever=retriever_from_llm, # On utilise notre nouveau retriever intelligent
-        return_source_documents=True,
-        chain_type_kwargs={"prompt": QA_CHAIN_PROMPT} 
-    )
+    # Le moteur est créé d'abord : il convertit un éventuel index au format précédent.
+    engine = get_rag_engine()
+    if get_index_generation() is None:
+        if legacy_index_state(FAISS_INDEX_PATH) == "rebuild":
+            return "Erreur : L'index de la base de connaissances est dans un ancien format illisible. Veuillez la reconstruire."
+        return "Erreur : La base de connaissances (index FAISS) n'a pas encore été créée. Veuillez l'indexer d'abord."
 
-    # On exécute la chaîne et on récupère le résultat
-    result = qa_chain.invoke({"query": question})
+    result = engine.query(question)
 
     # On affiche les sources dans le terminal pour le débogage
     print("\n--- Documents récupérés pour la question ---")
@@ -92,6 +377,9 @@ def query_rag_system(question: str) -> str:
         page_num = doc.metadata.get('page', '?')
         source_file = os.path.basename(doc.metadata.get('source', 'Inconnue'))
         print(f"  > [Fichier: {source_file}, Page: {page_num}] : \"{doc.page_content[:250].strip()}...\"")
+    print(f"  (stratégie : {engine.stats['last_strategy']} | chargement index : {engine.stats['last_load_seconds'] or 0:.2f}s | "
+          f"recherche : {engine.stats['last_retrieval_seconds']:.2f}s | requête : {engine.stats['last_query_seconds']:.2f}s | "
+          f"cache des questions : {engine.query_embeddings.hit_rate():.0%})")
     print("------------------------------------------\n")
 
-    return result["result"]
\ No newline at end of file
+    return result["result"]
@@ -0,0 +1,239 @@
+# Fichier : retrieval.py
+# Description : Stratégies de recherche configurables pour le RAG : similarité simple, MMR, multi-requêtes
+# (une génération LLM en plus) et hybride BM25 + vecteurs, calculé localement. Un budget de latence permet
+# de choisir automatiquement la stratégie la plus complète qui tient dans le budget.
+#
+# Évaluation hors-ligne (rappel@k et latence par stratégie) :
+#   python retrieval.py eval
+
+import math
+import re
+import sys
+import threading
+import time
+from collections import Counter
+from typing import Any
+
+import unidecode
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain_core.documents import Document
+from langchain_core.retrievers import BaseRetriever
+from langchain.retrievers.multi_query import MultiQueryRetriever
+
+import tracing
+
+RETRIEVAL_K = 5
+FETCH_K = 20
+STRATEGIES = ("similarity", "mmr", "hybrid", "multi_query")
+# De la plus complète à la moins chère : c'est l'ordre de préférence quand le budget le permet.
+PREFERENCE_ORDER = ("multi_query", "hybrid", "mmr", "similarity")
+# Latences de recherche estimées (en secondes) au démarrage, affinées ensuite par les mesures réelles.
+DEFAULT_LATENCY_ESTIMATES = {"similarity": 0.35, "mmr": 0.4, "hybrid": 0.4, "multi_query": 2.0}
+# Coûts supposés des appels distants, pour l'estimation de l'évaluation hors-ligne.
+ASSUMED_EMBEDDING_SECONDS = 0.3
+ASSUMED_LLM_SECONDS = 1.5
+
+
+def tokenize(text):
+    return [token for token in re.findall(r"\w+", unidecode.unidecode(text).lower()) if len(token) > 1]
+
+
+def documents_of(db):
+    """Tous les chunks d'un index FAISS LangChain, dans l'ordre de l'index."""
+    if hasattr(db.docstore, "documents_in_order"):
+        return db.docstore.documents_in_order()
+    return [db.docstore.search(doc_id) for doc_id in db.index_to_docstore_id.values()]
+
+
+def _doc_key(doc):
+    return (doc.metadata.get("source"), doc.metadata.get("page"), doc.page_content)
+
+
+class BM25Index:
+    """Index BM25 (Okapi) en mémoire sur les mêmes chunks que l'index vectoriel."""
+
+    def __init__(self, documents, k1=1.5, b=0.75):
+        self.documents = list(documents)
+        self.k1, self.b = k1, b
+        self.term_frequencies = [Counter(tokenize(doc.page_content)) for doc in self.documents]
+        self.lengths = [sum(tf.values()) for tf in self.term_frequencies]
+        self.avg_length = (sum(self.lengths) / len(self.lengths)) if self.lengths else 0.0
+        document_frequency = Counter()
+        self.postings = {}
+        for position, tf in enumerate(self.term_frequencies):
+            for term in tf:
+                document_frequency[term] += 1
+                self.postings.setdefault(term, []).append(position)
+        n = len(self.documents)
+        self.idf = {term: math.log(1 + (n - df + 0.5) / (df + 0.5)) for term, df in document_frequency.items()}
+
+    def search(self, query, k):
+        scores = Counter()
+        for term in set(tokenize(query)):
+            idf = self.idf.get(term)
+            if idf is None:
+                continue
+            for position in self.postings[term]:
+                tf = self.term_frequencies[position][term]
+                norm = self.k1 * (1 - self.b + self.b * self.lengths[position] / (self.avg_length or 1))
+                scores[position] += idf * tf * (self.k1 + 1) / (tf + norm)
+        return [(self.documents[position], score) for position, score in scores.most_common(k)]
+
+
+class HybridRetriever(BaseRetriever):
+    """Fusionne la recherche vectorielle FAISS et BM25 par fusion des rangs réciproques (RRF)."""
+
+    vectorstore: Any
+    bm25: Any
+    k: int = RETRIEVAL_K
+    fetch_k: int = FETCH_K
+    rrf_k: int = 60
+
+    def _get_relevant_documents(self, query, *, run_manager=None):
+        scores, documents = Counter(), {}
+        vector_hits = self.vectorstore.similarity_search(query, k=self.fetch_k)
+        keyword_hits = [doc for doc, _ in self.bm25.search(query, self.fetch_k)]
+        for hits in (vector_hits, keyword_hits):
+            for rank, doc in enumerate(hits):
+                key = _doc_key(doc)
+                documents.setdefault(key, doc)
+                scores[key] += 1.0 / (self.rrf_k + rank + 1)
+        return [documents[key] for key, _ in scores.most_common(self.k)]
+
+
+def make_retriever(strategy, db, llm=None, bm25=None, k=RETRIEVAL_K):
+    if strategy == "similarity":
+        return db.as_retriever(search_kwargs={"k": k})
+    if strategy == "mmr":
+        return db.as_retriever(search_type="mmr", search_kwargs={"k": k, "fetch_k": FETCH_K})
+    if strategy == "hybrid":
+        return HybridRetriever(vectorstore=db, bm25=bm25 if bm25 is not None else BM25Index(documents_of(db)), k=k)
+    if strategy == "multi_query":
+        # On utilise le MultiQueryRetriever pour une recherche plus intelligente
+        return MultiQueryRetriever.from_llm(retriever=db.as_retriever(search_kwargs={"k": k}), llm=llm)
+    raise ValueError(f"Stratégie de recherche inconnue : {strategy}")
+
+
+class RetrievalTimer(BaseCallbackHandler):
+    """
+    Mesure la durée de la recherche seule (hors génération) pendant l'exécution d'une chaîne,
+    et l'enregistre comme span "faiss_search" (avec `tags`) à la fin du retriever le plus externe.
+    """
+
+    def __init__(self, **tags):
+        self.starts = {}
+        self.elapsed = 0.0
+        self.tags = tags
+
+    def on_retriever_start(self, serialized, query, *, run_id, **kwargs):
+        self.starts[run_id] = time.perf_counter()
+
+    def on_retriever_end(self, documents, *, run_id, parent_run_id=None, **kwargs):
+        started = self.starts.pop(run_id, None)
+        if started is None:
+            return
+        # Les retrievers imbriqués (multi-requêtes) sont inclus dans le plus externe.
+        self.elapsed = max(self.elapsed, time.perf_counter() - started)
+        if parent_run_id not in self.starts:
+            tracing.record("faiss_search", time.perf_counter() - started, documents=len(documents), **self.tags)
+
+
+class LatencyModel:
+    """Latence de recherche attendue par stratégie (moyenne glissante des mesures)."""
+
+    def __init__(self, estimates=None, smoothing=0.3):
+        self.estimates = dict(estimates or DEFAULT_LATENCY_ESTIMATES)
+        self.smoothing = smoothing
+        self._lock = threading.Lock()
+
+    def observe(self, strategy, seconds):
+        with self._lock:
+            previous = self.estimates.get(strategy, seconds)
+            self.estimates[strategy] = (1 - self.smoothing) * previous + self.smoothing * seconds
+
+    def choose(self, budget_seconds):
+        """La stratégie la plus complète dont la latence attendue tient dans le budget, sinon la moins chère."""
+        with self._lock:
+            for strategy in PREFERENCE_ORDER:
+                if self.estimates[strategy] <= budget_seconds:
+                    return strategy
+            return min(self.estimates, key=self.estimates.get)
+
+
+# ───── ÉVALUATION HORS-LIGNE ─────
+EVAL_CORPUS = [
+    ("garen", "Garen est un fier guerrier de Demacia, membre de l'Avant-garde Intrépide. Sa sœur est Lux et il respecte Jarvan IV."),
+    ("lux", "Luxanna Crownguard, dite Lux, est une mage de lumière de Demacia qui cache ses pouvoirs. Son frère est Garen."),
+    ("darius", "Darius est la Main de Noxus, un commandant impitoyable. Son frère Draven adore la gloire des arènes."),
+    ("draven", "Draven, bourreau glorieux de Noxus, lance ses haches tournoyantes devant la foule. Il est le frère de Darius."),
+    ("heimer", "Heimerdinger est un yordle inventeur de Piltover, professeur à l'académie, qui construit des tourelles H-28G."),
+    ("jayce", "Jayce, défenseur de Piltover, manie le marteau Mercurial et rivalise avec Viktor de Zaun."),
+    ("viktor", "Viktor, héraut de la machine, veut faire évoluer l'humanité par la technologie hextech à Zaun."),
+    ("patch_garen", "Patch 14.12 : Garen voit les dégâts de Jugement augmentés et son bouclier de Courage réduit."),
+    ("patch_items", "Patch 14.12 : la Lame d'infini coûte 100 pièces d'or de moins, le Sablier de Zhonya gagne 5 de puissance."),
+    ("patch_jungle", "Patch 14.12 : le Baron Nashor a moins de points de vie et le Châtiment inflige 900 dégâts."),
+    ("strat_mid", "Stratégie : en voie du milieu, poussez la vague avant de roam pour aider la jungle sur les dragons."),
+    ("strat_bot", "Stratégie : en voie du bas, le tireur et le support doivent contrôler la vision autour du dragon."),
+]
+EVAL_QUERIES = [
+    ("Qui est la sœur de Garen ?", {"garen", "lux"}),
+    ("Quelle est la relation entre Darius et Draven ?", {"darius", "draven"}),
+    ("Qu'a inventé Heimerdinger à Piltover ?", {"heimer"}),
+    ("Quels changements pour Garen au patch 14.12 ?", {"patch_garen"}),
+    ("Le prix de la Lame d'infini a-t-il baissé ?", {"patch_items"}),
+    ("Combien de dégâts fait le Châtiment ?", {"patch_jungle"}),
+    ("Comment jouer le mid pour aider la jungle ?", {"strat_mid"}),
+    ("Qui est le rival de Jayce ?", {"jayce", "viktor"}),
+]
+
+
+def evaluate(k=3):
+    """Rappel@k, latence locale mesurée et latence estimée (appels distants compris) de chaque stratégie."""
+    from langchain_community.vectorstores import FAISS
+    from langchain_core.language_models import FakeListLLM
+    from fakes import HashingEmbeddings
+
+    embeddings = HashingEmbeddings()
+    documents = [Document(page_content=text, metadata={"id": doc_id, "source": doc_id}) for doc_id, text in EVAL_CORPUS]
+    db = FAISS.from_documents(documents, embeddings)
+    bm25 = BM25Index(documents_of(db))
+    report = {}
+    for strategy in STRATEGIES:
+        # Le faux LLM reformule la question en trois variantes (une seule génération par question).
+        llm = FakeListLLM(responses=[f"{q}\n{q.replace('?', '')}\n{' '.join(tokenize(q))}" for q, _ in EVAL_QUERIES])
+        retriever = make_retriever(strategy, db, llm=llm, bm25=bm25, k=k)
+        recalls, elapsed = [], 0.0
+        query_calls_before = embeddings.calls["queries"]
+        for question, relevant in EVAL_QUERIES:
+            started = time.perf_counter()
+            hits = retriever.invoke(question)
+            elapsed += time.perf_counter() - started
+            found = {doc.metadata["id"] for doc in hits}
+            recalls.append(len(found & relevant) / len(relevant))
+        embedding_calls = (embeddings.calls["queries"] - query_calls_before) / len(EVAL_QUERIES)
+        llm_calls = 1 if strategy == "multi_query" else 0
+        local_ms = elapsed * 1000 / len(EVAL_QUERIES)
+        report[strategy] = {
+            "recall_at_k": sum(recalls) / len(recalls),
+            "local_ms": local_ms,
+            "embedding_calls": embedding_calls,
+            "llm_calls": llm_calls,
+            "estimated_seconds": local_ms / 1000 + embedding_calls * ASSUMED_EMBEDDING_SECONDS + llm_calls * ASSUMED_LLM_SECONDS,
+        }
+    return report
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    if argv[:1] != ["eval"]:
+        print("Usage : python retrieval.py eval")
+        return 2
+    k = 3
+    print(f"{'stratégie':<12} {'rappel@' + str(k):>9} {'local (ms)':>11} {'embeddings':>11} {'LLM':>4} {'estimé (s)':>11}")
+    for strategy, row in evaluate(k=k).items():
+        print(f"{strategy:<12} {row['recall_at_k']:>9.2f} {row['local_ms']:>11.2f} {row['embedding_calls']:>11.1f} {row['llm_calls']:>4} {row['estimated_seconds']:>11.2f}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
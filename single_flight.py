@@ -0,0 +1,186 @@
+# Fichier : single_flight.py
+# Description : Regroupement des requêtes identiques en cours ("single flight"). Quand plusieurs sessions
+# demandent la même chose au même moment (ex. le même champion juste après un patch), seul le premier appelant
+# fait le travail (téléchargement Data Dragon, question RAG, appel d'outil au LLM) ; les autres attendent
+# son résultat au lieu de relancer le même appel. Les caches ne suffisent pas : ils ne voient pas le travail en cours.
+#
+#   python single_flight.py check [-n 32]
+
+import argparse
+import itertools
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import tracing
+
+
+class _Call:
+    __slots__ = ("done", "result", "error")
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """Exécute `func` une seule fois par clé parmi les appels simultanés ; les appels suivants reçoivent le même résultat (ou la même erreur)."""
+
+    def __init__(self, name):
+        self.name = name
+        self._calls = {}
+        self._lock = threading.Lock()
+        self.stats = {"calls": 0, "executed": 0, "coalesced": 0, "errors": 0}
+
+    def do(self, key, func):
+        with self._lock:
+            self.stats["calls"] += 1
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+            else:
+                self.stats["coalesced"] += 1
+        if not leader:
+            tracing.tag(coalesced=True)
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+        try:
+            call.result = func()
+            return call.result
+        except BaseException as e:
+            call.error = e
+            with self._lock:
+                self.stats["errors"] += 1
+            raise
+        finally:
+            # La clé est libérée avant de réveiller les suivants : un nouvel appel refait le travail (pas de cache ici).
+            with self._lock:
+                del self._calls[key]
+                self.stats["executed"] += 1
+            call.done.set()
+
+    def in_flight(self):
+        with self._lock:
+            return len(self._calls)
+
+
+_groups = {}
+_groups_lock = threading.Lock()
+
+
+def get_group(name):
+    """Groupe de regroupement partagé par tout le processus (un par type de requête)."""
+    with _groups_lock:
+        if name not in _groups:
+            _groups[name] = SingleFlight(name)
+        return _groups[name]
+
+
+def coalescing_stats():
+    """Compteurs de chaque groupe : appels, exécutions réelles, appels regroupés, erreurs."""
+    with _groups_lock:
+        groups = list(_groups.values())
+    return {group.name: dict(group.stats) for group in groups}
+
+
+def normalize_question(question):
+    """Clé d'une question libre : casse et espaces n'en changent pas le sens."""
+    return " ".join(question.split()).casefold()
+
+
+# ───── VÉRIFICATION ─────
+def _burst(count, func):
+    """Lance `count` appels simultanés (départ synchronisé) et retourne leurs résultats."""
+    barrier = threading.Barrier(count)
+
+    def call(_):
+        barrier.wait()
+        return func()
+
+    with ThreadPoolExecutor(max_workers=count) as pool:
+        return list(pool.map(call, range(count)))
+
+
+def check(count=32, delay=0.2):
+    """
+    Vérifie sur des backends simulés (lents, qui comptent leurs appels) que `count` requêtes identiques
+    simultanées ne font qu'un appel, pour chaque point d'intégration. Retourne la liste des échecs.
+    """
+    import tempfile
+
+    from ddragon_mirror import DDragonMirror
+    # Lancé en script, ce module est __main__ : les groupes utilisés par l'application sont ceux du module importé.
+    from single_flight import coalescing_stats as group_stats
+    from rag_handler import RAGEngine
+    from tool_cache import ToolResultCache
+
+    backend_calls = {"ddragon": 0, "rag": 0, "tool": 0}
+    calls_lock = threading.Lock()
+
+    def slow_backend(name, value):
+        with calls_lock:
+            backend_calls[name] += 1
+        time.sleep(delay)
+        return value
+
+    class StubResponse:
+        status_code = 200
+        headers = {}
+        content = b'{"Garen": {"name": "Garen"}}'
+
+        def raise_for_status(self):
+            pass
+
+        def json(self):
+            return {"Garen": {"name": "Garen"}}
+
+    class StubSession:
+        def get(self, url, headers=None, timeout=None):
+            return slow_backend("ddragon", StubResponse())
+
+    class StubChain:
+        def invoke(self, inputs, config=None):
+            return slow_backend("rag", {"result": f"Réponse à : {inputs['query']}", "source_documents": []})
+
+    failures = []
+    with tempfile.TemporaryDirectory() as workdir:
+        mirror = DDragonMirror(root=workdir, offline=False, session=StubSession())
+        engine = RAGEngine(api_key="")
+        engine.get_chain = lambda strategy=None: StubChain()
+        cache = ToolResultCache(path=f"{workdir}/tool_results.sqlite")
+        variants = itertools.count()
+        scenarios = [
+            ("ddragon", lambda: mirror.fetch_json("cdn/0.0.1/data/fr_FR/champion.json")),
+            # Même question à la casse et aux espaces près : une seule question au moteur.
+            ("rag", lambda: engine.query("Qui est Garen ?" if next(variants) % 2 else "qui  est GAREN ?", strategy="similarity")),
+            ("tool", lambda: cache.get_or_compute("compare", {"a": "Garen", "b": "Darius"}, lambda: slow_backend("tool", "Analyse."),
+                                                  model_name="stub", prompt_template="stub", version="1")),
+        ]
+        for name, func in scenarios:
+            results = _burst(count, func)
+            distinct = {repr(result) for result in results}
+            ok = backend_calls[name] == 1 and len(distinct) == 1
+            print(f"  {'✓' if ok else '✗'} {name} : {count} requête(s) simultanée(s) -> {backend_calls[name]} appel(s) au backend")
+            if not ok:
+                failures.append(name)
+    for name, stats in sorted(group_stats().items()):
+        print(f"  {name} : {stats['calls']} appel(s), {stats['executed']} exécuté(s), {stats['coalesced']} regroupé(s), {stats['errors']} erreur(s)")
+    return failures
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Vérification du regroupement des requêtes identiques simultanées.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    check_parser = subparsers.add_parser("check")
+    check_parser.add_argument("-n", "--count", type=int, default=32, help="Requêtes identiques lancées en même temps.")
+    args = parser.parse_args(argv)
+    return 1 if check(args.count) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,91 @@
+# Fichier : smite_game.py
+# Description : Logique du mini-jeu de Châtiment. La partie est entièrement déterminée au lancement
+# (calendrier des DPS du Baron) ; l'animation tourne dans le navigateur (composant components/smite),
+# et le serveur n'intervient que pour lancer la partie et juger le Châtiment à partir du temps écoulé.
+
+import math
+import os
+import random
+import time
+import uuid
+
+import streamlit.components.v1 as components
+
+TOTAL_HEALTH = 5000
+SMITE_DAMAGE = 900
+PERFECT_MARGIN = 25
+SUCCESS_MARGIN = 120
+# Écart toléré entre le temps du navigateur et celui du serveur (affichage du composant, aller-retour réseau).
+CLIENT_LATENCY_TOLERANCE = 1.5
+SMITE_COMPONENT_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "components", "smite")
+
+_smite_component = components.declare_component("smite_game", path=SMITE_COMPONENT_PATH)
+
+
+def new_game(seed=None):
+    """
+    Tire une partie : liste de segments [début (s), DPS] jusqu'à la mort du Baron, avec les mêmes
+    règles que l'ancienne boucle serveur (350-550 DPS au départ, puis des bursts de 200 à 750 DPS).
+    """
+    rng = random.Random(seed)
+    schedule = [[0.0, rng.randint(350, 550)]]
+    next_change = rng.uniform(1.5, 3.0)
+    health = TOTAL_HEALTH
+    while True:
+        start, dps = schedule[-1]
+        health -= (next_change - start) * dps
+        if health <= 0:
+            break
+        schedule.append([round(next_change, 3), rng.randint(200, 750)])
+        next_change += rng.uniform(1.0, 2.5)
+    # `armed_at` : lancement mesuré côté serveur ; il n'est pas envoyé au navigateur.
+    return {"game_id": uuid.uuid4().hex, "total_health": TOTAL_HEALTH, "smite_damage": SMITE_DAMAGE, "schedule": schedule,
+            "armed_at": time.monotonic()}
+
+
+def health_at(game, elapsed):
+    """PV du Baron `elapsed` secondes après le début (même calcul que dans le navigateur)."""
+    health = game["total_health"]
+    schedule = game["schedule"]
+    for i, (start, dps) in enumerate(schedule):
+        if elapsed <= start:
+            break
+        end = schedule[i + 1][0] if i + 1 < len(schedule) else float("inf")
+        health -= (min(elapsed, end) - start) * dps
+    return max(0.0, health)
+
+
+def accepted_elapsed(game, event, now=None):
+    """
+    Temps écoulé retenu pour juger : celui annoncé par le navigateur, borné par l'intervalle mesuré côté serveur
+    depuis le lancement. Un client ne peut pas annoncer plus de temps qu'il ne s'en est écoulé, ni beaucoup moins.
+    """
+    server_elapsed = (time.monotonic() if now is None else now) - game["armed_at"]
+    try:
+        claimed = float(event.get("elapsed", 0))
+    except (TypeError, ValueError):
+        claimed = server_elapsed
+    if not math.isfinite(claimed):
+        claimed = server_elapsed
+    return min(max(claimed, server_elapsed - CLIENT_LATENCY_TOLERANCE), server_elapsed)
+
+
+def verdict(game, event, now=None):
+    """Message de résultat pour l'événement renvoyé par le navigateur ({"event": "smite"|"dead", "elapsed": s})."""
+    if event.get("event") == "dead":
+        return "Le Baron est mort sans votre aide. Dommage !"
+    health_when_smited = health_at(game, accepted_elapsed(game, event, now))
+    if health_when_smited > game["smite_damage"]:
+        return f"🤔 **Trop tôt !** Vous avez châtié à {int(health_when_smited)} PV. Le Châtiment n'aurait pas tué le Baron !"
+    diff = game["smite_damage"] - health_when_smited
+    if diff <= PERFECT_MARGIN:
+        return f"🎉 **Smite PARFAIT !** Vous avez châtié à {int(health_when_smited)} PV (différence: {int(diff)}). Vous êtes le roi de la jungle !"
+    if diff <= SUCCESS_MARGIN:
+        return f"👍 **Excellent Châtiment !** Vous avez châtié à {int(health_when_smited)} PV. L'objectif est sécurisé !"
+    return f"😭 **Trop tard !** Vous avez châtié à {int(health_when_smited)} PV. L'ennemi a eu le temps de le voler !"
+
+
+def smite_component(game, key, on_change=None):
+    """Affiche la partie dans le navigateur ; retourne l'événement final ({"game_id", "event", "elapsed"}) ou None."""
+    client_game = {name: value for name, value in game.items() if name != "armed_at"}
+    return _smite_component(game=client_game, key=key, default=None, on_change=on_change)
@@ -0,0 +1,121 @@
+# Fichier : tool_cache.py
+# Description : Cache persistant (SQLite) des résultats des outils qui appellent un LLM
+# (comparaison, draft, relations). Limite de taille LRU, durée de vie, compteurs et contournement.
+
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+
+import streamlit as st
+
+import tracing
+from single_flight import get_group
+
+TOOL_CACHE_PATH = os.getenv("TOOL_CACHE_PATH", os.path.join(".cache", "tool_results.sqlite"))
+TOOL_CACHE_MAX_ENTRIES = int(os.getenv("TOOL_CACHE_MAX_ENTRIES", "5000"))
+TOOL_CACHE_TTL_SECONDS = int(os.getenv("TOOL_CACHE_TTL_SECONDS", str(7 * 86400)))
+# Contournement global (ex. pour comparer les réponses sans cache).
+TOOL_CACHE_BYPASS = os.getenv("TOOL_CACHE_BYPASS", "0") == "1"
+
+
+def template_hash(template):
+    return hashlib.sha256(template.encode("utf-8")).hexdigest()[:16]
+
+
+def make_key(tool, args, model_name, prompt_template, version):
+    """Clé stable : outil, arguments normalisés, modèle, empreinte du prompt et version des données."""
+    payload = json.dumps({
+        "tool": tool, "args": args, "model": model_name,
+        "prompt": template_hash(prompt_template), "version": str(version),
+    }, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class ToolResultCache:
+    def __init__(self, path=TOOL_CACHE_PATH, max_entries=TOOL_CACHE_MAX_ENTRIES, ttl_seconds=TOOL_CACHE_TTL_SECONDS):
+        self.path = path
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=10)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS results (key TEXT PRIMARY KEY, tool TEXT NOT NULL, value TEXT NOT NULL, "
+            "created_at REAL NOT NULL, last_access REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS results_last_access ON results (last_access)")
+        self._conn.commit()
+        self.stats = {"hits": 0, "misses": 0, "expired": 0, "evictions": 0, "bypassed": 0}
+
+    def get(self, key):
+        """Retourne la valeur en cache, ou None si absente ou expirée."""
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute("SELECT value, created_at FROM results WHERE key = ?", (key,)).fetchone()
+            if row is not None and now - row[1] > self.ttl_seconds:
+                self._conn.execute("DELETE FROM results WHERE key = ?", (key,))
+                self._conn.commit()
+                self.stats["expired"] += 1
+                row = None
+            if row is None:
+                self.stats["misses"] += 1
+                return None
+            self._conn.execute("UPDATE results SET last_access = ? WHERE key = ?", (now, key))
+            self._conn.commit()
+            self.stats["hits"] += 1
+            return json.loads(row[0])
+
+    def put(self, key, tool, value):
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO results (key, tool, value, created_at, last_access) VALUES (?, ?, ?, ?, ?)",
+                (key, tool, json.dumps(value, ensure_ascii=False), now, now),
+            )
+            overflow = self._conn.execute("SELECT COUNT(*) FROM results").fetchone()[0] - self.max_entries
+            if overflow > 0:
+                self._conn.execute(
+                    "DELETE FROM results WHERE key IN (SELECT key FROM results ORDER BY last_access LIMIT ?)", (overflow,)
+                )
+                self.stats["evictions"] += overflow
+            self._conn.commit()
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute("DELETE FROM results")
+            self._conn.commit()
+
+    def get_or_compute(self, tool, args, compute, model_name, prompt_template, version, bypass=False, cacheable=None):
+        """
+        Sert le résultat depuis le cache ou l'obtient via `compute()` puis l'enregistre.
+        `cacheable(result)` permet d'écarter les réponses d'erreur ; `version=None` désactive le cache.
+        """
+        with tracing.span("tool_cache", tool=tool):
+            if bypass or TOOL_CACHE_BYPASS or version is None:
+                self.stats["bypassed"] += 1
+                tracing.tag(cache="bypass")
+                return compute()
+            key = make_key(tool, args, model_name, prompt_template, version)
+            # Un seul calcul par clé parmi les appels simultanés : les autres reçoivent son résultat.
+            return get_group("tool").do(key, lambda: self._get_or_compute(key, tool, compute, cacheable))
+
+    def _get_or_compute(self, key, tool, compute, cacheable):
+        cached = self.get(key)
+        if cached is not None:
+            tracing.tag(cache="hit")
+            return cached
+        tracing.tag(cache="miss")
+        result = compute()
+        if result is not None and (cacheable is None or cacheable(result)):
+            self.put(key, tool, result)
+        return result
+
+
+@st.cache_resource
+def get_tool_cache():
+    """Cache des résultats d'outils partagé par tout le processus."""
+    return ToolResultCache()
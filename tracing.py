@@ -0,0 +1,263 @@
+# Fichier : tracing.py
+# Description : Spans de temps structurés pour chaque étape d'un tour de chat (routage, appel au modèle,
+# outils, HTTP Data Dragon, recherche FAISS, construction PDF, rendu), avec étiquettes de cache (hit/miss).
+# Chaque tour terminé est ajouté en JSONL ; les durées alimentent des histogrammes exportés au format texte
+# de Prometheus (fichier, et endpoint HTTP optionnel).
+#
+#   TRACE_JSONL_PATH=.cache/traces.jsonl  METRICS_PATH=.cache/metrics.prom  METRICS_PORT=9464 (optionnel)
+
+import contextvars
+import json
+import os
+import threading
+import time
+import uuid
+from collections import defaultdict, deque
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+TRACING_ENABLED = os.getenv("TRACING", "1") == "1"
+TRACE_JSONL_PATH = os.getenv("TRACE_JSONL_PATH", os.path.join(".cache", "traces.jsonl"))
+TRACE_JSONL_MAX_BYTES = int(os.getenv("TRACE_JSONL_MAX_BYTES", str(20 * 1024 * 1024)))
+METRICS_PATH = os.getenv("METRICS_PATH", os.path.join(".cache", "metrics.prom"))
+METRICS_PORT = os.getenv("METRICS_PORT")
+METRICS_PREFIX = "heimerdinger"
+HISTOGRAM_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+# Fenêtre des dernières durées par étape, pour les percentiles affichés dans le panneau de débogage.
+RECENT_WINDOW = 500
+
+_current_trace = contextvars.ContextVar("current_trace", default=None)
+_current_span = contextvars.ContextVar("current_span", default=None)
+
+
+class Span:
+    def __init__(self, name, trace=None, parent=None, tags=None):
+        self.id = uuid.uuid4().hex[:16]
+        self.name = name
+        self.trace = trace
+        self.parent_id = parent.id if parent is not None else None
+        self.tags = dict(tags or {})
+        self.thread = threading.current_thread().name
+        self.started = time.perf_counter()
+        self.duration = None
+
+    def tag(self, **tags):
+        self.tags.update(tags)
+
+    def to_dict(self, trace_started):
+        return {
+            "id": self.id, "parent_id": self.parent_id, "name": self.name,
+            "start_ms": round((self.started - trace_started) * 1000, 3),
+            "duration_ms": round((self.duration or 0) * 1000, 3),
+            "thread": self.thread, "tags": self.tags,
+        }
+
+
+class Trace:
+    """Un tour de chat : la liste des spans terminés, éventuellement venus de plusieurs threads."""
+
+    def __init__(self, name, **tags):
+        self.id = uuid.uuid4().hex
+        self.name = name
+        self.tags = tags
+        self.started_at = time.time()
+        self.started = time.perf_counter()
+        self.duration = None
+        self.spans = []
+        self._lock = threading.Lock()
+
+    def add(self, span):
+        with self._lock:
+            self.spans.append(span)
+
+    def to_dict(self):
+        with self._lock:
+            spans = sorted(self.spans, key=lambda span: span.started)
+        return {
+            "trace_id": self.id, "name": self.name, "tags": self.tags,
+            "started_at": self.started_at,
+            "duration_ms": round((self.duration if self.duration is not None else time.perf_counter() - self.started) * 1000, 3),
+            "spans": [span.to_dict(self.started) for span in spans],
+        }
+
+    def breakdown(self):
+        """Spans du tour en arbre (chaque span suivi de ses enfants, par ordre de début), avec leur profondeur."""
+        spans = self.to_dict()["spans"]
+        known_ids = {span["id"] for span in spans}
+        children = defaultdict(list)
+        for span in spans:
+            # Un span dont le parent n'appartient pas au tour (parent encore ouvert, hors trace) devient une racine.
+            children[span["parent_id"] if span["parent_id"] in known_ids else None].append(span)
+        rows = []
+        def visit(parent_id, depth):
+            for span in children[parent_id]:
+                rows.append({**span, "depth": depth})
+                visit(span["id"], depth + 1)
+        visit(None, 0)
+        return rows
+
+
+class MetricsRegistry:
+    """Histogrammes des durées par (étape, étiquette de cache), au format texte Prometheus."""
+
+    def __init__(self, buckets=HISTOGRAM_BUCKETS):
+        self.buckets = buckets
+        self._lock = threading.Lock()
+        self._histograms = defaultdict(lambda: {"buckets": [0] * len(self.buckets), "sum": 0.0, "count": 0})
+        self._recent = defaultdict(lambda: deque(maxlen=RECENT_WINDOW))
+        self.traces = 0
+
+    def observe(self, name, seconds, cache=None):
+        with self._lock:
+            histogram = self._histograms[(name, cache or "")]
+            for i, bound in enumerate(self.buckets):
+                if seconds <= bound:
+                    histogram["buckets"][i] += 1
+            histogram["sum"] += seconds
+            histogram["count"] += 1
+            self._recent[name].append(seconds)
+
+    def percentiles(self):
+        """{étape: {"count", "p50", "p95"}} sur les dernières mesures (en secondes)."""
+        with self._lock:
+            recent = {name: sorted(values) for name, values in self._recent.items()}
+        return {
+            name: {"count": len(values), "p50": values[len(values) // 2], "p95": values[min(len(values) - 1, int(0.95 * len(values)))]}
+            for name, values in recent.items() if values
+        }
+
+    def render_prometheus(self):
+        metric = f"{METRICS_PREFIX}_span_seconds"
+        lines = [f"# HELP {metric} Durée des étapes d'un tour de chat.", f"# TYPE {metric} histogram"]
+        with self._lock:
+            for (name, cache), histogram in sorted(self._histograms.items()):
+                labels = f'span="{name}",cache="{cache}"'
+                for bound, count in zip(self.buckets, histogram["buckets"]):
+                    lines.append(f'{metric}_bucket{{{labels},le="{bound}"}} {count}')
+                lines.append(f'{metric}_bucket{{{labels},le="+Inf"}} {histogram["count"]}')
+                lines.append(f"{metric}_sum{{{labels}}} {histogram['sum']:.6f}")
+                lines.append(f"{metric}_count{{{labels}}} {histogram['count']}")
+            lines += [f"# HELP {METRICS_PREFIX}_traces_total Tours de chat tracés.",
+                      f"# TYPE {METRICS_PREFIX}_traces_total counter",
+                      f"{METRICS_PREFIX}_traces_total {self.traces}"]
+        return "\n".join(lines) + "\n"
+
+
+metrics = MetricsRegistry()
+_export_lock = threading.Lock()
+
+
+def current_span():
+    return _current_span.get()
+
+
+def tag(**tags):
+    """Ajoute des étiquettes au span courant (sans effet hors d'un span)."""
+    span = _current_span.get()
+    if span is not None:
+        span.tag(**tags)
+
+
+def _finish(span):
+    span.duration = time.perf_counter() - span.started
+    metrics.observe(span.name, span.duration, span.tags.get("cache"))
+    if span.trace is not None:
+        span.trace.add(span)
+
+
+@contextmanager
+def span(name, **tags):
+    """Mesure un bloc. Rattaché au tour courant s'il y en a un ; toujours compté dans les métriques."""
+    if not TRACING_ENABLED:
+        yield None
+        return
+    current = Span(name, trace=_current_trace.get(), parent=_current_span.get(), tags=tags)
+    token = _current_span.set(current)
+    try:
+        yield current
+    except Exception as e:
+        current.tag(error=type(e).__name__)
+        raise
+    finally:
+        _current_span.reset(token)
+        _finish(current)
+
+
+def record(name, seconds, **tags):
+    """Enregistre un span déjà mesuré ailleurs (ex. durée de recherche remontée par un callback), terminé maintenant."""
+    if not TRACING_ENABLED:
+        return
+    measured = Span(name, trace=_current_trace.get(), parent=_current_span.get(), tags=tags)
+    measured.started = time.perf_counter() - seconds
+    _finish(measured)
+
+
+@contextmanager
+def activate(trace):
+    """Rend un tour courant (y compris lors d'un rerun Streamlit qui le poursuit, ex. pour le rendu)."""
+    token = _current_trace.set(trace)
+    try:
+        yield trace
+    finally:
+        _current_trace.reset(token)
+
+
+def finish_trace(trace):
+    """Clôt le tour, l'ajoute au JSONL et met à jour le fichier de métriques."""
+    trace.duration = time.perf_counter() - trace.started
+    if not TRACING_ENABLED:
+        return trace
+    metrics.observe(trace.name, trace.duration)
+    with metrics._lock:
+        metrics.traces += 1
+    line = json.dumps(trace.to_dict(), ensure_ascii=False)
+    with _export_lock:
+        try:
+            os.makedirs(os.path.dirname(TRACE_JSONL_PATH) or ".", exist_ok=True)
+            if os.path.exists(TRACE_JSONL_PATH) and os.path.getsize(TRACE_JSONL_PATH) > TRACE_JSONL_MAX_BYTES:
+                os.replace(TRACE_JSONL_PATH, f"{TRACE_JSONL_PATH}.1")
+            with open(TRACE_JSONL_PATH, "a", encoding="utf-8") as f:
+                f.write(line + "\n")
+            write_metrics_file()
+        except OSError as e:
+            print(f"--- [TRACING] Export impossible : {e} ---")
+    return trace
+
+
+def write_metrics_file(path=METRICS_PATH):
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp_path = f"{path}.tmp.{os.getpid()}"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        f.write(metrics.render_prometheus())
+    os.replace(tmp_path, path)
+
+
+def propagate(func):
+    """Enveloppe `func` pour qu'elle s'exécute dans le contexte de traçage courant (à soumettre à un pool de threads)."""
+    context = contextvars.copy_context()
+    # Une copie par appel : un même contexte ne peut pas être actif dans deux threads à la fois.
+    return lambda *args, **kwargs: context.copy().run(func, *args, **kwargs)
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.rstrip("/") != "/metrics":
+            self.send_error(404)
+            return
+        body = metrics.render_prometheus().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_metrics_server(port):
+    """Expose /metrics (format Prometheus) sur un thread démon ; retourne le serveur."""
+    server = ThreadingHTTPServer(("0.0.0.0", int(port)), _MetricsHandler)
+    threading.Thread(target=server.serve_forever, name="metrics-server", daemon=True).start()
+    print(f"--- [TRACING] Métriques Prometheus sur http://0.0.0.0:{port}/metrics ---")
+    return server
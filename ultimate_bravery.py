@@ -0,0 +1,241 @@
+# Fichier : ultimate_bravery.py
+# Description : Générateur de défis Ultimate Bravery. Les listes de candidats (champions, sorts, bottes,
+# objets finaux, objets de départ par rôle) sont construites une fois par version de Data Dragon ; un défi
+# n'est ensuite qu'un tirage, reproductible à partir de sa graine.
+#
+#   python ultimate_bravery.py generate -n 10000 --seed 42 --out defis.jsonl [--role Jungle] [--exclude Garen Teemo]
+#   python ultimate_bravery.py bench [-n 20000]
+
+import argparse
+import json
+import random
+import re
+import sys
+import threading
+import time
+
+from ddragon_mirror import get_mirror
+from name_index import normalize_text
+
+ROLES = ("Top", "Jungle", "Mid", "ADC", "Support")
+# Formes courantes d'un rôle (texte libre, ex. argument choisi par le modèle), normalisées -> rôle de ROLES.
+ROLE_ALIASES = {
+    "toplane": "Top", "jungler": "Jungle", "jgl": "Jungle", "jg": "Jungle", "jungla": "Jungle",
+    "middle": "Mid", "midlane": "Mid", "bot": "ADC", "botlane": "ADC", "carry": "ADC", "marksman": "ADC", "tireur": "ADC",
+    "supp": "Support", "sup": "Support", "soutien": "Support",
+}
+SKILL_KEYS = ("A", "Z", "E")
+FINAL_ITEMS = 5
+MIN_FINAL_ITEM_GOLD = 1500
+MIN_BOOTS_GOLD = 300
+SUMMONERS_RIFT = "11"
+SMITE_ID = "SummonerSmite"
+# Objet de départ imposé par rôle (compagnon de jungle, objet de support) ; les autres rôles n'en ont pas.
+ROLE_STARTERS = {
+    "Jungle": lambda item: "Jungle" in item.get("tags", []),
+    "Support": lambda item: "GoldPer" in item.get("tags", []) and item["gold"]["total"] <= 500,
+}
+# Objets finaux réservés à un rôle (revenus de support, objets de jungle) : exclus du build des autres rôles.
+ROLE_ONLY_ITEM_TAGS = {"Support": "GoldPer", "Jungle": "Jungle"}
+DDRAGON_CDN = "https://ddragon.leagueoflegends.com/cdn"
+
+_PASSIVE_PATTERN = re.compile(r"<passive>(.*?)</passive>")
+
+
+def _on_rift(item):
+    return (
+        item["gold"]["purchasable"] and item.get("inStore", True) and not item.get("hideFromAll")
+        and not item.get("requiredChampion") and not item.get("requiredAlly")
+        and item.get("maps", {}).get(SUMMONERS_RIFT, True)
+    )
+
+
+def resolve_role(role):
+    """Rôle de ROLES correspondant à un texte libre (« jungle », « mid », « adc »…), ou None s'il n'est pas reconnu."""
+    key = normalize_text(role)
+    for canonical in ROLES:
+        if normalize_text(canonical) == key:
+            return canonical
+    return ROLE_ALIASES.get(key)
+
+
+def unique_passives(item):
+    """Passifs uniques d'un objet : deux objets qui en partagent un ne s'additionnent pas."""
+    return frozenset(normalize_text(name) for name in _PASSIVE_PATTERN.findall(item.get("description", "")) if name.strip())
+
+
+class BraveryPools:
+    """Candidats d'une version de Data Dragon, déjà filtrés et mis en forme (triés par identifiant : tirages reproductibles)."""
+
+    def __init__(self, version, champions, items, summoners):
+        self.version = version
+        base_img_url = f"{DDRAGON_CDN}/{version}/img"
+
+        def item_entry(item_id, item):
+            return {"id": item_id, "name": item["name"], "icon_url": f"{base_img_url}/item/{item['image']['full']}"}
+
+        self.champions = [
+            {"id": champion["id"], "name": champion["name"], "title": champion["title"],
+             "splash_url": f"{DDRAGON_CDN}/img/champion/splash/{champion['id']}_0.jpg",
+             "keys": {normalize_text(champion["id"]), normalize_text(champion["name"])}}
+            for _, champion in sorted(champions.items())
+        ]
+        self.summoner_spells = [
+            {"id": spell_id, "name": spell["name"], "icon_url": f"{base_img_url}/spell/{spell['image']['full']}"}
+            for spell_id, spell in sorted(summoners.items()) if "CLASSIC" in spell["modes"]
+        ]
+        self.smite = [spell for spell in self.summoner_spells if spell["id"] == SMITE_ID]
+        self.spells_without_smite = [spell for spell in self.summoner_spells if spell["id"] != SMITE_ID]
+        rift_items = sorted((item_id, item) for item_id, item in items.items() if _on_rift(item))
+        self.boots = [
+            item_entry(item_id, item) for item_id, item in rift_items
+            if "Boots" in item.get("tags", []) and item["gold"]["total"] > MIN_BOOTS_GOLD
+        ]
+        final_items = [
+            (item_id, item) for item_id, item in rift_items
+            if "into" not in item and item["gold"]["total"] > MIN_FINAL_ITEM_GOLD and "Boots" not in item.get("tags", [])
+        ]
+        self.final_items = [(item_entry(item_id, item), unique_passives(item)) for item_id, item in final_items]
+        # Par rôle : sans les objets réservés aux autres rôles.
+        self.role_final_items = {
+            role: [
+                (item_entry(item_id, item), unique_passives(item)) for item_id, item in final_items
+                if not any(tag in item.get("tags", []) for other, tag in ROLE_ONLY_ITEM_TAGS.items() if other != role)
+            ]
+            for role in ROLES
+        }
+        self.starters = {
+            role: [item_entry(item_id, item) for item_id, item in rift_items if accepts(item)]
+            for role, accepts in ROLE_STARTERS.items()
+        }
+
+    def champion_pool(self, exclude_champions=()):
+        excluded = {normalize_text(name) for name in exclude_champions or ()}
+        if not excluded:
+            return self.champions
+        return [champion for champion in self.champions if not champion["keys"] & excluded]
+
+
+def build_pools(version=None, mirror=None):
+    mirror = mirror or get_mirror()
+    version = version or mirror.latest_version()
+    return BraveryPools(
+        version,
+        mirror.get_data(version, "champion.json"),
+        mirror.get_data(version, "item.json"),
+        mirror.get_data(version, "summoner.json"),
+    )
+
+
+_pools_cache = {}
+_pools_lock = threading.Lock()
+
+
+def get_pools(version=None):
+    """Candidats de la version (la plus récente par défaut), construits une seule fois par processus."""
+    version = version or get_mirror().latest_version()
+    with _pools_lock:
+        if version not in _pools_cache:
+            _pools_cache[version] = build_pools(version)
+        return _pools_cache[version]
+
+
+def _sample_final_items(rng, final_items, count):
+    """Tire `count` objets sans passif unique en commun."""
+    taken, passives = [], set()
+    for position in rng.sample(range(len(final_items)), len(final_items)):
+        item, item_passives = final_items[position]
+        if item_passives & passives:
+            continue
+        taken.append(item)
+        passives |= item_passives
+        if len(taken) == count:
+            return taken
+    raise ValueError(f"Pas assez d'objets compatibles pour un build de {count} objets ({len(final_items)} candidats).")
+
+
+def generate(pools, seed, role=None, exclude_champions=(), role_items=True):
+    """Un défi 'ultimate_bravery', entièrement déterminé par la graine, les candidats et les contraintes."""
+    rng = random.Random(seed)
+    champions = pools.champion_pool(exclude_champions)
+    if not champions:
+        raise ValueError("Aucun champion disponible après les exclusions.")
+    champion = rng.choice(champions)
+    requested_role = role
+    role = resolve_role(role) if role else rng.choice(ROLES)
+    if role is None:
+        raise ValueError(f"Rôle inconnu : {requested_role} (attendu : {', '.join(ROLES)}).")
+    # Châtiment imposé en jungle et exclu des autres rôles.
+    if role_items and role == "Jungle":
+        others = pools.spells_without_smite
+        summoner_spells = pools.smite + rng.sample(others, 1) if pools.smite and others else None
+    else:
+        others = pools.spells_without_smite if role_items else pools.summoner_spells
+        summoner_spells = rng.sample(others, 2) if len(others) >= 2 else None
+    if summoner_spells is None:
+        raise ValueError("Pas assez de sorts d'invocateur disponibles.")
+    skill_order = rng.sample(SKILL_KEYS, len(SKILL_KEYS))
+    if not pools.boots:
+        raise ValueError("Aucune paire de bottes disponible.")
+    final_items = pools.role_final_items[role] if role_items else pools.final_items
+    final_build = [rng.choice(pools.boots)] + _sample_final_items(rng, final_items, FINAL_ITEMS)
+    starters = pools.starters.get(role, []) if role_items else []
+    starter = rng.choice(starters) if starters else None
+    return {
+        "type": "ultimate_bravery", "seed": seed, "version": pools.version,
+        "champion": {key: champion[key] for key in ("name", "title", "splash_url")},
+        "role": role, "skill_order": skill_order,
+        "summoner_spells": [{"name": spell["name"], "icon_url": spell["icon_url"]} for spell in summoner_spells],
+        "starting_item": {"name": starter["name"], "icon_url": starter["icon_url"]} if starter else None,
+        "final_build": [{"name": item["name"], "icon_url": item["icon_url"]} for item in final_build],
+    }
+
+
+def generate_many(pools, count, seed=0, **constraints):
+    """Défis `seed`, `seed + 1`, … : chacun se rejoue seul à partir de sa propre graine."""
+    for offset in range(count):
+        yield generate(pools, seed + offset, **constraints)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Défis Ultimate Bravery reproductibles, en lot.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    for name in ("generate", "bench"):
+        sub = subparsers.add_parser(name)
+        sub.add_argument("-n", "--count", type=int, default=1000 if name == "generate" else 20000)
+        sub.add_argument("--seed", type=int, default=0)
+        sub.add_argument("--version", help="Version de Data Dragon (la plus récente par défaut).")
+        sub.add_argument("--role", choices=ROLES)
+        sub.add_argument("--exclude", nargs="*", default=[], help="Champions exclus (nom ou identifiant).")
+        sub.add_argument("--no-role-items", action="store_true", help="Sans Châtiment ni objet de départ imposés par le rôle.")
+        if name == "generate":
+            sub.add_argument("--out", help="Fichier JSONL (sortie standard par défaut).")
+    args = parser.parse_args(argv)
+
+    started = time.perf_counter()
+    pools = build_pools(args.version)
+    pools_seconds = time.perf_counter() - started
+    constraints = {"role": args.role, "exclude_champions": args.exclude, "role_items": not args.no_role_items}
+    challenges = generate_many(pools, args.count, args.seed, **constraints)
+
+    started = time.perf_counter()
+    if args.command == "bench":
+        generated = sum(1 for _ in challenges)
+    else:
+        out = open(args.out, "w", encoding="utf-8") if args.out else sys.stdout
+        try:
+            generated = 0
+            for challenge in challenges:
+                out.write(json.dumps(challenge, ensure_ascii=False) + "\n")
+                generated += 1
+        finally:
+            if args.out:
+                out.close()
+    elapsed = time.perf_counter() - started
+    print(f"--- [BRAVERY] Candidats {pools.version} construits en {pools_seconds * 1000:.1f} ms ; "
+          f"{generated} défi(s) en {elapsed:.2f}s ({generated / elapsed if elapsed else 0:.0f} défis/s). ---", file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
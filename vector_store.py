@@ -0,0 +1,438 @@
+# Fichier : vector_store.py
+# Description : Stockage de l'index vectoriel sans pickle. Les vecteurs sont dans un index FAISS natif
+# (plat, HNSW ou IVF-PQ selon la taille du corpus) chargé en mémoire mappée : plusieurs processus partagent
+# les mêmes pages. Le texte des chunks est dans un docstore SQLite, lu seulement pour les k résultats.
+#
+#   FAISS_INDEX_TYPE=auto|flat|hnsw|ivfpq  FAISS_HNSW_EF_SEARCH=64  FAISS_IVF_NPROBE=16
+#
+# Benchmark (chargement, RSS, latence et rappel des recherches sur des chunks synthétiques) :
+#   python vector_store.py bench [--sizes 10000 100000 1000000] [--dim 768] [--types flat hnsw ivfpq]
+
+import argparse
+import json
+import math
+import os
+import pickle
+import shutil
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from collections.abc import Mapping
+
+import faiss
+import numpy as np
+from langchain_community.docstore.base import AddableMixin, Docstore
+from langchain_community.vectorstores import FAISS
+from langchain_core.documents import Document
+
+INDEX_FILE = "index.faiss"
+DOCSTORE_FILE = "docstore.sqlite"
+# Format précédent (FAISS.save_local) : index.faiss + docstore et positions picklés dans index.pkl.
+LEGACY_DOCSTORE_FILE = "index.pkl"
+# Chaque sauvegarde écrit ses fichiers dans un sous-dossier de version ; CURRENT (nom de ce sous-dossier)
+# est remplacé en un seul rename : un lecteur voit l'ancienne paire de fichiers ou la nouvelle, jamais un mélange.
+CURRENT_FILE = "CURRENT"
+VERSION_PREFIX = "v"
+INDEX_TYPES = ("flat", "hnsw", "ivfpq")
+FAISS_INDEX_TYPE = os.getenv("FAISS_INDEX_TYPE", "auto")
+# Seuils du choix automatique : recherche exacte tant qu'elle reste rapide, puis HNSW, puis IVF-PQ (compressé).
+FLAT_MAX_CHUNKS = 50_000
+HNSW_MAX_CHUNKS = 500_000
+HNSW_M = 32
+HNSW_EF_CONSTRUCTION = 80
+HNSW_EF_SEARCH = int(os.getenv("FAISS_HNSW_EF_SEARCH", "64"))
+IVF_NPROBE = int(os.getenv("FAISS_IVF_NPROBE", "16"))
+IVF_TRAINING_POINTS_PER_LIST = 64
+# Le PQ (256 centroïdes par sous-quantifieur) demande ~40 points par centroïde pour s'entraîner.
+IVFPQ_MIN_CHUNKS = 10_000
+
+
+def choose_index_type(count, requested=FAISS_INDEX_TYPE):
+    if requested != "auto":
+        if requested not in INDEX_TYPES:
+            raise ValueError(f"Type d'index FAISS inconnu : {requested} (attendu : auto, {', '.join(INDEX_TYPES)}).")
+        if requested == "ivfpq" and count < IVFPQ_MIN_CHUNKS:
+            print(f"--- [INDEX] IVF-PQ demandé pour {count} chunks seulement : index plat utilisé. ---")
+            return "flat"
+        return requested
+    if count <= FLAT_MAX_CHUNKS:
+        return "flat"
+    return "hnsw" if count <= HNSW_MAX_CHUNKS else "ivfpq"
+
+
+def _pq_subquantizers(dim):
+    """Nombre de sous-quantifieurs PQ : 4 à 8 dimensions chacun, diviseur de la dimension, au plus 96."""
+    for m in range(min(96, max(1, dim // 4)), 0, -1):
+        if dim % m == 0:
+            return m
+    return 1
+
+
+def make_index(index_type, vectors):
+    """Index FAISS du type demandé, entraîné si besoin et rempli avec `vectors` (dans l'ordre des positions)."""
+    vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+    count, dim = vectors.shape
+    if index_type == "flat":
+        index = faiss.IndexFlatL2(dim)
+    elif index_type == "hnsw":
+        index = faiss.IndexHNSWFlat(dim, HNSW_M)
+        index.hnsw.efConstruction = HNSW_EF_CONSTRUCTION
+    elif index_type == "ivfpq":
+        nlist = max(1, min(int(4 * math.sqrt(count)), count // IVF_TRAINING_POINTS_PER_LIST or 1))
+        index = faiss.index_factory(dim, f"IVF{nlist},PQ{_pq_subquantizers(dim)}x8")
+        sample_size = min(count, max(nlist * IVF_TRAINING_POINTS_PER_LIST, IVFPQ_MIN_CHUNKS))
+        sample = vectors[np.random.default_rng(0).choice(count, sample_size, replace=False)] if sample_size < count else vectors
+        index.train(sample)
+    else:
+        raise ValueError(f"Type d'index FAISS inconnu : {index_type}")
+    index.add(vectors)
+    return index
+
+
+def configure_search(index):
+    """Paramètres de recherche (non sauvegardés dans le fichier) ; MMR a besoin de reconstruire les vecteurs."""
+    if isinstance(index, faiss.IndexHNSW):
+        index.hnsw.efSearch = HNSW_EF_SEARCH
+    elif isinstance(index, faiss.IndexIVF):
+        index.nprobe = IVF_NPROBE
+        index.make_direct_map()
+    return index
+
+
+class SQLiteDocstore(Docstore, AddableMixin):
+    """Docstore LangChain sur SQLite : chunks (texte, métadonnées) et correspondance position FAISS -> identifiant."""
+
+    def __init__(self, path, read_only=False):
+        self.path = path
+        self._lock = threading.Lock()
+        if read_only:
+            self._conn = sqlite3.connect(f"file:{path}?mode=ro", uri=True, check_same_thread=False)
+        else:
+            self._conn = sqlite3.connect(path, check_same_thread=False, timeout=10)
+            self._conn.executescript(
+                "CREATE TABLE IF NOT EXISTS chunks (id TEXT PRIMARY KEY, text TEXT NOT NULL, metadata TEXT NOT NULL);"
+                "CREATE TABLE IF NOT EXISTS positions (position INTEGER PRIMARY KEY, id TEXT NOT NULL);"
+            )
+            self._conn.commit()
+
+    @staticmethod
+    def _document(doc_id, text, metadata):
+        return Document(id=doc_id, page_content=text, metadata=json.loads(metadata))
+
+    def search(self, search):
+        with self._lock:
+            row = self._conn.execute("SELECT id, text, metadata FROM chunks WHERE id = ?", (search,)).fetchone()
+        # Même convention que InMemoryDocstore : un texte d'erreur plutôt qu'une exception.
+        return self._document(*row) if row is not None else f"ID {search} not found."
+
+    def add(self, texts):
+        rows = [(doc_id, doc.page_content, json.dumps(doc.metadata, ensure_ascii=False, default=str)) for doc_id, doc in texts.items()]
+        with self._lock:
+            self._conn.executemany("INSERT OR REPLACE INTO chunks (id, text, metadata) VALUES (?, ?, ?)", rows)
+            self._conn.commit()
+
+    def delete(self, ids):
+        with self._lock:
+            self._conn.executemany("DELETE FROM chunks WHERE id = ?", [(doc_id,) for doc_id in ids])
+            self._conn.commit()
+
+    def position_id(self, position):
+        with self._lock:
+            row = self._conn.execute("SELECT id FROM positions WHERE position = ?", (int(position),)).fetchone()
+        if row is None:
+            raise KeyError(position)
+        return row[0]
+
+    def read_positions(self):
+        with self._lock:
+            return dict(self._conn.execute("SELECT position, id FROM positions ORDER BY position"))
+
+    def write_positions(self, index_to_docstore_id):
+        with self._lock:
+            self._conn.execute("DELETE FROM positions")
+            self._conn.executemany("INSERT INTO positions (position, id) VALUES (?, ?)", ((int(i), doc_id) for i, doc_id in index_to_docstore_id.items()))
+            self._conn.commit()
+
+    def count(self):
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM positions").fetchone()[0]
+
+    def documents_in_order(self):
+        """Tous les chunks dans l'ordre de l'index, en une requête (pour BM25)."""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT c.id, c.text, c.metadata FROM positions p JOIN chunks c ON c.id = p.id ORDER BY p.position"
+            ).fetchall()
+        return [self._document(*row) for row in rows]
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+class SQLitePositionMap(Mapping):
+    """`index_to_docstore_id` paresseux : seules les positions des résultats sont lues, rien n'est chargé d'avance."""
+
+    def __init__(self, docstore):
+        self.docstore = docstore
+        self._length = docstore.count()
+
+    def __getitem__(self, position):
+        return self.docstore.position_id(position)
+
+    def __len__(self):
+        return self._length
+
+    def __iter__(self):
+        return iter(self.docstore.read_positions())
+
+    def values(self):
+        return self.docstore.read_positions().values()
+
+    def items(self):
+        return self.docstore.read_positions().items()
+
+
+def _exact_vectors(index):
+    """Vecteurs d'origine si l'index les garde tels quels (plat, HNSW) ; None pour IVF-PQ (compressé)."""
+    if index.ntotal == 0:
+        return np.zeros((0, index.d), dtype=np.float32)
+    if isinstance(index, (faiss.IndexFlat, faiss.IndexHNSWFlat)):
+        return index.reconstruct_n(0, index.ntotal)
+    return None
+
+
+def current_files_path(index_path):
+    """Dossier des fichiers de la version courante de l'index (l'index lui-même pour un index antérieur aux versions)."""
+    try:
+        with open(os.path.join(index_path, CURRENT_FILE), encoding="utf-8") as f:
+            return os.path.join(index_path, f.read().strip())
+    except FileNotFoundError:
+        return index_path
+
+
+def load_vector_store(index_path, embeddings, mmap=True):
+    """Index prêt pour la recherche : FAISS en mémoire mappée, docstore SQLite en lecture seule, positions paresseuses."""
+    # MMAP_IFC : vecteurs (plat, HNSW) et listes inversées (IVF) lus directement dans le fichier mappé.
+    flags = faiss.IO_FLAG_MMAP_IFC | faiss.IO_FLAG_READ_ONLY if mmap else 0
+    for attempt in range(3):
+        # L'index et le docstore sont lus dans le même dossier de version, résolu une seule fois.
+        files_path = current_files_path(index_path)
+        try:
+            index = configure_search(faiss.read_index(os.path.join(files_path, INDEX_FILE), flags))
+            docstore = SQLiteDocstore(os.path.join(files_path, DOCSTORE_FILE), read_only=True)
+            return FAISS(embeddings, index, docstore, SQLitePositionMap(docstore))
+        except (RuntimeError, sqlite3.OperationalError):
+            # Version supprimée entre la lecture de CURRENT et l'ouverture (deux sauvegardes rapprochées) : on relit CURRENT.
+            if attempt == 2 or files_path == current_files_path(index_path):
+                raise
+
+
+def new_working_copy(embeddings, dim, work_path):
+    """Index de travail vide (plat, en mémoire) avec son docstore SQLite dans `work_path` : les chunks ne restent pas en RAM."""
+    shutil.rmtree(work_path, ignore_errors=True)
+    os.makedirs(work_path)
+    return FAISS(embeddings, faiss.IndexFlatL2(dim), SQLiteDocstore(os.path.join(work_path, DOCSTORE_FILE)), {})
+
+
+def load_working_copy(index_path, embeddings, work_path):
+    """
+    Copie modifiable de l'index pour une mise à jour incrémentale (dans `work_path`) : index plat en mémoire
+    et copie du docstore. Les vecteurs d'un index IVF-PQ sont ré-embeddés (depuis le cache d'embeddings).
+    """
+    shutil.rmtree(work_path, ignore_errors=True)
+    os.makedirs(work_path)
+    files_path = current_files_path(index_path)
+    shutil.copyfile(os.path.join(files_path, DOCSTORE_FILE), os.path.join(work_path, DOCSTORE_FILE))
+    docstore = SQLiteDocstore(os.path.join(work_path, DOCSTORE_FILE))
+    index_to_docstore_id = docstore.read_positions()
+    stored = faiss.read_index(os.path.join(files_path, INDEX_FILE))
+    vectors = _exact_vectors(stored)
+    if vectors is None:
+        texts = [doc.page_content for doc in docstore.documents_in_order()]
+        vectors = np.array(embeddings.embed_documents(texts), dtype=np.float32)
+    return FAISS(embeddings, make_index("flat", vectors), docstore, index_to_docstore_id)
+
+
+def save_vector_store(db, index_path, work_path=None, index_type=FAISS_INDEX_TYPE):
+    """
+    Écrit l'index (du type choisi selon sa taille) et le docstore dans `work_path`, qui devient un nouveau dossier
+    de version de `index_path`, puis bascule CURRENT vers ce dossier en un seul rename : un lecteur ne voit jamais
+    un index à moitié écrit ni un docstore d'une autre version que l'index. Retourne le type d'index utilisé.
+    """
+    work_path = work_path or f"{index_path}.tmp"
+    os.makedirs(work_path, exist_ok=True)
+    docstore_path = os.path.join(work_path, DOCSTORE_FILE)
+    docstore = db.docstore
+    if not (isinstance(docstore, SQLiteDocstore) and os.path.abspath(docstore.path) == os.path.abspath(docstore_path)):
+        # Index construit en mémoire (FAISS.from_documents) : on crée le docstore SQLite à partir de ses chunks.
+        if os.path.exists(docstore_path):
+            os.remove(docstore_path)
+        docstore = SQLiteDocstore(docstore_path)
+        docstore.add({doc_id: db.docstore.search(doc_id) for doc_id in db.index_to_docstore_id.values()})
+    docstore.write_positions(db.index_to_docstore_id)
+    docstore.close()
+
+    vectors = _exact_vectors(db.index)
+    if vectors is None:
+        raise ValueError("L'index à sauvegarder doit être un index de travail plat (ou HNSW).")
+    chosen = choose_index_type(len(vectors), index_type)
+    faiss.write_index(make_index(chosen, vectors), os.path.join(work_path, INDEX_FILE))
+    os.makedirs(index_path, exist_ok=True)
+    previous = os.path.basename(current_files_path(index_path))
+    version = f"{VERSION_PREFIX}{time.time_ns()}"
+    os.replace(work_path, os.path.join(index_path, version))
+    pointer_path = os.path.join(index_path, f"{CURRENT_FILE}.tmp.{os.getpid()}.{threading.get_ident()}")
+    with open(pointer_path, "w", encoding="utf-8") as f:
+        f.write(version)
+    os.replace(pointer_path, os.path.join(index_path, CURRENT_FILE))
+    _remove_old_versions(index_path, keep=(version, previous))
+    return chosen
+
+
+def _remove_old_versions(index_path, keep):
+    """
+    Supprime les versions plus anciennes que la précédente : celle-ci reste, pour un lecteur qui vient de lire
+    CURRENT sans avoir encore ouvert ses fichiers. Les fichiers du format sans versions (et l'ancien docstore
+    picklé) ne servent plus une fois une version écrite.
+    """
+    for name in os.listdir(index_path):
+        if name.startswith(VERSION_PREFIX) and name not in keep and os.path.isdir(os.path.join(index_path, name)):
+            shutil.rmtree(os.path.join(index_path, name), ignore_errors=True)
+    for file_name in (INDEX_FILE, DOCSTORE_FILE, LEGACY_DOCSTORE_FILE):
+        if os.path.exists(os.path.join(index_path, file_name)):
+            os.remove(os.path.join(index_path, file_name))
+
+
+def legacy_index_state(index_path):
+    """
+    État d'un index au format précédent : "migratable" (index.faiss + index.pkl, convertible sans ré-embedding),
+    "rebuild" (index.pkl seul : les vecteurs manquent, il faut reconstruire) ou None (rien d'ancien à traiter).
+    """
+    if not os.path.exists(os.path.join(index_path, LEGACY_DOCSTORE_FILE)) or os.path.exists(os.path.join(current_files_path(index_path), DOCSTORE_FILE)):
+        return None
+    return "migratable" if os.path.exists(os.path.join(index_path, INDEX_FILE)) else "rebuild"
+
+
+def migrate_legacy_index(index_path):
+    """Convertit une seule fois un index save_local au nouveau format (mêmes vecteurs, docstore SQLite) ; retourne True si converti."""
+    if legacy_index_state(index_path) != "migratable":
+        return False
+    # Fichier écrit par l'application elle-même (ancien FAISS.save_local) : le dépickler est sûr ici.
+    with open(os.path.join(index_path, LEGACY_DOCSTORE_FILE), "rb") as f:
+        docstore, index_to_docstore_id = pickle.load(f)
+    db = FAISS(None, faiss.read_index(os.path.join(index_path, INDEX_FILE)), docstore, index_to_docstore_id)
+    index_type = save_vector_store(db, index_path)
+    print(f"--- [VECTOR_STORE] Index au format précédent converti : {index_type}, {len(index_to_docstore_id)} chunks. ---")
+    return True
+
+
+# ───── BENCHMARK ─────
+def rss_kib():
+    """(RSS privé, RSS adossé à des fichiers — pages mappées, partageables entre processus) en Kio."""
+    values = {}
+    with open("/proc/self/status") as f:
+        for line in f:
+            key, _, value = line.partition(":")
+            if key in ("RssAnon", "RssFile"):
+                values[key] = int(value.split()[0])
+    return values.get("RssAnon", 0), values.get("RssFile", 0)
+
+
+def synthetic_vectors(count, dim, seed=0, latent_dim=24):
+    """Vecteurs normalisés de faible dimension intrinsèque, comme des embeddings de texte (même projection pour toutes les graines)."""
+    projection = np.random.default_rng(12345).standard_normal((latent_dim, dim)).astype(np.float32)
+    rng = np.random.default_rng(seed)
+    vectors = rng.standard_normal((count, latent_dim)).astype(np.float32) @ projection
+    vectors += 0.1 * rng.standard_normal((count, dim)).astype(np.float32)
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+def build_synthetic_store(index_path, count, dim, index_type):
+    vectors = synthetic_vectors(count, dim)
+    work_path = f"{index_path}.tmp"
+    os.makedirs(work_path, exist_ok=True)
+    docstore = SQLiteDocstore(os.path.join(work_path, DOCSTORE_FILE))
+    batch = 50_000
+    for start in range(0, count, batch):
+        docstore.add({f"chunk-{i}": Document(page_content=f"Chunk synthétique numéro {i}. " * 20, metadata={"source": f"doc-{i // 50}.txt"})
+                      for i in range(start, min(count, start + batch))})
+    db = FAISS(None, make_index("flat", vectors), docstore, {i: f"chunk-{i}" for i in range(count)})
+    started = time.perf_counter()
+    save_vector_store(db, index_path, work_path, index_type)
+    return time.perf_counter() - started
+
+
+def probe(index_path, dim, queries, k, mmap):
+    """Mesuré dans un processus neuf : chargement, RSS, latence de recherche (vecteur + texte des k chunks), rappel."""
+    private_before, shared_before = rss_kib()
+    started = time.perf_counter()
+    db = load_vector_store(index_path, embeddings=None, mmap=mmap)
+    load_seconds = time.perf_counter() - started
+    query_vectors = synthetic_vectors(queries, dim, seed=1)
+    latencies, hits = [], []
+    for vector in query_vectors:
+        started = time.perf_counter()
+        results = db.similarity_search_with_score_by_vector(vector.tolist(), k=k)
+        latencies.append(time.perf_counter() - started)
+        hits.append([doc.id for doc, _ in results])
+    private, shared = rss_kib()
+    latencies.sort()
+    return {
+        "load_ms": load_seconds * 1000, "rss_private_mib": (private - private_before) / 1024, "rss_shared_mib": (shared - shared_before) / 1024,
+        "p50_ms": latencies[len(latencies) // 2] * 1000, "p95_ms": latencies[int(0.95 * (len(latencies) - 1))] * 1000,
+        "hits": hits,
+    }
+
+
+def _probe_in_subprocess(index_path, dim, queries, k, mmap):
+    command = [sys.executable, os.path.abspath(__file__), "_probe", index_path, str(dim), str(queries), str(k), "1" if mmap else "0"]
+    return json.loads(subprocess.run(command, check=True, capture_output=True, text=True).stdout.strip().splitlines()[-1])
+
+
+def bench(sizes, dim, index_types, queries=200, k=5):
+    rows = []
+    with tempfile.TemporaryDirectory() as workdir:
+        for count in sizes:
+            exact_hits = None
+            for index_type in ("flat", *[t for t in index_types if t != "flat"]):
+                index_path = os.path.join(workdir, f"{index_type}-{count}")
+                build_seconds = build_synthetic_store(index_path, count, dim, index_type)
+                result = _probe_in_subprocess(index_path, dim, queries, k, mmap=True)
+                if index_type == "flat":
+                    exact_hits = result["hits"]
+                recall = sum(len(set(found) & set(exact)) for found, exact in zip(result["hits"], exact_hits)) / (k * len(exact_hits))
+                size_mib = sum(os.path.getsize(os.path.join(current_files_path(index_path), name)) for name in (INDEX_FILE, DOCSTORE_FILE)) / (1 << 20)
+                if index_type in index_types:
+                    rows.append({"chunks": count, "type": index_type, "build_s": build_seconds, "disk_mib": size_mib, "recall": recall,
+                                 **{key: value for key, value in result.items() if key != "hits"}})
+                shutil.rmtree(index_path, ignore_errors=True)
+    return rows
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    if argv[:1] == ["_probe"]:
+        index_path, dim, queries, k, mmap = argv[1:6]
+        print(json.dumps(probe(index_path, int(dim), int(queries), int(k), mmap == "1")))
+        return 0
+    parser = argparse.ArgumentParser(description="Benchmark des types d'index FAISS (chargement, RSS, latence, rappel).")
+    parser.add_argument("command", choices=["bench"])
+    parser.add_argument("--sizes", nargs="+", type=int, default=[10_000, 100_000])
+    parser.add_argument("--dim", type=int, default=768, help="768 : dimension de models/embedding-001.")
+    parser.add_argument("--types", nargs="+", choices=INDEX_TYPES, default=list(INDEX_TYPES))
+    parser.add_argument("--queries", type=int, default=200)
+    args = parser.parse_args(argv)
+    print(f"{'chunks':>9} {'type':<6} {'constr. (s)':>11} {'disque (Mio)':>12} {'chargement (ms)':>15} "
+          f"{'RSS privé':>9} {'RSS mappé':>9} {'p50 (ms)':>8} {'p95 (ms)':>8} {'rappel@5':>8}")
+    for row in bench(args.sizes, args.dim, args.types, queries=args.queries):
+        print(f"{row['chunks']:>9} {row['type']:<6} {row['build_s']:>11.1f} {row['disk_mib']:>12.1f} {row['load_ms']:>15.1f} "
+              f"{row['rss_private_mib']:>9.1f} {row['rss_shared_mib']:>9.1f} {row['p50_ms']:>8.2f} {row['p95_ms']:>8.2f} {row['recall']:>8.2f}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())